@@ -1,10 +1,59 @@
-import streamlit as st
-import pandas as pd
+import time
+
+_script_start = time.perf_counter()
+
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
+import streamlit as st
+
+from timing import process_uptime, record, timed
+
+# Plotly is imported on first use, inside the tabs that need it
+with timed("import app modules"):
+    from cache import cached, cached_figure
+    from charts import COMBINED_SCENARIO_COLORS, build_consensus_heatmap, radar_template
+    from comparison import comparison_slider
+    from consensus import consensus_aggregator, findings as consensus_findings
+    from config import (
+        CATEGORICAL_LABELS, FEEDBACK_ARCHIVE_INTERVAL, FEEDBACK_FIELDS, FEEDBACK_TEXT_MAX_CHARS, INTERVENTIONS,
+        METRIC_DISPLAY_CONFIG
+    )
+    from feedback_archive import start_compaction
+    from feedback_store import FeedbackError, FeedbackQueueFull, feedback_row, feedback_store
+    from image_manifest import image_manifest
+    from lookup_tables import LEVEL_TABLES
+    from scenarios import COMBINED_SCENARIOS
+    from pareto import intervention_frontier, combined_frontier
+    from progressive import progressive_image
+    from uncertainty import simulate
+
+# Fail fast if the image manifest is inconsistent or an image is missing; loads every image once per process
+with timed("load image manifest"):
+    image_manifest()
+
+# Keep the archive read by the Consensus Dashboard's filters up to date, in a thread of this process
+start_compaction()
+
 
-from config import CATEGORICAL_LABELS, INTERVENTIONS, METRIC_DISPLAY_CONFIG, SIMPLIFIED_CALCULATORS
+def keep_widget_state(prefix):
+    """
+    Keep the values of keyed widgets that are not rendered in this run
+
+    Streamlit clears the state of widgets missing from a run, so without this the
+    controls of a hidden (lazily rendered) tab would reset when switching back to it.
+    """
+    for key in list(st.session_state.keys()):
+        if key.startswith(prefix):
+            st.session_state[key] = st.session_state[key]
+
+
+def radar_chart(categories, values, **template_options):
+    """
+    Show a radar chart, sending the spec of its template with only the values replaced
+
+    The layout and baseline trace are built once per process (charts.radar_template).
+    """
+    template = radar_template(categories, **template_options)
+    st.plotly_chart(template.chart_spec(r=list(values)), width="stretch")
 
 # Setup page
 st.set_page_config(page_title="Pop-up Interventions Tool", page_icon="🏙️", layout="wide")
@@ -24,20 +73,27 @@ st.markdown("Explore the impacts and trade-offs of different transformations")
 st.markdown("We value all kinds of feedbacks!")
 st.markdown("---")
 
-tab1, tab2, tab3 = st.tabs(["Analysis", "Feedback", "Consensus Dashboard"])
 
-with tab1:
+@st.fragment
+def analysis_panel():
+    """
+    Intervention controls and impact metrics
+
+    Runs as a fragment: moving a control reruns only this panel and the image
+    comparison and trade-offs fragments nested in it, not the other tabs.
+    """
     left_col, right_col = st.columns([1, 2])
 
     with left_col:
         st.subheader("Intervention Controls")
-        
+
         # Add basic intervention selector
         selected_intervention = st.selectbox(
             "Select Intervention",
-            list(INTERVENTIONS.keys())
+            list(INTERVENTIONS.keys()),
+            key="analysis_intervention"
         )
-        
+
         # Add parameter controls section
         st.subheader("Adjust Parameters")
 
@@ -64,49 +120,45 @@ with tab1:
                 param_info['max'],
                 param_info['default'],
                 format="%d",
-                help=param_info['description']
+                help=param_info['description'],
+                key=f"analysis_{param_key}"
             )
-            
+
             # Display the selected label
             st.caption(f"Selected: {CATEGORICAL_LABELS[param_value]}")
-            
+
             # Store the parameter value
             params_values[param_key] = param_value
 
         # Display impact metrics based on intervention type
         st.subheader("Impact Metrics")
 
-        # Call the appropriate simplified calculation function based on the selected intervention
-        metric_calculator = SIMPLIFIED_CALCULATORS[selected_intervention]
-        
-        # Prepare the arguments for the calculation function
-        if selected_intervention == "Pop-up Market":
-            results = metric_calculator(
-                params_values.get("seating_level", 0),
-                params_values.get("plaza_level", 0)
-            )
-        else:  # Pop-up Art Installation
-            results = metric_calculator(
-                params_values.get("bike_lane_level", 0),
-                params_values.get("bike_parking_level", 0),
-                params_values.get("bike_share_level", 0)
+        # Look up the precomputed results for the selected levels (missing levels default to 0)
+        results = LEVEL_TABLES[selected_intervention].lookup_params(params_values)
+
+        # Optional Monte Carlo uncertainty band
+        uncertainty = None
+        if st.checkbox("Show uncertainty range (P5-P95)", help="100,000 samples with +/-20% uncertainty on every coefficient", key="analysis_uncertainty"):
+            uncertainty = cached(
+                "uncertainty", selected_intervention, params_values,
+                lambda: simulate(selected_intervention, params_values, seed=0)
             )
-        
+
         # Get the display configuration for the selected intervention
         display_config = METRIC_DISPLAY_CONFIG[selected_intervention]
         metrics_to_show = display_config["metrics_to_show"]
-        
+
         # Create two columns for metrics display
         col1, col2 = st.columns(2)
-        
+
         # Distribute metrics across the columns
         half_metrics = len(metrics_to_show) // 2 + (len(metrics_to_show) % 2)
-        
+
         with col1:
             for i in range(half_metrics):
                 if i < len(metrics_to_show):
                     metric_key, format_str, display_name = metrics_to_show[i]
-                    
+
                     # Handle different result structures
                     if selected_intervention == "Pop-up Market":
                         value = results["metrics"][metric_key]
@@ -114,18 +166,21 @@ with tab1:
                     else:  # Pop-up Art Installation
                         value = results[metric_key]
                         delta = None  # No deltas for mobility metrics
-                    
+
                     st.metric(
                         display_name,
                         format_str.format(value),
                         delta
                     )
-        
+
+                    if uncertainty is not None:
+                        uncertainty_caption(selected_intervention, uncertainty, metric_key, format_str)
+
         with col2:
             for i in range(half_metrics, len(metrics_to_show)):
                 if i < len(metrics_to_show):
                     metric_key, format_str, display_name = metrics_to_show[i]
-                    
+
                     # Handle different result structures
                     if selected_intervention == "Pop-up Market":
                         value = results["metrics"][metric_key]
@@ -133,428 +188,573 @@ with tab1:
                     else:  # Pop-up Art Installation
                         value = results[metric_key]
                         delta = None  # No deltas for mobility metrics
-                    
+
                     st.metric(
                         display_name,
                         format_str.format(value),
                         delta
                     )
 
+                    if uncertainty is not None:
+                        uncertainty_caption(selected_intervention, uncertainty, metric_key, format_str)
+
     with right_col:
         st.header(selected_intervention)
         st.markdown(INTERVENTIONS[selected_intervention]["description"])
-        
+
         # Add basic tabs
         viz_tab1, viz_tab2 = st.tabs(["Impact Analysis", "Trade-offs"])
-        
+
         with viz_tab1:
-            st.subheader("Impact Analysis")
-            
-            # Create columns for before/after images
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.subheader("Current State")
-                
-                if selected_intervention == "Pop-up Art Installation":
-                    st.image("./assets/ppa-now.png", caption="Current State")
-                
-                else:  # Pop-up Market
-                    seating_level = params_values.get("seating_level", 0)
-                    plaza_level = params_values.get("plaza_level", 0)
-                    st.image("./assets/ppm-now.png", caption="Current State")
-            
-            with col2:
-                st.subheader(f"Transformation")
-                
-                # Display appropriate "after" image based on selected intervention and parameters
-                if selected_intervention == "Pop-up Art Installation":
-                    bike_lane_level = params_values.get("bike_lane_level", 0)
-                    bike_share_level = params_values.get("bike_share_level", 0)
-
-                    if bike_lane_level == 0:
-                        st.image("./assets/ppa-now.png", caption="No Art Installation Added")
-                    elif bike_lane_level == 1:
-                        st.image("./assets/ppa-after.png", caption="No Art Installation, Minimal Bike-sharing")
-                    elif bike_lane_level == 2:
-                        st.image("./assets/ppa-after2.png", caption="Minimal Art Installation with Bike-sharing Features")
-    
-                
-                else:  # Pop-up Market
-                    seating_level = params_values.get("seating_level", 0)
-                    plaza_level = params_values.get("plaza_level", 0)
-
-                    if seating_level == 0:
-                        st.image("./assets/ppm-now.png", caption="No Market Setup")
-                    elif seating_level == 1:
-                        st.image("./assets/ppm-after2.png", caption="Minimal Market Added")
-                    elif seating_level == 2:
-                        st.image("./assets/ppm-after.png", caption="Extensive Market Added")
-        
+            image_comparison(selected_intervention, params_values)
+
         with viz_tab2:
-            st.subheader("Trade-offs")
-            st.subheader("Conflicts & Considerations")
-
-            if selected_intervention == "Pop-up Market":
-                considerations = [
-                    "Maintenance costs for market facilities and plazas need to be factored into long-term budgets",
-                    "Potential concerns about crowd management during peak market hours",
-                    "Weather protection is critical for year-round market operation",
-                ]
-            else:  # Pop-up Art Installation
-                considerations = [
-                    "Art installations may temporarily reduce available space for pedestrians",
-                    "Weather considerations may affect durability of outdoor installations",
-                    "Initial installation costs are high but can attract significant foot traffic",
-                ]
-            for consideration in considerations:
-                st.markdown(f"* {consideration}")
-            
-            st.subheader("Recommendations")
-
-            if selected_intervention == "Pop-up Market":
-                recommendations = [
-                    "Position market stalls to maintain adequate walking paths",
-                    "Incorporate weather protection for year-round usability",
-                    "Include a variety of market sections to accommodate different vendors",
-                    "Establish a maintenance plan and budget for long-term sustainability"
-                ]
-            else:  # Pop-up Art Installation
-                recommendations = [
-                    "Implement interactive art pieces where possible to maximize engagement",
-                    "Position installations near transit nodes and major gathering points",
-                    "Balance art placement with business visibility for mutual benefits"
-                ]
-            
-            for recommendation in recommendations:
-                st.markdown(f"🔹 {recommendation}")
-
-            st.subheader('Combined Implementation Approach')
-            st.write('Synergies & Opportunities:')
-            st.write('Community Hubs: Placing art installations near markets creates natural gathering points.')
-            st.write('Experience Points: Strategically placed art along market routes provides cultural touchpoints.')
-            st.write('Shared Maintenance: Combined implementations can share maintenance resources and costs.')
-            st.write('Complete Streets: Integrating both interventions supports "complete streets" principles.')
-            st.write('Funding Opportunities: Combined projects may qualify for more diverse funding sources.')
-            
-            if selected_intervention == "Pop-up Market":
-                # Get trade-offs data from results
-                tradeoffs = results["tradeoffs"]
-                
-                # Add a radar chart
-                categories = list(tradeoffs.keys())
-                values = list(tradeoffs.values())
-                
-                fig_radar = go.Figure()
-                
-                # Add trace for current values
-                fig_radar.add_trace(go.Scatterpolar(
-                    r=values,
-                    theta=categories,
-                    fill='toself',
-                    name='Current Selection',
-                    line=dict(color='rgba(31, 119, 180, 0.8)'),
-                    fillcolor='rgba(31, 119, 180, 0.3)'
-                ))
-                
-                # Add trace for baseline (50% on all metrics)
-                fig_radar.add_trace(go.Scatterpolar(
-                    r=[50, 50, 50, 50, 50],
-                    theta=categories,
-                    fill='toself',
-                    name='Baseline',
-                    line=dict(color='rgba(100, 100, 100, 0.3)'),
-                    fillcolor='rgba(100, 100, 100, 0.1)'
-                ))
-                
-                # Update radar layout
-                fig_radar.update_layout(
-                    polar=dict(
-                        radialaxis=dict(
-                            visible=True,
-                            range=[0, 100]
-                        )
-                    ),
-                    showlegend=True,
-                    height=450,
-                    margin=dict(l=80, r=80, t=40, b=40)
-                )
-                
-                st.plotly_chart(fig_radar, use_container_width=True)
-                
-            else:  # Pop-up Art Installation
-                # For Art Installation, create a visualization of key metrics
-                categories = ['pedestrian_safety', 'traffic_flow', 'business_access', 'cost_efficiency', 'community_support']
-                values = [results[category] for category in categories]
-                
-                # Format category names for display
-                display_categories = [cat.replace('_', ' ').title() for cat in categories]
-                
-                # Create radar chart for Art Installation metrics
-                fig_radar = go.Figure()
-                
-                # Add trace for current values
-                fig_radar.add_trace(go.Scatterpolar(
-                    r=values,
-                    theta=display_categories,
-                    fill='toself',
-                    name='Current Selection',
-                    line=dict(color='rgba(31, 119, 180, 0.8)'),
-                    fillcolor='rgba(31, 119, 180, 0.3)'
-                ))
-                
-                # Add trace for baseline (50% on all metrics)
-                fig_radar.add_trace(go.Scatterpolar(
-                    r=[50, 50, 50, 50, 50],
-                    theta=display_categories,
-                    fill='toself',
-                    name='Baseline',
-                    line=dict(color='rgba(100, 100, 100, 0.3)'),
-                    fillcolor='rgba(100, 100, 100, 0.1)'
-                ))
-                
-                # Update radar layout
-                fig_radar.update_layout(
-                    polar=dict(
-                        radialaxis=dict(
-                            visible=True,
-                            range=[0, 100]
-                        )
-                    ),
-                    showlegend=True,
-                    height=450,
-                    margin=dict(l=80, r=80, t=40, b=40)
-                )
-                
-                st.plotly_chart(fig_radar, use_container_width=True)
+            tradeoffs_panel(selected_intervention, params_values, results)
 
-with tab2:
+
+def uncertainty_caption(intervention, uncertainty, metric_key, format_str):
+    """
+    Show the P5-P95 range of a displayed metric
+
+    The text metrics of the Pop-up Art Installation show the range of the numeric output
+    they label (METRIC_DISPLAY_CONFIG "uncertainty_outputs").
+    """
+    if intervention == "Pop-up Market":
+        band = uncertainty["metrics"][metric_key]
+        label = "P5-P95"
+    else:
+        output, format_str = METRIC_DISPLAY_CONFIG[intervention]["uncertainty_outputs"][metric_key]
+        band = uncertainty[output]
+        label = f"{output.replace('_', ' ').capitalize()} P5-P95"
+    st.caption(f"{label}: {format_str.format(band['P5'])} - {format_str.format(band['P95'])}")
+
+
+@st.fragment
+def image_comparison(selected_intervention, params_values):
+    """Before/after images for the selected levels, side by side or as a comparison slider"""
+    st.subheader("Impact Analysis")
+
+    images = image_manifest()
+    current = images.current(selected_intervention)
+    transformation = images.transformation(selected_intervention, params_values)
+
+    comparison_mode = st.radio(
+        "View", ["Side by side", "Comparison slider"], horizontal=True, key="analysis_comparison_mode",
+        help="The comparison slider shows the transformation over the current state; drag to compare"
+    )
+    if comparison_mode == "Comparison slider":
+        comparison_slider(images, current, transformation, key="analysis_comparison_slider")
+        st.caption(f"Left of the divider: {transformation.caption}. Right: {current.caption}")
+        return
+
+    # Create columns for before/after images
+    col1, col2 = st.columns(2)
+
+    # Images load progressively; the transformations one level step away are prefetched
+    with col1:
+        st.subheader("Current State")
+        progressive_image(images, current, key="analysis_current_image")
+        st.caption(current.caption)
+
+    with col2:
+        st.subheader("Transformation")
+        progressive_image(
+            images, transformation, key="analysis_transformation_image",
+            prefetch=images.neighbours(selected_intervention, params_values)
+        )
+        st.caption(transformation.caption)
+
+
+@st.fragment
+def tradeoffs_panel(selected_intervention, params_values, results):
+    """
+    Trade-offs radar, Pareto check and combined scenario
+
+    The combined-scenario sliders rerun only this fragment.
+    """
+    st.subheader("Trade-offs")
+    st.subheader("Conflicts & Considerations")
+
+    if selected_intervention == "Pop-up Market":
+        considerations = [
+            "Maintenance costs for market facilities and plazas need to be factored into long-term budgets",
+            "Potential concerns about crowd management during peak market hours",
+            "Weather protection is critical for year-round market operation",
+        ]
+    else:  # Pop-up Art Installation
+        considerations = [
+            "Art installations may temporarily reduce available space for pedestrians",
+            "Weather considerations may affect durability of outdoor installations",
+            "Initial installation costs are high but can attract significant foot traffic",
+        ]
+    for consideration in considerations:
+        st.markdown(f"* {consideration}")
+
+    st.subheader("Recommendations")
+
+    if selected_intervention == "Pop-up Market":
+        recommendations = [
+            "Position market stalls to maintain adequate walking paths",
+            "Incorporate weather protection for year-round usability",
+            "Include a variety of market sections to accommodate different vendors",
+            "Establish a maintenance plan and budget for long-term sustainability"
+        ]
+    else:  # Pop-up Art Installation
+        recommendations = [
+            "Implement interactive art pieces where possible to maximize engagement",
+            "Position installations near transit nodes and major gathering points",
+            "Balance art placement with business visibility for mutual benefits"
+        ]
+
+    for recommendation in recommendations:
+        st.markdown(f"🔹 {recommendation}")
+
+    st.subheader('Combined Implementation Approach')
+    st.write('Synergies & Opportunities:')
+    st.write('Community Hubs: Placing art installations near markets creates natural gathering points.')
+    st.write('Experience Points: Strategically placed art along market routes provides cultural touchpoints.')
+    st.write('Shared Maintenance: Combined implementations can share maintenance resources and costs.')
+    st.write('Complete Streets: Integrating both interventions supports "complete streets" principles.')
+    st.write('Funding Opportunities: Combined projects may qualify for more diverse funding sources.')
+
+    if selected_intervention == "Pop-up Market":
+        # Get trade-offs data from results
+        tradeoffs = results["tradeoffs"]
+
+        # Add a radar chart
+        categories = list(tradeoffs.keys())
+        values = list(tradeoffs.values())
+
+        radar_chart(categories, values)
+
+    else:  # Pop-up Art Installation
+        # For Art Installation, create a visualization of key metrics
+        categories = ['pedestrian_safety', 'traffic_flow', 'business_access', 'cost_efficiency', 'community_support']
+        values = [results[category] for category in categories]
+
+        # Format category names for display
+        display_categories = [cat.replace('_', ' ').title() for cat in categories]
+
+        # Create radar chart for Art Installation metrics
+        radar_chart(display_categories, values)
+
+    # Pareto check over the level combinations reachable with the sliders (other levels stay at 0)
+    level_table = LEVEL_TABLES[selected_intervention]
+    fixed_levels = {name: 0 for name in level_table.level_names if name not in params_values}
+    candidate_rows, on_frontier = intervention_frontier(selected_intervention, fixed_levels)
+    if on_frontier[candidate_rows == level_table.index(*(params_values.get(name, 0) for name in level_table.level_names))].all():
+        st.success("Pareto-optimal: no other level choice is at least as good on every trade-off axis.")
+    else:
+        st.warning("Dominated: another level choice is at least as good on every trade-off axis.")
+
+    # Combined scenario: the selected intervention together with the others, including synergies
+    st.subheader("Combined Scenario")
+    combined_params = {selected_intervention: params_values}
+    for other_intervention in INTERVENTIONS:
+        if other_intervention == selected_intervention:
+            continue
+        combined_params[other_intervention] = {}
+        for param_key, param_info in INTERVENTIONS[other_intervention]["parameters"].items():
+            combined_params[other_intervention][param_key] = st.slider(
+                f"Combined with: {param_info['label']}",
+                param_info['min'],
+                param_info['max'],
+                param_info['default'],
+                format="%d",
+                help=param_info['description'],
+                key=f"analysis_combined_{param_key}"
+            )
+
+    combined = cached("combined_scenario", None, combined_params, lambda: COMBINED_SCENARIOS.scenario(combined_params))
+    combined_categories = list(combined["tradeoffs"].keys())
+
+    radar_chart(combined_categories, combined["tradeoffs"].values(), name='Combined Scenario', colors=COMBINED_SCENARIO_COLORS)
+
+    synergy_notes = [f"{axis}: {points:+.1f}" for axis, points in combined["synergy"].items() if points]
+    if synergy_notes:
+        st.caption("Synergy contribution - " + ", ".join(synergy_notes))
+
+    # Highlight the Pareto frontier of the combined scenarios reachable with the sliders
+    combined_fixed_levels = {
+        label: {name: 0 for name in table.level_names if name not in INTERVENTIONS[label]["parameters"]}
+        for label, table in zip(COMBINED_SCENARIOS.labels, COMBINED_SCENARIOS.tables)
+    }
+    frontier_rows, combined_on_frontier, frontier_results = combined_frontier(COMBINED_SCENARIOS, combined_fixed_levels)
+    current_combined_row = COMBINED_SCENARIOS.index(combined_params)
+
+    frontier_table = {
+        f"{label}: {INTERVENTIONS[label]['parameters'][name]['label']}": [
+            CATEGORICAL_LABELS[int(level)] for level in levels[combined_on_frontier]
+        ]
+        for label, label_levels in frontier_results["levels"].items()
+        for name, levels in label_levels.items()
+        if name in INTERVENTIONS[label]["parameters"]
+    }
+    for axis, values in frontier_results["tradeoffs"].items():
+        frontier_table[axis] = values[combined_on_frontier].round(1)
+    frontier_table["Current"] = np.where(frontier_rows[combined_on_frontier] == current_combined_row, "◀", "")
+
+    st.markdown("**Pareto-optimal combined scenarios** (no other scenario is at least as good on every axis)")
+    st.dataframe(frontier_table, hide_index=True, width="stretch")
+
+
+@st.fragment
+def feedback_form():
+    """Feedback form; its widgets rerun only the form"""
     st.header("Your Feedback")
     st.markdown("Help shape the future of Long Island City by sharing your input on these interventions")
-    
+
     # Stakeholder selection
-    stakeholder_type = st.selectbox(
-        "I am providing feedback as a:",
-        ["Resident", "Business Owner", "Community Organization", 
-         "LICP Official", "Municipal Department", "Investor", "Arts Organization", "Other"]
-    )
-    
+    st.selectbox("I am providing feedback as a:", FEEDBACK_FIELDS["stakeholder_type"][1], key="feedback_stakeholder_type")
+
     # General intervention feedback
     st.subheader("Intervention Feedback")
-    
+    intervention, levels = rated_selection()
+    if intervention is None:
+        st.info("Select an intervention in the Analysis tab to rate it; this feedback is stored without one.")
+    else:
+        st.info(f"You are rating **{intervention}** as set in the Analysis tab: " + ", ".join(
+            f"{INTERVENTIONS[intervention]['parameters'][name]['label']} **{CATEGORICAL_LABELS[level]}**"
+            for name, level in levels.items()
+        ))
+
     # Create two columns for a cleaner layout
     col1, col2 = st.columns(2)
-    
+
     with col1:
         # Overall rating
-        st.slider("How would you rate this intervention overall?", 0, 10, 5)
-        
+        st.slider("How would you rate this intervention overall?", 0, 10, 5, key="feedback_rating")
+
         # Support level
-        support_level = st.radio("Would you support implementing this intervention?", 
-                               ["Strongly Support", "Support", "Neutral", "Oppose", "Strongly Oppose"])
-    
+        st.radio("Would you support implementing this intervention?", FEEDBACK_FIELDS["support_level"][1],
+                 key="feedback_support_level")
+
     with col2:
         # Most valued aspects
-        st.multiselect("What aspects do you value most about this intervention?", 
-                      ["Community Character", "Economic Benefits", "Sustainability", 
-                       "Accessibility", "Safety", "Visual Appeal", "Cultural Significance"])
-        
+        st.multiselect("What aspects do you value most about this intervention?", FEEDBACK_FIELDS["valued_aspects"][1],
+                       key="feedback_valued_aspects")
+
         # Implementation preferences
-        st.multiselect("Which implementation features are most important?",
-                      ["Weather Protection", "Local Vendor Priority", "Cultural Elements",
-                       "Safety Features", "Accessibility", "Environmental Considerations"])
-    
+        st.multiselect("Which implementation features are most important?", FEEDBACK_FIELDS["implementation_features"][1],
+                       key="feedback_implementation_features")
+
     # Priority ranking
     st.subheader("Priority Ranking")
     st.markdown("Rank the following priorities from most (1) to least (5) important:")
-    
+
     col1, col2 = st.columns(2)
     with col1:
-        st.number_input("Economic Development", 1, 5, 3)
-        st.number_input("Community Character", 1, 5, 3)
-        st.number_input("Pedestrian Experience", 1, 5, 3)
+        st.number_input("Economic Development", 1, 5, 3, key="feedback_priority_economic_development")
+        st.number_input("Community Character", 1, 5, 3, key="feedback_priority_community_character")
+        st.number_input("Pedestrian Experience", 1, 5, 3, key="feedback_priority_pedestrian_experience")
     with col2:
-        st.number_input("Environmental Benefits", 1, 5, 3)
-        st.number_input("Cost Efficiency", 1, 5, 3)
-    
+        st.number_input("Environmental Benefits", 1, 5, 3, key="feedback_priority_environmental_benefits")
+        st.number_input("Cost Efficiency", 1, 5, 3, key="feedback_priority_cost_efficiency")
+
     # Implementation suggestions and concerns
     st.subheader("Additional Input")
-    
+
     tab2_1, tab2_2 = st.tabs(["Suggestions", "Concerns"])
-    
+
     with tab2_1:
         st.text_area("Do you have specific suggestions for implementation?", 
                     placeholder="Share your ideas for how this intervention could be improved or customized for LIC...",
-                    height=100)
-        
+                    height=100, max_chars=FEEDBACK_TEXT_MAX_CHARS, key="feedback_suggestions")
+
         # Location preferences
         st.subheader("Location Preferences")
         st.markdown("Where do you think this intervention would be most effective? (Select up to 3)")
-        
+
         col1, col2 = st.columns(2)
         with col1:
-            st.checkbox("Near subway stations")
-            st.checkbox("Along commercial corridors")
-            st.checkbox("Near residential buildings")
+            st.checkbox("Near subway stations", key="feedback_location_subway_stations")
+            st.checkbox("Along commercial corridors", key="feedback_location_commercial_corridors")
+            st.checkbox("Near residential buildings", key="feedback_location_residential_buildings")
         with col2:
-            st.checkbox("Near existing public spaces")
-            st.checkbox("At neighborhood gateways")
-            st.checkbox("Under highway overpasses")
-    
+            st.checkbox("Near existing public spaces", key="feedback_location_public_spaces")
+            st.checkbox("At neighborhood gateways", key="feedback_location_gateways")
+            st.checkbox("Under highway overpasses", key="feedback_location_highway_overpasses")
+
     with tab2_2:
         st.text_area("Do you have any concerns about this intervention?", 
                     placeholder="Share any concerns about potential negative impacts...",
-                    height=100)
-        
+                    height=100, max_chars=FEEDBACK_TEXT_MAX_CHARS, key="feedback_concerns")
+
         # Potential tradeoffs
         st.subheader("Potential Tradeoffs")
         st.markdown("Which potential tradeoffs concern you most? (Select all that apply)")
-        
+
         col1, col2 = st.columns(2)
         with col1:
-            st.checkbox("Increased maintenance costs")
-            st.checkbox("Potential congestion")
-            st.checkbox("Noise impacts")
+            st.checkbox("Increased maintenance costs", key="feedback_tradeoff_maintenance_costs")
+            st.checkbox("Potential congestion", key="feedback_tradeoff_congestion")
+            st.checkbox("Noise impacts", key="feedback_tradeoff_noise")
         with col2:
-            st.checkbox("Space constraints")
-            st.checkbox("Weather vulnerability")
-            st.checkbox("Equitable access")
-    
+            st.checkbox("Space constraints", key="feedback_tradeoff_space_constraints")
+            st.checkbox("Weather vulnerability", key="feedback_tradeoff_weather_vulnerability")
+            st.checkbox("Equitable access", key="feedback_tradeoff_equitable_access")
+
     # Data visualization integration
     st.subheader("Data Integration")
     st.markdown("Help us better understand neighborhood patterns by sharing anonymous data:")
-    
+
     col1, col2 = st.columns(2)
     with col1:
-        st.selectbox("How often do you visit the LIC IBZ area?", 
-                    ["Daily", "A few times per week", "Weekly", "Monthly", "Rarely", "Never"])
-        
-        visit_purpose = st.multiselect("What brings you to the area? (Select all that apply)",
-                                     ["Work", "Shopping", "Dining", "Entertainment", "Art/Culture", 
-                                      "Recreation", "Passing through", "Resident"])
-    
+        st.selectbox("How often do you visit the LIC IBZ area?", FEEDBACK_FIELDS["visit_frequency"][1],
+                     key="feedback_visit_frequency")
+
+        st.multiselect("What brings you to the area? (Select all that apply)", FEEDBACK_FIELDS["visit_purpose"][1],
+                       key="feedback_visit_purpose")
+
     with col2:
-        st.selectbox("How do you typically travel to the area?",
-                   ["Walk", "Subway", "Bus", "Bike", "Car", "Taxi/Rideshare", "Multiple modes"])
-        
-        st.selectbox("What times do you typically visit?",
-                   ["Morning (6AM-10AM)", "Midday (10AM-2PM)", "Afternoon (2PM-6PM)", 
-                    "Evening (6PM-10PM)", "Night (10PM-6AM)", "Varies"])
-    
+        st.selectbox("How do you typically travel to the area?", FEEDBACK_FIELDS["travel_mode"][1],
+                     key="feedback_travel_mode")
+
+        st.selectbox("What times do you typically visit?", FEEDBACK_FIELDS["visit_time"][1],
+                     key="feedback_visit_time")
+
     # Future engagement
     st.subheader("Future Engagement")
-    
+
     col1, col2 = st.columns(2)
     with col1:
-        st.checkbox("I would like to participate in future planning workshops")
-        st.checkbox("I would like to receive updates on LIC transformation projects")
-        
+        st.checkbox("I would like to participate in future planning workshops", key="feedback_engagement_workshops")
+        st.checkbox("I would like to receive updates on LIC transformation projects", key="feedback_engagement_updates")
+
     with col2:
-        st.checkbox("I would be interested in volunteering for pop-up events")
-        st.checkbox("I would like to provide feedback on future iterations")
-    
+        st.checkbox("I would be interested in volunteering for pop-up events", key="feedback_engagement_volunteering")
+        st.checkbox("I would like to provide feedback on future iterations", key="feedback_engagement_future_feedback")
+
     # Optional contact info
     st.subheader("Optional Contact Information")
     st.markdown("Your contact information will only be used for LIC BID planning purposes")
-    
+
     col1, col2 = st.columns(2)
     with col1:
-        st.text_input("Name (Optional)")
-        st.text_input("Email (Optional)")
-    
+        st.text_input("Name (Optional)", max_chars=FEEDBACK_TEXT_MAX_CHARS, key="feedback_contact_name")
+        st.text_input("Email (Optional)", max_chars=FEEDBACK_TEXT_MAX_CHARS, key="feedback_contact_email")
+
     with col2:
-        st.text_input("Organization (if applicable)")
-        st.text_input("ZIP Code")
-    
+        st.text_input("Organization (if applicable)", max_chars=FEEDBACK_TEXT_MAX_CHARS, key="feedback_contact_organization")
+        st.text_input("ZIP Code", max_chars=FEEDBACK_TEXT_MAX_CHARS, key="feedback_contact_zip_code")
+
     # Submit button
     submit_col1, submit_col2, submit_col3 = st.columns([1,1,1])
     with submit_col2:
-        st.button("Submit Feedback", use_container_width=True)
+        submitted = st.button("Submit Feedback", width="stretch")
+    if submitted:
+        submit_feedback()
 
-with tab3:
-    st.subheader("Consensus Dashboard")
-    st.markdown("See where different stakeholders align on intervention options")
-    
-    # Create dummy consensus data
-    consensus_data = {
-        "Pop-up Art Installation - Minimal": {
-            "Residents": 78,
-            "Business Owners": 65,
-            "LICP Officials": 82,
-            "Municipal Departments": 70,
-            "Investors": 55,
-            "Arts Organizations": 90
-        },
-        "Pop-up Art Installation - Extensive": {
-            "Residents": 85,
-            "Business Owners": 60,
-            "LICP Officials": 75,
-            "Municipal Departments": 65,
-            "Investors": 50,
-            "Arts Organizations": 95
-        },
-        "Pop-up Market - Minimal": {
-            "Residents": 72,
-            "Business Owners": 80,
-            "LICP Officials": 78,
-            "Municipal Departments": 75,
-            "Investors": 70,
-            "Arts Organizations": 85
-        },
-        "Pop-up Market - Extensive": {
-            "Residents": 80,
-            "Business Owners": 75,
-            "LICP Officials": 70,
-            "Municipal Departments": 60,
-            "Investors": 65,
-            "Arts Organizations": 90
-        }
+
+def rated_selection():
+    """
+    Intervention and levels the feedback is about: those selected in the Analysis tab
+
+    Returns:
+    - (intervention, {parameter name: level}), or (None, None) if no intervention is selected
+    """
+    intervention = st.session_state.get("analysis_intervention")
+    if intervention is None:
+        return None, None
+    return intervention, {
+        name: st.session_state.get(f"analysis_{name}", parameter["default"])
+        for name, parameter in INTERVENTIONS[intervention]["parameters"].items()
     }
-    
-    # Visualize consensus with a heatmap
-    interventions = list(consensus_data.keys())
-    stakeholders = list(consensus_data[interventions[0]].keys())
-    
-    data = []
-    for intervention in interventions:
-        for stakeholder in stakeholders:
-            data.append({
-                "Intervention": intervention,
-                "Stakeholder": stakeholder,
-                "Support Level": consensus_data[intervention][stakeholder]
-            })
-    
-    df_consensus = pd.DataFrame(data)
-    
-    # Create heatmap
-    fig = px.imshow(
-        df_consensus.pivot(index="Intervention", columns="Stakeholder", values="Support Level"),
-        labels=dict(x="Stakeholder", y="Intervention", color="Support Level"),
-        x=stakeholders,
-        y=interventions,
-        color_continuous_scale="RdYlGn",
-        zmin=0, zmax=100
+
+
+def submit_feedback():
+    """
+    Store the Feedback tab's answers, with the intervention and levels selected in the Analysis tab
+
+    The submission is acknowledged once it is in the feedback store's journal; the
+    store's writer thread adds it to the database in the background.
+    """
+    intervention, levels = rated_selection()
+    try:
+        row = feedback_row(
+            {name: st.session_state.get(f"feedback_{name}") for name in FEEDBACK_FIELDS}, intervention, levels
+        )
+        feedback_store().submit(row)
+    except FeedbackError as error:
+        st.error(f"Your feedback could not be saved: {error}")
+    except FeedbackQueueFull:
+        st.warning("Many people are submitting feedback right now, please try again in a moment.")
+    except (OSError, RuntimeError):
+        # The journal cannot be written (e.g. the disk is full) or the store is shutting down
+        st.warning("Your feedback could not be saved right now, please try again in a moment.")
+    else:
+        st.success("Thank you! Your feedback has been recorded.")
+
+
+def consensus_filters():
+    """
+    Filters of the Consensus Dashboard's responses
+
+    Returns:
+    - feedback_archive.filter_expression() keyword arguments of the filters that are set
+    """
+    filters = {}
+    with st.expander("Filter responses"):
+        dates = st.date_input("Submitted between (UTC)", value=(), key="consensus_filter_dates")
+        if dates:
+            filters["date_from"] = dates[0]
+            filters["date_to"] = dates[-1]
+        columns = st.columns(3)
+        for column, (name, label) in zip(columns, [
+            ("visit_frequency", "Visit frequency"), ("travel_mode", "Travel mode"), ("visit_time", "Visit time")
+        ]):
+            selected = column.multiselect(label, FEEDBACK_FIELDS[name][1], key=f"consensus_filter_{name}")
+            if selected:
+                filters[name] = selected
+    return filters
+
+
+def archived_consensus(filters):
+    """ConsensusMatrix of the archived responses matching consensus_filters(), cached until the next compaction"""
+    from feedback_archive import feedback_archive, filter_expression
+
+    archive = feedback_archive()
+    return cached(
+        "consensus_archive", None, {"filters": filters, "archived": archive.last_id()},
+        lambda: archive.consensus_matrix(filter_expression(**filters))
     )
-    
-    fig.update_layout(
-        margin=dict(l=50, r=50, t=30, b=50),
-        height=400
+
+
+def archive_status():
+    """Caption saying how recent the archive read by the filters is"""
+    from feedback_archive import feedback_archive
+
+    archive = feedback_archive()
+    compacted_at = archive.compacted_at()
+    if compacted_at is None:
+        return "Filters cover archived responses only, and none have been archived yet."
+    minutes = max(0, round((time.time() - compacted_at) / 60))
+    return (
+        f"Filters cover archived responses only: up to response #{archive.last_id()}, archived "
+        f"{minutes} min ago. Newer responses are archived every {FEEDBACK_ARCHIVE_INTERVAL / 60:g} min."
     )
-    
-    st.plotly_chart(fig, use_container_width=True)
-    
+
+
+@st.fragment
+def consensus_dashboard():
+    """Consensus heatmap and analysis"""
+    st.subheader("Consensus Dashboard")
+    st.markdown("See where different stakeholders align on intervention options")
+
+    # Support per intervention option and stakeholder, aggregated incrementally as feedback is committed
+    matrix = consensus_aggregator().matrix()
+    responses = int(matrix.counts.sum())
+    if not responses:
+        st.info("No feedback has been submitted yet. Share yours in the Feedback tab.")
+        return
+
+    # Filtered queries read the columnar archive (feedback_archive.py), which is as recent as its last compaction
+    filters = consensus_filters()
+    if filters:
+        try:
+            import pyarrow
+        except ImportError:
+            st.warning("Filtering responses requires the pyarrow package.")
+            return
+        try:
+            with timed("archived consensus"):
+                matrix = archived_consensus(filters)
+        except (OSError, pyarrow.ArrowException):
+            st.warning("The archived responses could not be read right now, please try again in a moment.")
+            return
+        st.caption(archive_status())
+        responses = int(matrix.counts.sum())
+        if not responses:
+            st.info("No archived responses match these filters.")
+            return
+
+    statistic = st.radio(
+        "Color cells by",
+        ["mean", "median", "polarization"],
+        format_func={"mean": "Mean support", "median": "Median support", "polarization": "Polarization"}.get,
+        horizontal=True,
+        key="consensus_statistic"
+    )
+
+    # Visualize consensus with a heatmap (the first one imports plotly.express); rebuilt only when the matrix changes
+    with timed("consensus heatmap"):
+        fig = cached_figure(
+            "consensus_heatmap", None, {"version": matrix.version, "statistic": statistic, "filters": filters},
+            lambda: build_consensus_heatmap(matrix, statistic)
+        )
+
+    st.plotly_chart(fig, width="stretch")
+    scope = f"{responses} archived responses matching the filters" if filters else f"{responses} responses"
+    if statistic == "polarization":
+        st.caption(
+            f"Polarization of {scope}: 0 when a stakeholder type answers alike, "
+            "1 when it is split between Strongly Support and Strongly Oppose"
+        )
+    else:
+        st.caption(f"{statistic.capitalize()} support of {scope} (Strongly Support = 100, Strongly Oppose = 0)")
+
+    # Medians and interquartile ranges per cell
+    with st.expander("Support and rating distributions"):
+        counted = np.nonzero(matrix.counts)
+        st.dataframe(
+            {
+                "Intervention": [matrix.options[option] for option in counted[0]],
+                "Stakeholder": [matrix.stakeholders[stakeholder] for stakeholder in counted[1]],
+                "Responses": matrix.counts[counted],
+                "Median support": matrix.support_quartiles[counted][:, 1],
+                "Support IQR": [f"{low:.0f}-{high:.0f}" for low, _, high in matrix.support_quartiles[counted]],
+                "Median rating": matrix.rating_quartiles[counted][:, 1],
+                "Rating IQR": [f"{low:.1f}-{high:.1f}" for low, _, high in matrix.rating_quartiles[counted]],
+                "Polarization": matrix.polarization[counted].round(2)
+            },
+            hide_index=True
+        )
+
     # Add consensus analysis text
+    agreed, divided, split = consensus_findings(matrix)
     st.subheader("Consensus Analysis")
     st.markdown("**Areas of Strong Agreement:**")
-    st.markdown("• All stakeholders show support for minimal public plaza/market implementation")
-    st.markdown("• Residents and Arts Organizations strongly favor extensive Pop-up Art Installation")
-    
+    for option in agreed:
+        st.markdown(f"• All responding stakeholders support {option}")
+    if not agreed:
+        st.markdown("• None yet")
+
     st.markdown("**Areas of Divergence:**")
-    st.markdown("• Investors show lower support for extensive Pop-up Art Installation")
-    st.markdown("• Municipal Departments have concerns about extensive plaza/market implementations")
+    for option, low, high in divided:
+        st.markdown(f"• {option}: {low} respondents are much less supportive than {high} respondents")
+    for option, stakeholder, index in split:
+        st.markdown(f"• {option}: {stakeholder} respondents are split between support and opposition (polarization {index:.2f})")
+    if not divided and not split:
+        st.markdown("• None yet")
 
 
+# Only the selected tab's expensive content runs; switching tabs triggers a rerun
+tab1, tab2, tab3 = st.tabs(["Analysis", "Feedback", "Consensus Dashboard"], key="main_tab", on_change="rerun")
+
+if not tab1.open:
+    keep_widget_state("analysis_")
+if not tab3.open:
+    keep_widget_state("consensus_")
+
+# Each region is a fragment, so a widget interaction reruns only the region it belongs to
+with tab1:
+    if tab1.open:
+        analysis_panel()
+
+with tab2:
+    feedback_form()
+
+with tab3:
+    if tab3.open:
+        consensus_dashboard()
+
 
 # Footer
 st.markdown("---")
-st.caption("Urban Interventions Interactive Tool - Created with Streamlit")
\ No newline at end of file
+st.caption("Urban Interventions Interactive Tool - Created with Streamlit")
+
+# First-paint latency of each session, and of the first session after a cold start
+if "first_render_recorded" not in st.session_state:
+    st.session_state.first_render_recorded = True
+    record("first render", time.perf_counter() - _script_start)
+    record("process start to first render", process_uptime())
\ No newline at end of file
@@ -0,0 +1,281 @@
+"""
+Build step for responsive, compressed variants of the images under assets/
+
+Usage:
+    python asset_pipeline.py build [NAME ...] [--workers N] [--prune]
+
+Each source image is converted to every format of config.ASSET_VARIANT_FORMATS at
+every width of config.ASSET_VARIANT_WIDTHS (plus its own width), into
+build/assets/<content hash>/<width>.<format>, and gets a tiny blurred placeholder
+(a data URL in the manifest) shown while the full image loads. Variants are cached by content hash,
+so unchanged images are never re-encoded. build/assets/manifest.json indexes the
+variants of every source; the app reads it through AssetVariants.
+"""
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+import sys
+
+from config import (
+    ASSET_DISPLAY_WIDTH, ASSET_PLACEHOLDER_WIDTH, ASSET_VARIANT_FORMATS, ASSET_VARIANT_QUALITY, ASSET_VARIANT_WIDTHS
+)
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.join(ROOT_DIR, "assets")
+BUILD_DIR = os.path.join(ROOT_DIR, "build", "assets")
+MANIFEST_NAME = "manifest.json"
+
+SOURCE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+# Pillow format name and encoder options per variant format
+_ENCODERS = {
+    "webp": ("WEBP", {"method": 4}),
+    "avif": ("AVIF", {})
+}
+
+
+def content_hash(path):
+    """First 16 hex digits of the SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as source_file:
+        for block in iter(lambda: source_file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def placeholder_data_url(image, width=ASSET_PLACEHOLDER_WIDTH):
+    """Tiny blurred WebP of a PIL image as a data URL (a few hundred bytes), stretched by the browser"""
+    from PIL import Image, ImageFilter
+
+    height = max(1, round(image.height * width / image.width))
+    small = image.convert("RGB").resize((width, height), Image.BOX).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    small.save(buffer, "WEBP", quality=40)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def _write_json(path, data):
+    """Write JSON atomically, so readers never see a partial file"""
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as json_file:
+        json.dump(data, json_file, indent=1)
+    os.replace(temporary, path)
+
+
+def build_asset(name, assets_dir=ASSETS_DIR, build_dir=BUILD_DIR):
+    """
+    Build (or reuse) the variants of one source image
+
+    Returns:
+    - Manifest entry: {"hash", "width", "height", "bytes", "mtime_ns", "placeholder",
+      "variants": [{"width", "height", "format", "file", "bytes"}, ...]} with files relative to build_dir
+    """
+    from PIL import Image
+
+    source = os.path.join(assets_dir, name)
+    stat = os.stat(source)
+    digest = content_hash(source)
+    out_dir = os.path.join(build_dir, digest)
+    index_path = os.path.join(out_dir, "variants.json")
+
+    settings = {
+        "widths": list(ASSET_VARIANT_WIDTHS), "formats": list(ASSET_VARIANT_FORMATS), "quality": ASSET_VARIANT_QUALITY,
+        "placeholder_width": ASSET_PLACEHOLDER_WIDTH
+    }
+    entry = None
+    if os.path.exists(index_path):
+        with open(index_path) as index_file:
+            entry = json.load(index_file)
+        if entry.get("settings") != settings:
+            entry = None
+    if entry is None:
+        os.makedirs(out_dir, exist_ok=True)
+        variants = []
+        with Image.open(source) as image:
+            image.load()
+            widths = sorted({width for width in ASSET_VARIANT_WIDTHS if width < image.width} | {image.width})
+            for width in widths:
+                height = max(1, round(image.height * width / image.width))
+                resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                for variant_format in ASSET_VARIANT_FORMATS:
+                    pillow_format, options = _ENCODERS[variant_format]
+                    file_name = f"{width}.{variant_format}"
+                    resized.save(
+                        os.path.join(out_dir, file_name), pillow_format,
+                        quality=ASSET_VARIANT_QUALITY[variant_format], **options
+                    )
+                    variants.append({
+                        "width": width,
+                        "height": height,
+                        "format": variant_format,
+                        "file": f"{digest}/{file_name}",
+                        "bytes": os.path.getsize(os.path.join(out_dir, file_name))
+                    })
+            entry = {
+                "hash": digest, "width": image.width, "height": image.height,
+                "settings": settings, "placeholder": placeholder_data_url(image), "variants": variants
+            }
+        _write_json(index_path, entry)
+
+    # Size and mtime let the app detect a changed source without re-hashing it
+    entry.update({"bytes": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+    return entry
+
+
+def source_assets(assets_dir=ASSETS_DIR):
+    """Names of the source images under assets/"""
+    return sorted(
+        name for name in os.listdir(assets_dir)
+        if name.lower().endswith(SOURCE_EXTENSIONS) and os.path.isfile(os.path.join(assets_dir, name))
+    )
+
+
+def build_all(names=None, assets_dir=ASSETS_DIR, build_dir=BUILD_DIR, workers=1, prune=False):
+    """
+    Build the variants of the given (default: all) source images and write the manifest
+
+    Returns:
+    - Manifest dictionary of source name -> entry (see build_asset)
+    """
+    names = list(names or source_assets(assets_dir))
+    os.makedirs(build_dir, exist_ok=True)
+    manifest_path = os.path.join(build_dir, MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(workers) as pool:
+            entries = list(pool.map(build_asset, names, [assets_dir] * len(names), [build_dir] * len(names)))
+    else:
+        entries = [build_asset(name, assets_dir, build_dir) for name in names]
+    manifest.update(zip(names, entries))
+
+    # Drop sources that no longer exist
+    manifest = {name: entry for name, entry in manifest.items() if os.path.exists(os.path.join(assets_dir, name))}
+    _write_json(manifest_path, manifest)
+
+    if prune:
+        import shutil
+
+        referenced = {entry["hash"] for entry in manifest.values()}
+        for directory in os.listdir(build_dir):
+            if os.path.isdir(os.path.join(build_dir, directory)) and directory not in referenced:
+                shutil.rmtree(os.path.join(build_dir, directory))
+    return manifest
+
+
+def smallest_variant(entry, width=ASSET_DISPLAY_WIDTH, formats=ASSET_VARIANT_FORMATS):
+    """
+    Variant to serve for a display width
+
+    The narrowest variant at least `width` px wide (the widest one if none is), and of
+    those the smallest file among `formats`; ties go to the earlier format.
+    """
+    candidates = [variant for variant in entry["variants"] if variant["format"] in formats]
+    if not candidates:
+        return None
+    fitting = [variant for variant in candidates if variant["width"] >= width]
+    target_width = min(variant["width"] for variant in fitting) if fitting else max(variant["width"] for variant in candidates)
+    return min(
+        (variant for variant in candidates if variant["width"] == target_width),
+        key=lambda variant: (variant["bytes"], formats.index(variant["format"]))
+    )
+
+
+class AssetVariants:
+    """
+    Resolves asset names to the variant to serve, falling back to the source image
+
+    The manifest is read once. A source whose size or modification time no longer
+    matches its manifest entry is served as is until the build step runs again.
+    """
+
+    def __init__(self, assets_dir=ASSETS_DIR, build_dir=BUILD_DIR):
+        self.assets_dir = assets_dir
+        self.build_dir = build_dir
+        manifest_path = os.path.join(build_dir, MANIFEST_NAME)
+        self.manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as manifest_file:
+                self.manifest = json.load(manifest_file)
+
+    def require(self, names):
+        """
+        Check that every referenced source asset exists
+
+        Raises:
+        - FileNotFoundError listing every missing asset
+        """
+        missing = [name for name in names if not os.path.isfile(os.path.join(self.assets_dir, name))]
+        if missing:
+            raise FileNotFoundError(f"Missing image assets in {self.assets_dir}: {', '.join(missing)}")
+
+    def _current_entry(self, name):
+        """Manifest entry of an asset, or None if it was not built or its source changed since"""
+        entry = self.manifest.get(name)
+        if entry is not None:
+            stat = os.stat(os.path.join(self.assets_dir, name))
+            if (stat.st_size, stat.st_mtime_ns) == (entry["bytes"], entry["mtime_ns"]):
+                return entry
+        return None
+
+    def path(self, name, width=ASSET_DISPLAY_WIDTH, formats=ASSET_VARIANT_FORMATS):
+        """File to serve for an asset shown `width` px wide"""
+        entry = self._current_entry(name)
+        if entry is not None:
+            variant = smallest_variant(entry, width, formats)
+            if variant is not None:
+                variant_path = os.path.join(self.build_dir, variant["file"])
+                if os.path.exists(variant_path):
+                    return variant_path
+        return os.path.join(self.assets_dir, name)
+
+    def placeholder(self, name):
+        """Blurred placeholder data URL of an asset, or None if it has not been built"""
+        entry = self._current_entry(name)
+        return entry.get("placeholder") if entry is not None else None
+
+
+_asset_variants = None
+
+
+def asset_variants():
+    """Process-wide AssetVariants, created on first use"""
+    global _asset_variants
+    if _asset_variants is None:
+        _asset_variants = AssetVariants()
+    return _asset_variants
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build responsive, compressed variants of the image assets")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build the variants and the manifest")
+    build.add_argument("names", nargs="*", help="source images under assets/ (default: all)")
+    build.add_argument("--workers", type=int, default=1, help="encoder processes")
+    build.add_argument("--prune", action="store_true", help="remove variants of sources that changed or were deleted")
+    args = parser.parse_args(argv)
+
+    manifest = build_all(args.names, workers=args.workers, prune=args.prune)
+    total_source = total_served = 0
+    for name in args.names or sorted(manifest):
+        entry = manifest[name]
+        served = smallest_variant(entry)
+        total_source += entry["bytes"]
+        total_served += served["bytes"]
+        print(f"{name}: {entry['bytes'] / 1024:.0f} KB -> {served['file']} {served['bytes'] / 1024:.0f} KB")
+    if total_source:
+        print(f"Total served at {ASSET_DISPLAY_WIDTH} px: {total_source / 1e6:.2f} MB -> {total_served / 1e6:.2f} MB "
+              f"({1 - total_served / total_source:.0%} smaller)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
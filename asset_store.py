@@ -0,0 +1,245 @@
+"""
+Content-addressed store of the images served by app.py, and a report of the files under assets/
+
+Usage:
+    python asset_store.py publish [--prune]
+    python asset_store.py report
+
+Every served image (the built variant of a manifest asset, or a rendered composite) is
+stored once under static/assets/<first 16 hex digits of its SHA-256>.<extension>, so
+identical content shares one file and a file name never changes meaning. Streamlit
+serves the directory at app/static/assets/ (server.enableStaticServing); server.py adds
+"Cache-Control: immutable" headers, so browsers never download an unchanged image twice.
+
+The report lists exact and near duplicates under assets/ (by a 256-bit difference hash)
+and the files that the image manifest does not reference.
+"""
+import argparse
+import hashlib
+import itertools
+import os
+import re
+import sys
+
+from config import ASSET_NEAR_DUPLICATE_DISTANCE
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.join(ROOT_DIR, "assets")
+STORE_DIR = os.path.join(ROOT_DIR, "static", "assets")
+LEGACY_APP = os.path.join(ROOT_DIR, "old", "app.py")
+
+# URL of the store relative to the app page (Streamlit static serving)
+STORE_URL = "app/static/assets/"
+
+CACHE_CONTROL = b"public, max-age=31536000, immutable"
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".avif")
+
+_STORED_NAME = re.compile(r"^[0-9a-f]{16}\.[a-z0-9]+$")
+
+
+def static_serving_enabled():
+    """Whether the running Streamlit server serves static/ (and so the store)"""
+    try:
+        from streamlit import config
+    except ImportError:
+        return False
+    return bool(config.get_option("server.enableStaticServing"))
+
+
+class AssetStore:
+    """Directory of files named by the hash of their content"""
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+
+    def put_bytes(self, data, extension):
+        """
+        Store content (once) and return its file name
+
+        Parameters:
+        - data: file content
+        - extension: file extension including the dot, e.g. ".avif"
+        """
+        name = hashlib.sha256(data).hexdigest()[:16] + extension.lower()
+        path = os.path.join(self.store_dir, name)
+        if not os.path.exists(path):
+            os.makedirs(self.store_dir, exist_ok=True)
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as store_file:
+                store_file.write(data)
+            os.replace(temporary, path)
+        return name
+
+    def put_file(self, path):
+        """Store the content of a file (once) and return its file name"""
+        with open(path, "rb") as source_file:
+            return self.put_bytes(source_file.read(), os.path.splitext(path)[1])
+
+    def names(self):
+        """File names in the store"""
+        if not os.path.isdir(self.store_dir):
+            return []
+        return sorted(name for name in os.listdir(self.store_dir) if _STORED_NAME.match(name))
+
+    def prune(self, keep):
+        """
+        Delete stored files whose name is not in keep
+
+        Returns:
+        - Names of the deleted files
+        """
+        keep = set(keep)
+        removed = [name for name in self.names() if name not in keep]
+        for name in removed:
+            os.remove(os.path.join(self.store_dir, name))
+        return removed
+
+
+def url(name):
+    """URL of a stored file, relative to the app page"""
+    return STORE_URL + name
+
+
+_asset_store = None
+
+
+def asset_store():
+    """Process-wide AssetStore, created on first use"""
+    global _asset_store
+    if _asset_store is None:
+        _asset_store = AssetStore()
+    return _asset_store
+
+
+class ImmutableCacheMiddleware:
+    """
+    ASGI middleware adding long-lived immutable Cache-Control headers to store responses
+
+    Only successful responses under the store URL get the header; their names are
+    content hashes, so a cached copy can never be stale.
+    """
+
+    def __init__(self, app, path=f"/{STORE_URL}"):
+        self.app = app
+        self.path = path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cache_headers(message):
+            if message["type"] == "http.response.start" and message.get("status") == 200:
+                headers = [(key, value) for key, value in message.get("headers", []) if key.lower() != b"cache-control"]
+                message = {**message, "headers": [*headers, (b"cache-control", CACHE_CONTROL)]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_cache_headers)
+
+
+def difference_hash(path, size=16):
+    """256-bit difference hash (gradient signs of a 16x16 grayscale thumbnail) of an image"""
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(path) as image:
+        pixels = np.asarray(image.convert("L").resize((size + 1, size), Image.BOX), dtype=np.int16)
+    return (pixels[:, 1:] > pixels[:, :-1]).ravel()
+
+
+def referenced_assets():
+    """Source files under assets/ shown or composited by app.py"""
+    from image_manifest import image_manifest
+
+    return set(image_manifest().assets())
+
+
+def report(assets_dir=ASSETS_DIR, distance=ASSET_NEAR_DUPLICATE_DISTANCE):
+    """
+    Duplicate and orphaned files under assets/
+
+    Returns:
+    - {"duplicates": [[names with identical content], ...],
+       "near_duplicates": [(name, name, differing hash bits), ...],
+       "legacy": [names only referenced by old/app.py], "orphans": [names referenced nowhere]}
+    """
+    names = sorted(
+        name for name in os.listdir(assets_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(assets_dir, name))
+    )
+
+    by_content = {}
+    for name in names:
+        with open(os.path.join(assets_dir, name), "rb") as asset_file:
+            by_content.setdefault(hashlib.sha256(asset_file.read()).digest(), []).append(name)
+    duplicates = [group for group in by_content.values() if len(group) > 1]
+
+    hashes = {name: difference_hash(os.path.join(assets_dir, name)) for name in names}
+    near_duplicates = []
+    for first, second in itertools.combinations(names, 2):
+        bits = int((hashes[first] != hashes[second]).sum())
+        if bits <= distance:
+            near_duplicates.append((first, second, bits))
+
+    referenced = referenced_assets()
+    legacy_references = set()
+    if os.path.exists(LEGACY_APP):
+        with open(LEGACY_APP) as legacy_file:
+            legacy_references = set(re.findall(r"assets/([\w.-]+)", legacy_file.read()))
+    unreferenced = [name for name in names if name not in referenced]
+    return {
+        "duplicates": duplicates,
+        "near_duplicates": near_duplicates,
+        "legacy": [name for name in unreferenced if name in legacy_references],
+        "orphans": [name for name in unreferenced if name not in legacy_references]
+    }
+
+
+def publish(prune=False):
+    """
+    Store every image the app can show: the served file of each manifest entry and
+    every rendered composite
+
+    Returns:
+    - Dictionary of stored file name -> bytes
+    """
+    from image_manifest import image_manifest
+
+    manifest = image_manifest()
+    stored = {}
+    for entry in manifest.index.values():
+        name = manifest.stored_name(entry)
+        stored[name] = os.path.getsize(os.path.join(asset_store().store_dir, name))
+    if prune:
+        asset_store().prune(stored)
+    return stored
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Content-addressed image store and asset report")
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish_command = commands.add_parser("publish", help="store every image the app can show under static/assets/")
+    publish_command.add_argument("--prune", action="store_true", help="delete stored files the app no longer shows")
+    commands.add_parser("report", help="list duplicate, legacy and orphaned files under assets/")
+    args = parser.parse_args(argv)
+
+    if args.command == "publish":
+        stored = publish(args.prune)
+        print(f"{len(stored)} files, {sum(stored.values()) / 1024:.0f} KB in {os.path.relpath(STORE_DIR, ROOT_DIR)}/")
+        return 0
+
+    findings = report()
+    for group in findings["duplicates"]:
+        print(f"duplicate content: {', '.join(group)}")
+    for first, second, bits in findings["near_duplicates"]:
+        print(f"near duplicates: {first} ~ {second} ({bits} of 256 hash bits differ)")
+    for name in findings["legacy"]:
+        print(f"only referenced by old/app.py: {name}")
+    for name in findings["orphans"]:
+        print(f"unreferenced: {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,648 @@
+"""
+Benchmark suite for the calculators, chart construction, consensus aggregation and archive queries,
+asset loading, image compositing, the feedback store and app reruns
+
+Usage:
+    python benchmark.py [--output results.json] [--baseline baseline.json] [--threshold 0.2]
+                        [--only PREFIX ...] [--save-baseline baseline.json]
+
+Every benchmark reports throughput and latency percentiles as JSON. With --baseline,
+a benchmark regresses when its median latency grows by more than --threshold (a
+fraction) over the stored value; the exit status is then 1, so deploys can be gated.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".avif")
+
+DEFAULT_THRESHOLD = 0.2
+LATENCY_PERCENTILES = (50, 90, 99)
+
+# Rows per call of the batch calculator benchmarks
+BATCH_ROWS = 100_000
+
+
+def measure(function, repeat=1000, warmup=10, items=1, min_time=None):
+    """
+    Time repeated calls of a function
+
+    Parameters:
+    - function: callable taking no arguments
+    - repeat: number of timed calls
+    - warmup: untimed calls made first
+    - items: work items per call (e.g. rows of a batch), used for the throughput
+    - min_time: keep calling past repeat until this many seconds have been spent
+
+    Returns:
+    - Dictionary with the call count, throughput (items/s) and latency statistics in ms
+    """
+    for _ in range(warmup):
+        function()
+
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < repeat or (min_time is not None and time.perf_counter() - started < min_time):
+        call_start = time.perf_counter_ns()
+        function()
+        latencies.append(time.perf_counter_ns() - call_start)
+
+    return summarize(latencies, items)
+
+
+def summarize(latencies, items=1, seconds=None):
+    """
+    Statistics of measured call latencies
+
+    Parameters:
+    - latencies: latency of every call in ns
+    - items: work items per call, used for the throughput
+    - seconds: wall time of all calls (default: their total latency, i.e. calls made one after another)
+
+    Returns:
+    - Dictionary with the call count, throughput (items/s) and latency statistics in ms
+    """
+    latencies_ms = np.asarray(latencies, dtype=float) / 1e6
+    seconds = latencies_ms.sum() / 1000 if seconds is None else seconds
+    result = {
+        "calls": len(latencies),
+        "items_per_call": items,
+        "throughput": items * len(latencies) / seconds,
+        "mean_ms": float(latencies_ms.mean()),
+        "min_ms": float(latencies_ms.min()),
+        "max_ms": float(latencies_ms.max())
+    }
+    for percentile, value in zip(LATENCY_PERCENTILES, np.percentile(latencies_ms, LATENCY_PERCENTILES)):
+        result[f"p{percentile}_ms"] = float(value)
+    return result
+
+
+def bench_metrics():
+    """Scalar and batch calls into metrics.py"""
+    from metrics import (
+        calculate_public_seating_metrics_simplified, calculate_mobility_metrics_simplified,
+        calculate_public_seating_metrics_batch, calculate_mobility_metrics_batch
+    )
+
+    rng = np.random.default_rng(0)
+    market_levels = rng.integers(0, 3, size=(2, BATCH_ROWS))
+    art_levels = rng.integers(0, 3, size=(3, BATCH_ROWS))
+
+    return {
+        "metrics.scalar.market": measure(lambda: calculate_public_seating_metrics_simplified(1, 2), repeat=5000),
+        "metrics.scalar.art": measure(lambda: calculate_mobility_metrics_simplified(1, 2, 0), repeat=5000),
+        "metrics.batch.market": measure(
+            lambda: calculate_public_seating_metrics_batch(*market_levels), repeat=50, items=BATCH_ROWS
+        ),
+        "metrics.batch.art": measure(
+            lambda: calculate_mobility_metrics_batch(*art_levels), repeat=50, items=BATCH_ROWS
+        )
+    }
+
+
+def bench_charts():
+    """
+    Construction of the radar and consensus heatmap figures
+
+    The plotly_chart entries time st.plotly_chart itself (outside a running app, so the
+    message is built but not sent): a patched go.Figure, and the template's chart_spec() as
+    the app sends it.
+    """
+    import streamlit as st
+
+    from charts import build_radar_figure, build_consensus_heatmap, radar_template
+    from lookup_tables import LEVEL_TABLES
+
+    tradeoffs = LEVEL_TABLES["Pop-up Market"].lookup(1, 0)["tradeoffs"]
+    categories = list(tradeoffs.keys())
+    values = list(tradeoffs.values())
+    matrix = consensus_matrix()
+    template = radar_template(categories)
+    figure = template.figure()
+
+    results = {
+        "charts.radar": measure(lambda: build_radar_figure(categories, values), repeat=200),
+        "charts.radar.to_json": measure(lambda: build_radar_figure(categories, values).to_json(), repeat=200),
+        "charts.radar_template.to_json": measure(lambda: radar_template(categories).to_json(r=values), repeat=2000)
+    }
+    # Outside a running app every element logs a warning about the missing script run context
+    logging.disable(logging.WARNING)
+    try:
+        results["charts.radar.plotly_chart"] = measure(
+            lambda: st.plotly_chart(template.patch(figure, r=values), width="stretch"), repeat=500
+        )
+        results["charts.radar_template.plotly_chart"] = measure(
+            lambda: st.plotly_chart(template.chart_spec(r=values), width="stretch"), repeat=200
+        )
+    finally:
+        logging.disable(logging.NOTSET)
+    results["charts.consensus_heatmap"] = measure(lambda: build_consensus_heatmap(matrix), repeat=100)
+    return results
+
+
+def consensus_responses(count, seed=0):
+    """Random responses with the columns the consensus aggregation reads, every option and stakeholder type"""
+    from config import FEEDBACK_FIELDS, INTERVENTIONS
+
+    generator = np.random.default_rng(seed)
+    interventions = list(INTERVENTIONS)
+    stakeholders = FEEDBACK_FIELDS["stakeholder_type"][1]
+    support_levels = FEEDBACK_FIELDS["support_level"][1]
+    responses = []
+    for _ in range(count):
+        intervention = interventions[generator.integers(len(interventions))]
+        name, parameter = next(iter(INTERVENTIONS[intervention]["parameters"].items()))
+        responses.append({
+            "intervention": intervention,
+            "levels": {name: int(generator.integers(parameter["min"], parameter["max"] + 1))},
+            "stakeholder_type": stakeholders[generator.integers(len(stakeholders))],
+            "support_level": support_levels[generator.integers(len(support_levels))],
+            "rating": int(generator.integers(0, 11))
+        })
+    return responses
+
+
+def consensus_matrix(count=10_000):
+    """ConsensusMatrix of random responses"""
+    from consensus import ConsensusAggregator
+
+    aggregator = ConsensusAggregator()
+    aggregator.add(consensus_responses(count))
+    return aggregator.matrix()
+
+
+def bench_consensus():
+    """
+    Incremental consensus aggregation: adding a batch of responses, reading the matrix,
+    materializing its statistics after a change, and merging the state of another worker
+    """
+    from consensus import ConsensusAggregator
+
+    aggregator = ConsensusAggregator()
+    batch = consensus_responses(256)
+    worker = ConsensusAggregator()
+    worker.add(consensus_responses(1000, seed=1))
+    state = worker.state()
+
+    def materialize():
+        aggregator.add(batch[:1])
+        return aggregator.matrix()
+
+    return {
+        "consensus.add": measure(lambda: aggregator.add(batch), repeat=200, items=len(batch)),
+        "consensus.matrix": measure(aggregator.matrix, repeat=10_000),
+        "consensus.matrix.after_change": measure(materialize, repeat=1000),
+        "consensus.merge": measure(lambda: aggregator.merge(state), repeat=1000)
+    }
+
+
+def archive_rows(count, days=90, seed=0):
+    """Random rows of the feedback archive (feedback_archive.schema()), spread over the last days"""
+    import pyarrow as pa
+
+    from config import FEEDBACK_FIELDS, INTERVENTIONS
+    from feedback_archive import schema
+
+    generator = np.random.default_rng(seed)
+    interventions = list(INTERVENTIONS)
+    submitted_at = np.sort(time.time() - generator.uniform(0, days * 86400, count))
+    columns = {
+        "id": pa.array(np.arange(1, count + 1)),
+        "submission_id": pa.array(np.char.mod("%032x", np.arange(count))),
+        "submitted_at": pa.array(submitted_at),
+        "submitted_date": pa.array(submitted_at.astype("datetime64[s]").astype("datetime64[D]")),
+        "intervention": pa.array(np.array(interventions)[generator.integers(len(interventions), size=count)]),
+        "levels": pa.nulls(count, pa.string()),
+        "level": pa.array(generator.integers(0, 5, count).astype(np.int8))
+    }
+    for name, (kind, options) in FEEDBACK_FIELDS.items():
+        if kind == "choice":
+            columns[name] = pa.DictionaryArray.from_arrays(
+                pa.array(generator.integers(len(options), size=count).astype(np.int8)), pa.array(options)
+            )
+        elif kind == "choices":
+            columns[name] = pa.ListArray.from_arrays(pa.array(np.arange(count + 1) * 2, pa.int32()), pa.array(options[:2] * count))
+        elif kind == "integer":
+            columns[name] = pa.array(generator.integers(options[0], options[1] + 1, count).astype(np.int8))
+        elif kind == "flag":
+            columns[name] = pa.array(generator.random(count) < 0.5)
+        else:
+            columns[name] = pa.nulls(count, pa.string())
+    target = schema()
+    return pa.Table.from_arrays([columns[field.name].cast(field.type) for field in target], schema=target)
+
+
+def bench_archive(count=1_000_000):
+    """
+    Consensus queries over a columnar feedback archive of a million responses spread over
+    90 days: the whole archive, the last week, and the last week for two travel modes
+    """
+    import datetime
+    import shutil
+    import tempfile
+
+    try:
+        import pyarrow
+    except ImportError:
+        return {}
+
+    from feedback_archive import FeedbackArchive, filter_expression
+
+    directory = tempfile.mkdtemp()
+    try:
+        archive = FeedbackArchive(directory)
+        archive.append(archive_rows(count))
+        week = datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=7)
+        last_week = filter_expression(date_from=week)
+        walking = filter_expression(date_from=week, travel_mode=["Walk", "Bike"])
+        return {
+            "archive.consensus": measure(archive.consensus_matrix, repeat=10, warmup=1),
+            "archive.consensus.last_week": measure(lambda: archive.consensus_matrix(last_week), repeat=20, warmup=1),
+            "archive.consensus.last_week_travel_mode": measure(lambda: archive.consensus_matrix(walking), repeat=20, warmup=1)
+        }
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_assets():
+    """
+    Loading of every image under assets/ and of its served variant
+    (reading plus decoding when Pillow is installed)
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+
+    from asset_pipeline import AssetVariants
+
+    variants = AssetVariants()
+
+    def load(path):
+        with open(path, "rb") as image_file:
+            data = image_file.read()
+        if Image is not None:
+            with Image.open(path) as image:
+                image.load()
+        return data
+
+    results = {}
+    for name in sorted(os.listdir(ASSETS_DIR)):
+        path = os.path.join(ASSETS_DIR, name)
+        if not name.lower().endswith(IMAGE_EXTENSIONS) or not os.path.isfile(path):
+            continue
+        result = measure(lambda: load(path), repeat=20, warmup=2)
+        result["bytes"] = os.path.getsize(path)
+        result["decoded"] = Image is not None
+        results[f"assets.{name}"] = result
+
+        # The variant the app serves instead (see asset_pipeline.py), when it has been built
+        variant_path = variants.path(name)
+        if variant_path != path:
+            result = measure(lambda: load(variant_path), repeat=20, warmup=2)
+            result["bytes"] = os.path.getsize(variant_path)
+            result["source_bytes"] = os.path.getsize(path)
+            result["bytes_saved"] = result["source_bytes"] - result["bytes"]
+            result["decoded"] = Image is not None
+            results[f"assets.variant.{name}"] = result
+    return results
+
+
+def synthetic_layer(size, coverage, seed):
+    """
+    Sparse overlay the size of a base photo: opaque rectangles over up to coverage (a
+    fraction) of its pixels in the lower half, as drawn artwork of added stalls would be
+
+    Returns:
+    - RGBA PIL image
+    """
+    from PIL import Image, ImageDraw
+
+    rng = np.random.default_rng(seed)
+    width, height = size
+    layer = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    count = 8
+    box_width, box_height = int(width * coverage * 4 / count), height // 4
+    for left in rng.integers(0, width - box_width, count):
+        top = int(rng.integers(height // 2, height - box_height))
+        colour = tuple(int(value) for value in rng.integers(0, 256, 3))
+        draw.rectangle((left, top, left + box_width - 1, top + box_height - 1), fill=(*colour, 255))
+    return layer
+
+
+def bench_compositor(base="ppm-now.png", coverages=(0.05, 0.15)):
+    """
+    Rendering of composite transformation images without the render cache, from the base
+    photo and synthetic sparse overlays (one per coverage), written as WebP to a temporary
+    directory: the manifest serves photos, so no overlay artwork is tracked
+    """
+    import shutil
+    import tempfile
+
+    try:
+        from PIL import Image
+    except ImportError:
+        return {}
+
+    from compositor import Compositor
+
+    directory = tempfile.mkdtemp()
+    try:
+        shutil.copy(os.path.join(ASSETS_DIR, base), directory)
+        with Image.open(os.path.join(directory, base)) as image:
+            size = image.size
+        layers = []
+        for index, coverage in enumerate(coverages):
+            name = f"layer-{coverage:.2f}.webp"
+            synthetic_layer(size, coverage, seed=index).save(os.path.join(directory, name), "WEBP", quality=80, method=6)
+            layers.append(name)
+
+        compositor = Compositor(directory)
+        compositor.load(base, layers)
+        results = {}
+        for count in range(1, len(layers) + 1):
+            selected = tuple(layers[:count])
+            result = measure(lambda: compositor.render(base, selected), repeat=50, warmup=2)
+            result["layers"] = count
+            result["layer_bytes"] = sum(os.path.getsize(os.path.join(directory, name)) for name in selected)
+            results[f"compositor.{base}+{'+'.join(selected)}"] = result
+        return results
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_feedback(sessions=200, submissions=25, rate=2000, readers=4):
+    """
+    Load test of the feedback store: many sessions submitting at once while others read
+
+    The session threads submit independently at random times (Poisson arrivals at the
+    given total rate per second), without waiting for the database, like the Submit button. "submit" is the latency until a submission is
+    acknowledged (journaled and queued), "commit" until the writer thread has committed
+    it. Reader threads count the rows meanwhile, as dashboard reruns would. The
+    "locked_database" run repeats the submissions while another connection holds the
+    database's write lock, i.e. with storage stalled.
+    """
+    import random
+    import sqlite3
+    import tempfile
+    import threading
+
+    from config import FEEDBACK_FIELDS
+    from feedback_store import FeedbackStore, feedback_row
+
+    # A complete submission: the first option of every choice, every checkbox ticked, some text
+    values = {}
+    for name, (kind, options) in FEEDBACK_FIELDS.items():
+        if kind in ("choice", "integer"):
+            values[name] = options[0]
+        elif kind == "choices":
+            values[name] = options[:2]
+        else:
+            values[name] = True if kind == "flag" else "Benchmark submission"
+
+    def load(store):
+        start = threading.Barrier(sessions + readers + 1)
+        arrivals = random.Random(0)
+        submitting = threading.Event()
+        submit_latencies, commit_latencies, read_latencies = [], [], []
+
+        def session():
+            rows = [feedback_row(values, "Pop-up Market", {"seating_level": 1}) for _ in range(submissions)]
+            start.wait()
+            for row in rows:
+                time.sleep(arrivals.expovariate(rate / sessions))
+                call_start = time.perf_counter_ns()
+                future = store.submit(row)
+                submit_latencies.append(time.perf_counter_ns() - call_start)
+                future.add_done_callback(lambda _, call_start=call_start: commit_latencies.append(
+                    time.perf_counter_ns() - call_start
+                ))
+
+        def reader():
+            start.wait()
+            while submitting.is_set():
+                call_start = time.perf_counter_ns()
+                store.count()
+                read_latencies.append(time.perf_counter_ns() - call_start)
+
+        submitting.set()
+        threads = [threading.Thread(target=session) for _ in range(sessions)]
+        reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+        for thread in threads + reader_threads:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        submitting.clear()
+        for thread in reader_threads:
+            thread.join()
+        # Graceful flush: every queued row is committed before close() returns
+        store.close()
+        committed = time.perf_counter() - started
+        return submit_latencies, commit_latencies, read_latencies, elapsed, committed
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "feedback.sqlite3")
+        store = FeedbackStore(path)
+        submit_latencies, commit_latencies, read_latencies, elapsed, committed = load(store)
+        results["feedback.submit"] = summarize(submit_latencies, seconds=elapsed)
+        results["feedback.submit"]["sessions"] = sessions
+        results["feedback.commit"] = summarize(commit_latencies, seconds=committed)
+        results["feedback.commit"].update(batches=store.batches, rows=store.count())
+        results["feedback.count_during_submits"] = summarize(read_latencies)
+
+        store = FeedbackStore(path)
+        blocker = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        blocker.execute("BEGIN IMMEDIATE")
+        # Release the lock halfway through the load, so close() can flush
+        threading.Timer(submissions * sessions / rate / 2, lambda: blocker.execute("ROLLBACK")).start()
+        submit_latencies, _, _, elapsed, _ = load(store)
+        blocker.close()
+        results["feedback.submit.locked_database"] = summarize(submit_latencies, seconds=elapsed)
+        results["feedback.submit.locked_database"]["rows"] = store.count()
+    return results
+
+
+# Present in the temporary copy of the app that bench_app() runs in
+_APP_COPY_MARKER = ".benchmark_copy"
+
+# Read-only inputs the temporary copy links to instead of copying
+_APP_COPY_LINKS = ("assets", "build", "old")
+
+
+def bench_app():
+    """
+    Headless script runs of app.py through Streamlit's testing harness
+
+    The runs happen in a subprocess on a temporary copy of the app (sources, .streamlit and
+    links to the read-only assets), so the feedback database, archive and asset store they
+    create stay out of the checkout.
+    """
+    import shutil
+    import subprocess
+    import tempfile
+
+    root = os.path.dirname(APP_PATH)
+    if os.path.exists(os.path.join(root, _APP_COPY_MARKER)):
+        return _bench_app_runs()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name in os.listdir(root):
+            source = os.path.join(root, name)
+            if name.endswith(".py"):
+                shutil.copy2(source, directory)
+            elif name in _APP_COPY_LINKS:
+                os.symlink(source, os.path.join(directory, name))
+        shutil.copytree(os.path.join(root, ".streamlit"), os.path.join(directory, ".streamlit"))
+        os.makedirs(os.path.join(directory, "static"))
+        open(os.path.join(directory, _APP_COPY_MARKER), "w").close()
+
+        output = subprocess.run(
+            [sys.executable, os.path.join(directory, "benchmark.py"), "--only", "app"],
+            cwd=directory, capture_output=True, text=True, check=True
+        ).stdout
+    return json.loads(output)["benchmarks"]
+
+
+def _bench_app_runs():
+    from streamlit.testing.v1 import AppTest
+
+    def first_run():
+        app = AppTest.from_file(APP_PATH, default_timeout=60)
+        app.run()
+        if app.exception:
+            raise RuntimeError(f"app.py raised during the benchmark run: {app.exception[0].message}")
+
+    app = AppTest.from_file(APP_PATH, default_timeout=60)
+    app.run()
+
+    return {
+        "app.first_run": measure(first_run, repeat=5, warmup=1),
+        "app.rerun": measure(app.run, repeat=20, warmup=2)
+    }
+
+
+# Benchmark groups, in the order they are run
+BENCHMARKS = {
+    "metrics": bench_metrics,
+    "charts": bench_charts,
+    "consensus": bench_consensus,
+    "archive": bench_archive,
+    "assets": bench_assets,
+    "compositor": bench_compositor,
+    "feedback": bench_feedback,
+    "app": bench_app
+}
+
+
+def run_benchmarks(only=None):
+    """
+    Run the benchmark groups
+
+    Parameters:
+    - only: optional list of name prefixes (e.g. ["metrics", "charts.radar"]); other benchmarks are skipped
+
+    Returns:
+    - Dictionary with the environment and a "benchmarks" mapping of benchmark name -> measurement
+    """
+    results = {}
+    for group, bench in BENCHMARKS.items():
+        if only and not any(group.startswith(prefix.split(".")[0]) for prefix in only):
+            continue
+        for name, measurement in bench().items():
+            if not only or any(name.startswith(prefix) for prefix in only):
+                results[name] = measurement
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        },
+        "benchmarks": results
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD, statistic="p50_ms"):
+    """
+    Compare benchmark results against a baseline
+
+    Parameters:
+    - current, baseline: outputs of run_benchmarks
+    - threshold: allowed relative growth of the statistic, e.g. 0.2 for +20%
+    - statistic: latency statistic to compare
+
+    Returns:
+    - Dictionary of benchmark name -> {"baseline", "current", "change", "regression"};
+      benchmarks missing from either side are left out
+    """
+    comparison = {}
+    for name, measurement in current["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            continue
+        before = baseline["benchmarks"][name][statistic]
+        after = measurement[statistic]
+        change = after / before - 1 if before > 0 else 0.0
+        comparison[name] = {
+            "baseline": before,
+            "current": after,
+            "change": change,
+            "regression": change > threshold
+        }
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", help="write the results JSON here instead of stdout")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--save-baseline", help="also write the results to this baseline file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"allowed relative growth of the median latency (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--only", nargs="+", help="only run benchmarks whose names start with these prefixes")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.only)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        results["comparison"] = compare(results, baseline, args.threshold)
+        results["threshold"] = args.threshold
+        regressions = [name for name, entry in results["comparison"].items() if entry["regression"]]
+        results["regressions"] = regressions
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            baseline_file.write(output + "\n")
+
+    for name in regressions:
+        entry = results["comparison"][name]
+        print(f"REGRESSION {name}: {entry['baseline']:.3f} ms -> {entry['current']:.3f} ms ({entry['change']:+.0%})",
+              file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from config import CACHE_BUDGET_BYTES
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.py")
+
+_MISSING = object()
+
+
+def estimate_size(value):
+    """Approximate size in bytes of a cached value (its pickled size, or its length for str and bytes)"""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 1024
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with a memory budget
+
+    One instance is shared by every session of the server process. Entries are
+    evicted oldest-first once their estimated total size exceeds the budget; a
+    single value larger than the budget is returned but not stored. Values are
+    shared between sessions and must not be modified.
+    """
+
+    def __init__(self, budget_bytes=CACHE_BUDGET_BYTES, sizeof=estimate_size):
+        self.budget_bytes = budget_bytes
+        self.sizeof = sizeof
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Cached value for a key (marking it as recently used), or default"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        """Store a value, evicting least recently used entries to stay within the budget"""
+        size = self.sizeof(value) if size is None else size
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if size > self.budget_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.budget_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute, size=None):
+        """
+        Cached value for a key, computing and storing it on a miss
+
+        compute runs outside the lock, so concurrent misses on the same key may
+        each compute it; the results are identical and the last one is kept.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value, size)
+        return value
+
+    def invalidate(self, predicate=None):
+        """
+        Drop entries whose key matches predicate (all entries if it is None)
+
+        Returns:
+        - Number of entries dropped
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate is None or predicate(key)]
+            for key in keys:
+                self.bytes -= self._entries.pop(key)[1]
+            return len(keys)
+
+    def stats(self):
+        """Counters for monitoring: hits, misses, evictions, entries, bytes, budget_bytes"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "budget_bytes": self.budget_bytes
+            }
+
+
+class ModelVersion:
+    """
+    Content hash of config.py, the definition of every formula and coefficient
+
+    The file is re-hashed only when its modification time or size changes. When the
+    hash changes, the registered callbacks run (e.g. to invalidate a cache).
+    """
+
+    def __init__(self, path=CONFIG_PATH):
+        self.path = path
+        self._stat = None
+        self._digest = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def on_change(self, callback):
+        """Call callback(old_version, new_version) whenever the version changes"""
+        self._callbacks.append(callback)
+
+    def current(self):
+        stat = os.stat(self.path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._stat:
+            return self._digest
+        with self._lock:
+            with open(self.path, "rb") as config_file:
+                digest = hashlib.sha256(config_file.read()).hexdigest()[:16]
+            old, self._digest, self._stat = self._digest, digest, signature
+        if old is not None and old != digest:
+            for callback in self._callbacks:
+                callback(old, digest)
+        return digest
+
+
+def _freeze(value):
+    """Hashable form of parameter values (dicts become sorted tuples of items)"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+# Process-wide cache shared by all sessions, cleared whenever config.py changes
+CACHE = LRUCache()
+MODEL_VERSION = ModelVersion()
+MODEL_VERSION.on_change(lambda old, new: CACHE.invalidate())
+
+
+def cached(kind, intervention, params, compute):
+    """
+    Calculator output keyed on (kind, intervention, parameter values, model version)
+
+    Parameters:
+    - kind: name of the computation, e.g. "uncertainty"
+    - intervention: key of config.INTERVENTIONS, or None
+    - params: parameter values (dicts may be nested)
+    - compute: function of no arguments computing the value on a miss
+    """
+    key = (kind, intervention, _freeze(params), MODEL_VERSION.current())
+    return CACHE.get_or_compute(key, compute)
+
+
+def invalidate(kind):
+    """
+    Drop every cached value and figure of a kind, e.g. when the data it was computed from changed
+
+    Returns:
+    - Number of entries dropped
+    """
+    return CACHE.invalidate(lambda key: key[0] in (kind, ("figure", kind)))
+
+
+def cached_figure(kind, intervention, params, build):
+    """
+    Plotly figure keyed like cached(); st.plotly_chart serializes it on every render
+
+    Returns:
+    - plotly figure, shared between sessions (do not modify it)
+    """
+    return cached(("figure", kind), intervention, params, build)
@@ -0,0 +1,208 @@
+# Plotly is imported on first use so that app.py starts without it
+import numpy as np
+
+# Colors of the radar traces
+CURRENT_SELECTION_COLORS = ('rgba(31, 119, 180, 0.8)', 'rgba(31, 119, 180, 0.3)')
+COMBINED_SCENARIO_COLORS = ('rgba(44, 160, 44, 0.8)', 'rgba(44, 160, 44, 0.3)')
+BASELINE_COLORS = ('rgba(100, 100, 100, 0.3)', 'rgba(100, 100, 100, 0.1)')
+
+
+class FigureTemplate:
+    """
+    Plotly figure whose layout and static traces are built once; only one trace's values change
+
+    The figure is validated and expanded to a plain spec (a dict, including the resolved
+    layout template) when the template is created. Renders then only touch the values of
+    the patched trace:
+    - to_json() serializes the spec with the new values, sharing every static part
+    - chart_spec() is the spec with the new values to pass to st.plotly_chart
+    - figure() gives an independent go.Figure (e.g. one per session) that patch() updates
+      in place, validating only the patched values
+    Templates are shared between sessions; their spec must not be modified.
+    """
+
+    def __init__(self, figure, trace=0):
+        """
+        Parameters:
+        - figure: plotly go.Figure of the full chart
+        - trace: index of the trace whose values are patched
+        """
+        self.trace = trace
+        self.spec = figure.to_dict()
+
+    def to_dict(self, **values):
+        """Spec with the given attributes (e.g. r=[...]) of the patched trace replaced"""
+        data = list(self.spec["data"])
+        data[self.trace] = {**data[self.trace], **values}
+        return {**self.spec, "data": data}
+
+    def to_json(self, **values):
+        """JSON of the spec with the given attributes of the patched trace replaced"""
+        return figure_json(self.to_dict(**values))
+
+    def chart_spec(self, **values):
+        """
+        to_dict() without the resolved layout template, to pass to st.plotly_chart
+
+        Streamlit validates a dict spec in full, and validating the resolved template is most
+        of that work; without it, Plotly applies the default template (the one resolved when
+        the template was created) instead. The spec is copied by the validation, so the shared
+        spec is never modified.
+        """
+        spec = self.to_dict(**values)
+        layout = {name: value for name, value in spec["layout"].items() if name != "template"}
+        return {**spec, "layout": layout}
+
+    def figure(self):
+        """New go.Figure of the template, built from the validated spec without validating it again"""
+        import plotly.graph_objects as go
+
+        return go.Figure(self.spec, _validate=False)
+
+    def patch(self, figure, **values):
+        """Replace attributes of the patched trace of a figure() in place and return it"""
+        figure.data[self.trace].update(values)
+        return figure
+
+
+def figure_json(spec):
+    """
+    JSON of a figure spec, with orjson when it is installed
+
+    Returns:
+    - JSON string
+    """
+    try:
+        import orjson
+    except ImportError:
+        import plotly.io
+
+        return plotly.io.to_json(spec, validate=False)
+    return orjson.dumps(spec, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+
+_radar_templates = {}
+
+
+def radar_template(categories, name='Current Selection', colors=CURRENT_SELECTION_COLORS):
+    """
+    Process-wide FigureTemplate of a radar chart of trade-off values against the 50% baseline
+
+    The layout and the baseline trace are built once per set of categories; patch the r
+    values of the value trace (the first one).
+
+    Parameters:
+    - categories: axis labels
+    - name: legend name of the value trace
+    - colors: (line color, fill color) of the value trace
+    """
+    key = (tuple(categories), name, tuple(colors))
+    template = _radar_templates.get(key)
+    if template is None:
+        template = _radar_templates.setdefault(key, FigureTemplate(_radar_figure(key[0], name, colors)))
+    return template
+
+
+def _radar_figure(categories, name, colors):
+    import plotly.graph_objects as go
+
+    fig_radar = go.Figure()
+
+    # Add trace for current values (patched by every render)
+    fig_radar.add_trace(go.Scatterpolar(
+        r=[0] * len(categories),
+        theta=list(categories),
+        fill='toself',
+        name=name,
+        line=dict(color=colors[0]),
+        fillcolor=colors[1]
+    ))
+
+    # Add trace for baseline (50% on all metrics)
+    fig_radar.add_trace(go.Scatterpolar(
+        r=[50] * len(categories),
+        theta=list(categories),
+        fill='toself',
+        name='Baseline',
+        line=dict(color=BASELINE_COLORS[0]),
+        fillcolor=BASELINE_COLORS[1]
+    ))
+
+    # Update radar layout
+    fig_radar.update_layout(
+        polar=dict(
+            radialaxis=dict(
+                visible=True,
+                range=[0, 100]
+            )
+        ),
+        showlegend=True,
+        height=450,
+        margin=dict(l=80, r=80, t=40, b=40)
+    )
+    return fig_radar
+
+
+def build_radar_figure(categories, values, name='Current Selection', colors=CURRENT_SELECTION_COLORS):
+    """
+    Radar chart of trade-off values against the 50% baseline
+
+    Parameters:
+    - categories: axis labels
+    - values: 0-100 value per axis
+    - name: legend name of the value trace
+    - colors: (line color, fill color) of the value trace
+
+    Returns:
+    - plotly go.Figure, a new copy of the radar_template() with the values patched in
+    """
+    template = radar_template(categories, name, colors)
+    return template.patch(template.figure(), r=list(values))
+
+
+def build_consensus_heatmap(matrix, statistic="mean"):
+    """
+    Heatmap of a support statistic per intervention option and stakeholder
+
+    Hovering a cell shows its number of responses, mean, median and interquartile range of
+    support and of the rating, and polarization index.
+
+    Parameters:
+    - matrix: consensus.ConsensusMatrix; cells without responses are left blank
+    - statistic: "mean" or "median" support (0-100), or "polarization" index of support (0-1)
+
+    Returns:
+    - plotly figure
+    """
+    import plotly.express as px
+
+    values, label, zmax, scale = {
+        "mean": (matrix.support, "Mean Support", 100, "RdYlGn"),
+        "median": (matrix.support_quartiles[..., 1], "Median Support", 100, "RdYlGn"),
+        "polarization": (matrix.polarization, "Polarization", 1, "Purples")
+    }[statistic]
+    fig = px.imshow(
+        values,
+        labels=dict(x="Stakeholder", y="Intervention", color=label),
+        x=matrix.stakeholders,
+        y=matrix.options,
+        color_continuous_scale=scale,
+        zmin=0, zmax=zmax
+    )
+    fig.update_traces(
+        customdata=np.dstack([
+            matrix.counts, matrix.support, matrix.support_quartiles, matrix.rating_quartiles, matrix.polarization
+        ]),
+        hovertemplate=(
+            "%{y}<br>%{x} (%{customdata[0]} responses)<br>"
+            "Support: mean %{customdata[1]:.0f}, median %{customdata[3]:.0f}, IQR %{customdata[2]:.0f}-%{customdata[4]:.0f}<br>"
+            "Rating: median %{customdata[6]:.1f}, IQR %{customdata[5]:.1f}-%{customdata[7]:.1f}<br>"
+            "Polarization: %{customdata[8]:.2f}<extra></extra>"
+        )
+    )
+
+    fig.update_layout(
+        margin=dict(l=50, r=50, t=30, b=50),
+        height=400
+    )
+    return fig
@@ -0,0 +1,222 @@
+"""
+Before/after comparison slider that sends the base image once and then only changed tiles
+
+The transformation image is split into square tiles at the base image's size; the tiles
+that differ from the base form a compact difference mask, and only those are encoded
+(DeltaTiles). Deltas are cached in the process-wide image cache of image_manifest.py.
+
+In the browser, the transformation tiles are laid over the base image and revealed up
+to a draggable divider, without reruns. Each session keeps track of the images it has
+already sent, so a level change only sends the tiles the browser has not seen yet. When
+Streamlit serves static files, the base image is referenced by its URL in the
+content-addressed store (asset_store.py) and kept in the browser's HTTP cache.
+"""
+import io
+from collections import namedtuple
+
+import numpy as np
+
+from asset_store import static_serving_enabled
+from config import COMPARISON_THRESHOLD, COMPARISON_TILE_QUALITY, COMPARISON_TILE_SIZE
+from image_manifest import IMAGE_CACHE, image_id, image_key, webp_data_url
+
+# Changed tiles of a transformation image:
+# - width, height: size of the base image in px
+# - shape: rows and columns of the tile grid
+# - mask: the changed tiles of the grid, bit-packed row by row (np.packbits)
+# - tiles: (x, y, width, height, data URL) of every changed tile, in grid order, or a single
+#   tile of the whole image when that encodes smaller
+DeltaTiles = namedtuple("DeltaTiles", ["width", "height", "shape", "mask", "tiles"])
+
+SENT_STATE_KEY = "_comparison_sent"
+
+_CSS = """
+.comparison { position: relative; user-select: none; }
+.comparison img.base { display: block; width: 100%; }
+.comparison .after { position: absolute; inset: 0; pointer-events: none; }
+.comparison .after img { position: absolute; }
+.comparison .line { position: absolute; top: 0; bottom: 0; width: 2px; margin-left: -1px; background: white;
+                    box-shadow: 0 0 4px rgba(0, 0, 0, 0.6); pointer-events: none; }
+.comparison input { position: absolute; inset: 0; width: 100%; height: 100%; margin: 0; opacity: 0; cursor: ew-resize; }
+"""
+
+_JS = """
+// Images received by this page, by id; the server sends each one only once per session
+const images = new Map();
+
+export default function(component) {
+    const { data, parentElement, setTriggerValue } = component;
+    const items = [data.base, ...data.tiles];
+    for (const item of items) {
+        if (item.src) images.set(item.id, item.src);
+    }
+    const missing = items.filter((item) => !images.has(item.id)).map((item) => item.id);
+    if (missing.length) {
+        // e.g. after a page reload within the same session: ask for everything again
+        setTriggerValue("missing", missing);
+        return;
+    }
+
+    let root = parentElement.querySelector(".comparison");
+    if (!root) {
+        root = document.createElement("div");
+        root.className = "comparison";
+        root.innerHTML = '<img class="base" alt=""><div class="after"></div><div class="line"></div>'
+            + '<input type="range" min="0" max="100" step="0.5" value="50" aria-label="Reveal transformation">';
+        parentElement.appendChild(root);
+    }
+    const base = root.querySelector("img.base");
+    if (base.dataset.id !== data.base.id) {
+        base.src = images.get(data.base.id);
+        base.dataset.id = data.base.id;
+    }
+    root.querySelector(".after").replaceChildren(...data.tiles.map((tile) => {
+        const image = document.createElement("img");
+        image.src = images.get(tile.id);
+        image.style.left = `${100 * tile.x / data.width}%`;
+        image.style.top = `${100 * tile.y / data.height}%`;
+        image.style.width = `${100 * tile.w / data.width}%`;
+        image.style.height = `${100 * tile.h / data.height}%`;
+        return image;
+    }));
+
+    const divider = root.querySelector("input");
+    const update = () => {
+        root.querySelector(".after").style.clipPath = `inset(0 ${100 - divider.value}% 0 0)`;
+        root.querySelector(".line").style.left = `${divider.value}%`;
+    };
+    divider.oninput = update;
+    update();
+}
+"""
+
+_component = None
+
+
+def pixels(manifest, entry, size=None):
+    """
+    Image of an entry as an HxWx3 uint8 array, optionally resized to size (width, height)
+
+    Decoded arrays are cached in the image cache.
+    """
+    def decode():
+        from PIL import Image
+
+        image = manifest.image(entry)
+        if isinstance(image, np.ndarray):
+            decoded = Image.fromarray(image)
+        else:
+            decoded = Image.open(io.BytesIO(image)).convert("RGB")
+        if size is not None and decoded.size != tuple(size):
+            decoded = decoded.resize(size, Image.LANCZOS)
+        array = np.asarray(decoded)
+        array.setflags(write=False)
+        return array
+
+    key = ("pixels", image_key(entry), size)
+    array = IMAGE_CACHE.get(key)
+    if array is None:
+        array = decode()
+        IMAGE_CACHE.put(key, array, array.nbytes)
+    return array
+
+
+def difference_mask(before, after, tile_size=COMPARISON_TILE_SIZE, threshold=COMPARISON_THRESHOLD):
+    """
+    Tiles of a tile_size grid in which any pixel differs by more than threshold
+
+    Parameters:
+    - before, after: HxWx3 uint8 arrays of the same shape
+
+    Returns:
+    - Boolean array of (rows, columns) of the grid; edge tiles may be partial
+    """
+    changed = np.abs(after.astype(np.int16) - before.astype(np.int16)).max(axis=-1) > threshold
+    height, width = changed.shape
+    rows, columns = -(-height // tile_size), -(-width // tile_size)
+    padded = np.zeros((rows * tile_size, columns * tile_size), dtype=bool)
+    padded[:height, :width] = changed
+    return padded.reshape(rows, tile_size, columns, tile_size).any(axis=(1, 3))
+
+
+def delta_tiles(manifest, current, transformation, tile_size=COMPARISON_TILE_SIZE):
+    """
+    DeltaTiles of a transformation image against its current-state image, cached
+
+    Parameters:
+    - manifest: ImageManifest the entries belong to
+    - current, transformation: ImageEntry of the base and of the after image
+    """
+    key = ("delta", image_key(current), image_key(transformation), tile_size)
+
+    def compute():
+        before = pixels(manifest, current)
+        height, width = before.shape[:2]
+        after = pixels(manifest, transformation, (width, height))
+        mask = difference_mask(before, after, tile_size)
+        tiles = []
+        for row, column in zip(*np.nonzero(mask)):
+            y, x = row * tile_size, column * tile_size
+            tile = after[y:y + tile_size, x:x + tile_size]
+            tiles.append((int(x), int(y), tile.shape[1], tile.shape[0], webp_data_url(tile, COMPARISON_TILE_QUALITY)))
+        # Many small tiles compress worse than one image: send the whole frame if that is smaller
+        if len(tiles) > 1:
+            whole = webp_data_url(after, COMPARISON_TILE_QUALITY)
+            if len(whole) < sum(len(tile[4]) for tile in tiles):
+                tiles = [(0, 0, width, height, whole)]
+        return DeltaTiles(width, height, mask.shape, np.packbits(mask), tuple(tiles))
+
+    delta = IMAGE_CACHE.get(key)
+    if delta is None:
+        delta = compute()
+        IMAGE_CACHE.put(key, delta, delta.mask.nbytes + sum(len(tile[4]) for tile in delta.tiles))
+    return delta
+
+
+def payload(manifest, current, transformation, sent, use_urls=False):
+    """
+    Component data for one comparison
+
+    Parameters:
+    - sent: set of image ids the browser already has; updated with the ones included
+    - use_urls: reference the base image by its store URL (static serving is enabled)
+
+    Returns:
+    - {"width", "height", "base": {"id", "src"?}, "tiles": [{"id", "x", "y", "w", "h", "src"?}]}
+      with "src" only for images not sent before
+    """
+    delta = delta_tiles(manifest, current, transformation)
+    base_id = image_id(current)
+    base = {"id": base_id}
+    if use_urls:
+        base["src"] = manifest.url(current)
+    elif base_id not in sent:
+        base["src"] = manifest.data_url(current)
+        sent.add(base_id)
+
+    transformation_id = image_id(transformation)
+    tiles = []
+    for x, y, width, height, src in delta.tiles:
+        tile = {"id": f"{transformation_id}-{x}-{y}", "x": x, "y": y, "w": width, "h": height}
+        if tile["id"] not in sent:
+            tile["src"] = src
+            sent.add(tile["id"])
+        tiles.append(tile)
+    return {"width": delta.width, "height": delta.height, "base": base, "tiles": tiles}
+
+
+def comparison_slider(manifest, current, transformation, key):
+    """Show the comparison slider of two ImageEntry in the running Streamlit app"""
+    import streamlit as st
+    from streamlit.components.v2 import component
+
+    global _component
+    if _component is None:
+        _component = component("before_after_comparison", css=_CSS, js=_JS)
+
+    sent = st.session_state.setdefault(SENT_STATE_KEY, set())
+    _component(
+        key=key,
+        data=payload(manifest, current, transformation, sent, static_serving_enabled()),
+        on_missing_change=lambda: st.session_state[SENT_STATE_KEY].clear()
+    )
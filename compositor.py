@@ -0,0 +1,109 @@
+"""
+Procedural transformation images: transparent overlays alpha-blended onto a base photo
+
+Instead of one photo per combination of levels, an intervention can ship its base "now"
+photo and one overlay per parameter level, e.g. assets/layers/*.webp with only the added
+stalls or artwork opaque. A transformation image is the base with the overlay of every
+selected level blended on top, in the order of the manifest's "layers"
+(config.IMAGE_MANIFEST). Renders are memoized per combination in the process-wide image
+cache of image_manifest.py.
+
+The current interventions are photographed after states, so the manifest serves those
+photos and nothing is composited yet; benchmark.py measures renders with synthetic layers.
+"""
+import os
+
+import numpy as np
+
+from config import ASSET_DISPLAY_WIDTH
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.join(ROOT_DIR, "assets")
+
+
+class Compositor:
+    """
+    Blends overlays onto base images at the display width
+
+    Decoded images are kept for the lifetime of the process as float32 arrays (overlays
+    premultiplied by their alpha and cropped to their opaque region), so a render is
+    only the vectorized blending of the selected layers.
+    """
+
+    def __init__(self, assets_dir=ASSETS_DIR, width=ASSET_DISPLAY_WIDTH):
+        self.assets_dir = assets_dir
+        self.width = width
+        self._bases = {}
+        self._layers = {}
+
+    def _open(self, name, size=None):
+        from PIL import Image
+
+        with Image.open(os.path.join(self.assets_dir, name)) as image:
+            if size is None:
+                width = min(self.width, image.width)
+                size = (width, max(1, round(image.height * width / image.width)))
+            return image.resize(size, Image.LANCZOS) if size != image.size else image.copy()
+
+    def base(self, name):
+        """Base photo as an HxWx3 float32 array, no wider than the display width"""
+        if name not in self._bases:
+            self._bases[name] = np.asarray(self._open(name).convert("RGB"), dtype=np.float32)
+        return self._bases[name]
+
+    def layer(self, name, base):
+        """
+        Overlay scaled to a base photo
+
+        Returns:
+        - (rows, columns, premultiplied RGB, 1 - alpha) of the bounding box of its visible
+          pixels, or None for a fully transparent overlay
+        """
+        if (name, base) not in self._layers:
+            height, width = self.base(base).shape[:2]
+            rgba = np.asarray(self._open(name, (width, height)).convert("RGBA"), dtype=np.float32)
+            alpha = rgba[..., 3:] / 255
+            rows = np.flatnonzero(alpha.any(axis=(1, 2)))
+            columns = np.flatnonzero(alpha.any(axis=(0, 2)))
+            if rows.size:
+                box = (slice(rows[0], rows[-1] + 1), slice(columns[0], columns[-1] + 1))
+                self._layers[name, base] = (*box, rgba[box][..., :3] * alpha[box], 1 - alpha[box])
+            else:
+                self._layers[name, base] = None
+        return self._layers[name, base]
+
+    def render(self, base, layers):
+        """
+        Base photo with the given overlays blended on top, in order
+
+        Returns:
+        - Read-only HxWx3 uint8 array
+        """
+        image = self.base(base).copy()
+        for name in layers:
+            layer = self.layer(name, base)
+            if layer is not None:
+                rows, columns, premultiplied, transparency = layer
+                region = image[rows, columns]
+                region *= transparency
+                region += premultiplied
+        image = np.rint(image, out=image).astype(np.uint8)
+        image.setflags(write=False)
+        return image
+
+    def load(self, base, layers):
+        """Decode a base photo and its overlays ahead of the first render"""
+        for name in layers:
+            self.layer(name, base)
+
+
+_compositor = None
+
+
+def compositor():
+    """Process-wide Compositor, created on first use"""
+    global _compositor
+    if _compositor is None:
+        _compositor = Compositor()
+    return _compositor
+
@@ -95,9 +95,6 @@
 #     "Pop-up Art Installation": calculate_mobility_metrics_simplified
 # }
 
-
-from metrics import calculate_public_seating_metrics_simplified, calculate_mobility_metrics_simplified
-
 # Global definitions
 CATEGORICAL_LABELS = {
     0: "None",
@@ -184,12 +181,327 @@ METRIC_DISPLAY_CONFIG = {
             ("space_text", "{}", "Space Utilization"),
             ("economic_text", "{}", "Economic Value"),  
             ("community_text", "{}", "Community Engagement")
-        ]
+        ],
+        # Numeric output behind each text metric, and its format, for the uncertainty range
+        "uncertainty_outputs": {
+            "space_text": ("pedestrian_activity", "{:.0f}"),
+            "economic_text": ("economic_activity", "{:.0f}"),
+            "community_text": ("community_engagement", "{:.0f}")
+        }
+    },
+}
+
+# Memory budget of the process-wide cache of calculator outputs and figures shared by all sessions (cache.py)
+CACHE_BUDGET_BYTES = 64 * 1024 * 1024
+
+# Before/after images shown by app.py per intervention (image_manifest.py)
+# - levels: the parameters that select the image, in key order
+# - current: (asset, caption) of the current state
+# - transformations: level tuple -> (asset, caption); an asset of None renders the combination
+#   from the base and layers (compositor.py)
+# - pattern / caption: optional templates for combinations without an explicit entry, e.g.
+#   "s{seating_level}-p{plaza_level}.png" and "{seating_level:label} Seating Added"; ":label" formats a
+#   level with CATEGORICAL_LABELS. Without a pattern, such combinations are rendered from the layers.
+# - base / layers: base photo and, in stacking order, (level name, {level: overlay asset}) pairs, for
+#   interventions drawn as transparent overlay artwork (e.g. "layers/market-stalls.webp")
+# The manifest is validated at startup: every combination must resolve to an existing asset.
+IMAGE_MANIFEST = {
+    "Pop-up Market": {
+        "levels": ("seating_level",),
+        "current": ("ppm-now.png", "Current State"),
+        "transformations": {
+            (0,): ("ppm-now.png", "No Market Setup"),
+            (1,): ("ppm-after2.png", "Minimal Market Added"),
+            (2,): ("ppm-after.png", "Extensive Market Added")
+        }
+    },
+    "Pop-up Art Installation": {
+        "levels": ("bike_lane_level",),
+        "current": ("ppa-now.png", "Current State"),
+        "transformations": {
+            (0,): ("ppa-now.png", "No Art Installation Added"),
+            (1,): ("ppa-after.png", "No Art Installation, Minimal Bike-sharing"),
+            (2,): ("ppa-after2.png", "Minimal Art Installation with Bike-sharing Features")
+        }
+    }
+}
+
+# Memory budget of the process-wide cache of image bytes shown by app.py (image_manifest.py)
+IMAGE_CACHE_BUDGET_BYTES = 16 * 1024 * 1024
+
+# Tiles of the before/after comparison slider (comparison.py): only tiles that differ from the base are sent
+COMPARISON_TILE_SIZE = 64     # px
+COMPARISON_THRESHOLD = 24     # per-pixel difference (0-255) above which a tile counts as changed
+COMPARISON_TILE_QUALITY = 80  # WebP quality of the tiles
+
+# Responsive image variants built from assets/ by asset_pipeline.py
+ASSET_VARIANT_WIDTHS = (320, 640, 960, 1280)  # px; never wider than the source
+ASSET_VARIANT_FORMATS = ("avif", "webp")       # served in this order of preference on equal size
+ASSET_VARIANT_QUALITY = {"avif": 60, "webp": 80}
+ASSET_DISPLAY_WIDTH = 640                      # px of the image columns; the smallest variant at least this wide is served
+ASSET_PLACEHOLDER_WIDTH = 24                   # px of the blurred placeholder shown while an image loads
+ASSET_NEAR_DUPLICATE_DISTANCE = 8              # differing bits (of 256) of the difference hashes of near-duplicate assets
+
+# Fields of the Feedback tab, in form order, as stored by feedback_store.py: column -> (kind, options)
+# - "choice": one of the options
+# - "choices": any subset of the options (stored as a JSON array)
+# - "integer": whole number in the (min, max) options
+# - "flag": checkbox (options unused)
+# - "text": free text of at most FEEDBACK_TEXT_MAX_CHARS characters (options unused)
+FEEDBACK_FIELDS = {
+    "stakeholder_type": ("choice", ["Resident", "Business Owner", "Community Organization", "LICP Official",
+                                    "Municipal Department", "Investor", "Arts Organization", "Other"]),
+    "rating": ("integer", (0, 10)),
+    "support_level": ("choice", ["Strongly Support", "Support", "Neutral", "Oppose", "Strongly Oppose"]),
+    "valued_aspects": ("choices", ["Community Character", "Economic Benefits", "Sustainability",
+                                   "Accessibility", "Safety", "Visual Appeal", "Cultural Significance"]),
+    "implementation_features": ("choices", ["Weather Protection", "Local Vendor Priority", "Cultural Elements",
+                                            "Safety Features", "Accessibility", "Environmental Considerations"]),
+    "priority_economic_development": ("integer", (1, 5)),
+    "priority_community_character": ("integer", (1, 5)),
+    "priority_pedestrian_experience": ("integer", (1, 5)),
+    "priority_environmental_benefits": ("integer", (1, 5)),
+    "priority_cost_efficiency": ("integer", (1, 5)),
+    "suggestions": ("text", None),
+    "location_subway_stations": ("flag", None),
+    "location_commercial_corridors": ("flag", None),
+    "location_residential_buildings": ("flag", None),
+    "location_public_spaces": ("flag", None),
+    "location_gateways": ("flag", None),
+    "location_highway_overpasses": ("flag", None),
+    "concerns": ("text", None),
+    "tradeoff_maintenance_costs": ("flag", None),
+    "tradeoff_congestion": ("flag", None),
+    "tradeoff_noise": ("flag", None),
+    "tradeoff_space_constraints": ("flag", None),
+    "tradeoff_weather_vulnerability": ("flag", None),
+    "tradeoff_equitable_access": ("flag", None),
+    "visit_frequency": ("choice", ["Daily", "A few times per week", "Weekly", "Monthly", "Rarely", "Never"]),
+    "visit_purpose": ("choices", ["Work", "Shopping", "Dining", "Entertainment", "Art/Culture",
+                                  "Recreation", "Passing through", "Resident"]),
+    "travel_mode": ("choice", ["Walk", "Subway", "Bus", "Bike", "Car", "Taxi/Rideshare", "Multiple modes"]),
+    "visit_time": ("choice", ["Morning (6AM-10AM)", "Midday (10AM-2PM)", "Afternoon (2PM-6PM)",
+                              "Evening (6PM-10PM)", "Night (10PM-6AM)", "Varies"]),
+    "engagement_workshops": ("flag", None),
+    "engagement_updates": ("flag", None),
+    "engagement_volunteering": ("flag", None),
+    "engagement_future_feedback": ("flag", None),
+    "contact_name": ("text", None),
+    "contact_email": ("text", None),
+    "contact_organization": ("text", None),
+    "contact_zip_code": ("text", None)
+}
+FEEDBACK_TEXT_MAX_CHARS = 5000
+
+# Support (%) counted for each answer to "Would you support implementing this intervention?" (consensus.py)
+SUPPORT_LEVEL_SCORES = {
+    "Strongly Support": 100,
+    "Support": 75,
+    "Neutral": 50,
+    "Oppose": 25,
+    "Strongly Oppose": 0
+}
+CONSENSUS_AGREEMENT_SUPPORT = 70   # support (%) every stakeholder type must reach for strong agreement
+CONSENSUS_DIVERGENCE_SPREAD = 30   # support points between stakeholder types from which an option divides them
+CONSENSUS_POLARIZATION_INDEX = 0.7   # polarization index (0-1) from which a stakeholder type is split
+CONSENSUS_POLARIZATION_MIN_RESPONSES = 5   # responses a stakeholder type needs before it can count as split
+
+# Feedback store (feedback_store.py): submissions are journaled, queued and written by one thread in batches
+FEEDBACK_BATCH_SIZE = 256               # most submissions per transaction
+FEEDBACK_QUEUE_CAPACITY = 10_000        # most submissions waiting to be written
+FEEDBACK_BACKPRESSURE_TIMEOUT = 0.005   # s a submission waits for room in a full queue before it is refused
+FEEDBACK_JOURNAL_SYNC = False           # also fdatasync the journal (survives power loss, but submitting waits for the disk)
+FEEDBACK_JOURNAL_ROTATE_BYTES = 4 << 20   # committed bytes at the head of the journal from which it is rewritten without them
+FEEDBACK_RETRY_DELAY = 1                # s between attempts to write to an unavailable database
+FEEDBACK_SHUTDOWN_TIMEOUT = 10          # s spent writing queued submissions at exit; the rest stay journaled
+
+# Feedback archive (feedback_archive.py): committed submissions compacted into partitioned Parquet files
+FEEDBACK_ARCHIVE_INTERVAL = 600                # s between runs of the compaction job
+FEEDBACK_ARCHIVE_IN_APP = True                 # run the compaction job in a thread of the app (turn off when running feedback_archive.py --interval)
+FEEDBACK_ARCHIVE_BATCH_ROWS = 100_000          # most rows converted at once (bounds the job's memory)
+FEEDBACK_ARCHIVE_ROW_GROUP_ROWS = 65_536       # rows per Parquet row group, the unit filters skip by statistics
+
+# Metric formulas for each intervention, declared as data and compiled once
+# into vectorized NumPy functions (see formulas.py).
+# - levels: calculator level argument -> (physical quantity, quantity at level 0, 1, 2)
+# - constants: named numbers
+# - intermediates: named sub-expressions shared between outputs
+# - outputs: result dictionary; each value is an expression or a nested group
+# - labels: text output -> (level argument, text at level 0, 1, 2)
+# Expressions may use numbers, quantities, constants, intermediates,
+# + - * / and parentheses, min(...) and max(...).
+METRIC_FORMULAS = {
+    "Pop-up Market": {
+        "levels": {
+            "seating_level": ("market_count", [0, 2, 5]),  # None, Minimal (2 stalls), Extensive (5 stalls)
+            "plaza_level": ("plaza_count", [0, 1, 3])      # None, Minimal (1 plaza), Extensive (3 plazas)
+        },
+        "constants": {
+            # Base metrics (minimum values even with zero intervention)
+            "base_dwell_time": 5,
+            "base_foot_traffic": 120,
+            "base_space_utilization": 10,
+
+            "plaza_multiplier": 3,  # Plazas have 3x impact
+
+            # Effect of one unit of market / plaza impact on each metric
+            "dwell_per_market": 0.8,
+            "dwell_per_plaza": 2.5,
+            "traffic_per_market": 5,
+            "traffic_per_plaza": 25,
+            "utilization_per_market": 1.2,
+            "utilization_per_plaza": 5,
+
+            # Effect of one unit of market / plaza impact on each trade-off axis
+            "engagement_per_market": 1.5,
+            "engagement_per_plaza": 4,
+            "clearance_per_market": 0.8,
+            "clearance_per_plaza": 2.5,
+            "safety_per_market": 0.7,
+            "safety_per_plaza": 2,
+            "visibility_per_market": 1.2,
+            "visibility_per_plaza": 3,
+            "cost_per_market": 0.5,
+            "cost_per_plaza": 3
+        },
+        "intermediates": {
+            "market_impact": "market_count",
+            "plaza_impact": "plaza_count * plaza_multiplier",
+            "dwell_time": "base_dwell_time + (market_impact * dwell_per_market) + (plaza_impact * dwell_per_plaza)",
+            "foot_traffic": "base_foot_traffic + (market_impact * traffic_per_market) + (plaza_impact * traffic_per_plaza)",
+            "space_utilization": "min(95, base_space_utilization + (market_impact * utilization_per_market) + (plaza_impact * utilization_per_plaza))"
+        },
+        "outputs": {
+            "metrics": {
+                "Pedestrian Dwell Time (min)": "dwell_time",
+                "Business Foot Traffic (people/hr)": "foot_traffic",
+                "Public Space Utilization (%)": "space_utilization"
+            },
+            # Ratio of each metric to its base value, formatted for display by metrics.py
+            "increase_ratios": {
+                "Pedestrian Dwell Time": "dwell_time / base_dwell_time",
+                "Business Foot Traffic": "foot_traffic / base_foot_traffic",
+                "Public Space Utilization": "space_utilization / base_space_utilization"
+            },
+            # Trade-off metrics (0-100 scale for radar chart)
+            "tradeoffs": {
+                "Community Engagement": "min(100, 40 + (market_impact * engagement_per_market) + (plaza_impact * engagement_per_plaza))",
+                "Sidewalk Clearance": "max(0, 90 - (market_impact * clearance_per_market) - (plaza_impact * clearance_per_plaza))",  # Negative impact
+                "Pedestrian Safety": "min(100, 60 + (market_impact * safety_per_market) + (plaza_impact * safety_per_plaza))",
+                "Business Visibility": "min(100, 50 + (market_impact * visibility_per_market) + (plaza_impact * visibility_per_plaza))",
+                "Cost Efficiency": "max(0, 85 - (market_impact * cost_per_market) - (plaza_impact * cost_per_plaza))"  # Negative impact
+            }
+        }
     },
+    "Pop-up Art Installation": {
+        "levels": {
+            "bike_lane_level": ("art_lane_coverage", [0, 30, 75]),          # % coverage
+            "bike_parking_level": ("art_display_spots", [0, 15, 40]),       # spots
+            "bike_share_level": ("interactive_art_stations", [0, 2, 6])     # stations
+        },
+        "labels": {
+            "space_text": ("bike_lane_level", ["Limited", "Improved", "Optimal"]),
+            "economic_text": ("bike_share_level", ["Basic", "Enhanced", "Maximum"]),
+            "community_text": ("bike_parking_level", ["Minimal", "Regular", "Vibrant"])
+        },
+        "constants": {
+            # Base metrics (values with no installation)
+            "base_pedestrian_activity": 30,
+            "base_economic_activity": 35,
+            "base_community_engagement": 20,
+
+            # Effect of one % of lane coverage / display spot / interactive station on each metric
+            "activity_per_coverage": 0.5,
+            "economic_per_station": 4,
+            "engagement_per_spot": 0.5,
+
+            # Effect of one % of lane coverage / display spot / interactive station on each trade-off
+            "safety_per_coverage": 0.3,
+            "safety_per_spot": 0.2,
+            "safety_per_station": 2.5,
+            "traffic_per_coverage": 0.1,
+            "traffic_per_station": 2.5,
+            "access_per_spot": 0.5,
+            "access_per_station": 4,
+            "cost_per_coverage": 0.2,
+            "cost_per_spot": 0.3,
+            "cost_per_station": 5,
+            "support_per_coverage": 0.4,
+            "support_per_spot": 0.1,
+            "support_per_station": 1.5
+        },
+        "outputs": {
+            # Original metrics for backward compatibility
+            "pedestrian_activity": "base_pedestrian_activity + (art_lane_coverage * activity_per_coverage)",
+            "economic_activity": "base_economic_activity + (interactive_art_stations * economic_per_station)",
+            "community_engagement": "base_community_engagement + (art_display_spots * engagement_per_spot)",
+
+            # Metrics for trade-offs tab, capped at 100
+            "pedestrian_safety": "min(100, 40 + (art_lane_coverage * safety_per_coverage) + (art_display_spots * safety_per_spot) + (interactive_art_stations * safety_per_station))",
+            "traffic_flow": "min(100, 70 - (art_lane_coverage * traffic_per_coverage) + (interactive_art_stations * traffic_per_station))",  # Coverage has a negative impact
+            "business_access": "min(100, 50 + (art_display_spots * access_per_spot) + (interactive_art_stations * access_per_station))",
+            "cost_efficiency": "min(100, 90 - (art_lane_coverage * cost_per_coverage) - (art_display_spots * cost_per_spot) - (interactive_art_stations * cost_per_station))",  # Negative impact
+            "community_support": "min(100, 40 + (art_lane_coverage * support_per_coverage) + (art_display_spots * support_per_spot) + (interactive_art_stations * support_per_station))"
+        }
+    }
 }
 
+from metrics import (
+    calculate_public_seating_metrics_simplified, calculate_mobility_metrics_simplified,
+    calculate_public_seating_metrics_batch, calculate_mobility_metrics_batch,
+    calculate_public_seating_metrics_from_quantities, calculate_mobility_metrics_from_quantities
+)
+
 # Simplified calculators mapping
 SIMPLIFIED_CALCULATORS = {
     "Pop-up Market": calculate_public_seating_metrics_simplified,
     "Pop-up Art Installation": calculate_mobility_metrics_simplified
-}
\ No newline at end of file
+}
+
+# Vectorized calculators mapping (arrays of levels in, columns of results out)
+BATCH_CALCULATORS = {
+    "Pop-up Market": calculate_public_seating_metrics_batch,
+    "Pop-up Art Installation": calculate_mobility_metrics_batch
+}
+
+# Continuous calculators mapping (physical quantities such as stall counts or coverage % in)
+QUANTITY_CALCULATORS = {
+    "Pop-up Market": calculate_public_seating_metrics_from_quantities,
+    "Pop-up Art Installation": calculate_mobility_metrics_from_quantities
+}
+
+# Shared trade-off axes for combined scenarios: axis -> {intervention: path to its trade-off output}
+COMBINED_TRADEOFF_AXES = {
+    "Community Engagement": {
+        "Pop-up Market": ("tradeoffs", "Community Engagement"),
+        "Pop-up Art Installation": ("community_support",)
+    },
+    "Pedestrian Safety": {
+        "Pop-up Market": ("tradeoffs", "Pedestrian Safety"),
+        "Pop-up Art Installation": ("pedestrian_safety",)
+    },
+    "Business Visibility": {
+        "Pop-up Market": ("tradeoffs", "Business Visibility"),
+        "Pop-up Art Installation": ("business_access",)
+    },
+    "Cost Efficiency": {
+        "Pop-up Market": ("tradeoffs", "Cost Efficiency"),
+        "Pop-up Art Installation": ("cost_efficiency",)
+    },
+    "Sidewalk Clearance": {
+        "Pop-up Market": ("tradeoffs", "Sidewalk Clearance")
+    },
+    "Traffic Flow": {
+        "Pop-up Art Installation": ("traffic_flow",)
+    }
+}
+
+# Pairwise synergies between interventions implemented together:
+# points added to a combined trade-off axis when both are at full intensity (every slider at Extensive)
+INTERVENTION_SYNERGIES = {
+    ("Pop-up Market", "Pop-up Art Installation"): {
+        "Community Engagement": 8,  # Community Hubs: art near markets creates natural gathering points
+        "Business Visibility": 5,   # Experience Points: art along market routes draws visitors past businesses
+        "Cost Efficiency": 4        # Shared Maintenance: combined implementations share resources and costs
+    }
+}
@@ -0,0 +1,416 @@
+"""
+Incremental aggregation of feedback support into the Consensus Dashboard's matrix
+
+Usage:
+    python consensus.py [--statistic {mean,median,polarization}]
+
+The matrix has a row per intervention option (an intervention at a level of its first
+parameter, e.g. "Pop-up Market - Minimal") and a column per stakeholder type. Each cell
+keeps a histogram of its answers on the 5-point support scale and one of its 0-10
+ratings: adding a response increments one bin of each, and a cell's memory never grows
+with the number of responses. As both scales are small and discrete, the histograms are
+exact quantile sketches: medians, quartiles, means and the polarization index are read
+from them, and histograms of disjoint responses merge by addition (e.g. those of other
+worker processes, see state() and merge()).
+
+After every batch the feedback store commits, only the new rows are read (by id) and
+added, so the cost of an update is proportional to the new responses, never to all of
+them. The statistics are materialized on change; the dashboard reads them without any
+computation. recompute() rebuilds everything from the raw store, e.g. after a restore.
+"""
+import argparse
+import os
+import sys
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from config import (
+    CATEGORICAL_LABELS, CONSENSUS_AGREEMENT_SUPPORT, CONSENSUS_DIVERGENCE_SPREAD, CONSENSUS_POLARIZATION_INDEX,
+    CONSENSUS_POLARIZATION_MIN_RESPONSES, FEEDBACK_FIELDS, INTERVENTIONS, SUPPORT_LEVEL_SCORES
+)
+
+# Materialized state of the aggregation; every array is read-only and indexed by (option, stakeholder):
+# - version: increases whenever a response is counted
+# - options, stakeholders: row and column labels
+# - counts: responses per cell
+# - support: mean support (0-100), NaN without responses
+# - support_quartiles, rating_quartiles: (..., 3) first quartile, median and third quartile of
+#   the support (0-100) and of the rating (0-10), NaN without responses
+# - polarization: polarization index of the support (0-1, see polarization()), NaN without responses
+# - support_histogram: (..., 5) responses per support score in SUPPORT_SCORES order
+# - rating_histogram: (..., 11) responses per rating in RATINGS order
+ConsensusMatrix = namedtuple("ConsensusMatrix", [
+    "version", "options", "stakeholders", "counts", "support", "support_quartiles", "rating_quartiles",
+    "polarization", "support_histogram", "rating_histogram"
+])
+
+# Bin values of the histograms, ascending
+SUPPORT_SCORES = np.array(sorted(SUPPORT_LEVEL_SCORES.values()))
+RATINGS = np.arange(FEEDBACK_FIELDS["rating"][1][0], FEEDBACK_FIELDS["rating"][1][1] + 1)
+
+_SUPPORT_BINS = {level: int(np.searchsorted(SUPPORT_SCORES, score)) for level, score in SUPPORT_LEVEL_SCORES.items()}
+_COLUMNS = ("intervention", "levels", "stakeholder_type", "support_level", "rating")
+
+
+class ConsensusError(ValueError):
+    """Raised when merging the state of an aggregator over other options, stakeholders or scales"""
+
+
+def intervention_options(interventions=INTERVENTIONS):
+    """
+    Rows of the consensus matrix
+
+    Returns:
+    - List of (intervention, level parameter, level, label) for every level of the first
+      parameter of each intervention
+    """
+    options = []
+    for intervention, spec in interventions.items():
+        name, parameter = next(iter(spec["parameters"].items()))
+        for level in range(parameter["min"], parameter["max"] + 1):
+            options.append((intervention, name, level, f"{intervention} - {CATEGORICAL_LABELS[level]}"))
+    return options
+
+
+def histogram_quantiles(histogram, values, quantiles):
+    """
+    Quantiles of the distributions given by histograms
+
+    A quantile that falls exactly between two responses is the mean of both, like the
+    median of an even number of values.
+
+    Parameters:
+    - histogram: (..., bins) array of counts
+    - values: ascending values of the bins
+    - quantiles: sequence of quantiles in [0, 1]
+
+    Returns:
+    - (..., len(quantiles)) float array, NaN where a histogram is empty
+    """
+    cumulative = np.cumsum(histogram, axis=-1)
+    total = cumulative[..., -1:]
+    ranks = total * np.asarray(quantiles, dtype=float)
+    # First bins whose cumulative count reaches, and exceeds, each rank
+    lower = (cumulative[..., None, :] < ranks[..., None]).sum(axis=-1).clip(max=len(values) - 1)
+    upper = (cumulative[..., None, :] <= ranks[..., None]).sum(axis=-1).clip(max=len(values) - 1)
+    result = (values[lower] + values[upper]) / 2
+    result[np.broadcast_to(total == 0, result.shape)] = np.nan
+    return result
+
+
+def polarization(histogram):
+    """
+    Polarization index of ordinal distributions (Leik's ordinal dispersion)
+
+    0 when every response is the same answer, 1 when they are split evenly between the two
+    extremes, e.g. 0.6 for answers spread evenly over a 5-point scale.
+
+    Parameters:
+    - histogram: (..., bins) array of counts, bins in scale order
+
+    Returns:
+    - (...) float array, NaN where a histogram is empty
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cumulative = np.cumsum(histogram, axis=-1)[..., :-1] / histogram.sum(axis=-1, keepdims=True)
+    return 2 * np.minimum(cumulative, 1 - cumulative).sum(axis=-1) / (histogram.shape[-1] - 1)
+
+
+class ConsensusAggregator:
+    """
+    Support and rating histograms per (intervention option, stakeholder type)
+
+    Thread-safe: the feedback store's writer thread adds rows while sessions read matrix().
+    """
+
+    def __init__(self, store=None):
+        """
+        Parameters:
+        - store: FeedbackStore to aggregate; its committed rows are read at once, and its
+          later commits as they happen
+        """
+        options = intervention_options()
+        self.options = [label for *_, label in options]
+        self.stakeholders = list(FEEDBACK_FIELDS["stakeholder_type"][1])
+        self._rows = {(intervention, level): row for row, (intervention, _, level, _) in enumerate(options)}
+        self._level_names = {intervention: name for intervention, name, _, _ in options}
+        self._columns = {stakeholder: column for column, stakeholder in enumerate(self.stakeholders)}
+
+        self.store = store
+        # _lock guards the histograms and the materialized matrix; _refresh_lock orders reads of the store
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._callbacks = []
+        self._version = 0
+        self._reset()
+        if store is not None:
+            self.refresh()
+            store.on_commit(self.refresh)
+
+    def _reset(self):
+        shape = (len(self.options), len(self.stakeholders))
+        self._support_histogram = np.zeros(shape + (len(SUPPORT_SCORES),), dtype=np.int64)
+        self._rating_histogram = np.zeros(shape + (len(RATINGS),), dtype=np.int64)
+        self._last_id = 0
+        self._matrix = None
+
+    def on_change(self, callback):
+        """Call callback(old_version, new_version) whenever the matrix changes"""
+        self._callbacks.append(callback)
+
+    def add(self, rows):
+        """
+        Add responses to the histograms; O(1) per response
+
+        Parameters:
+        - rows: dictionaries with the intervention, levels, stakeholder_type, support_level
+          and rating of a feedback row (and its "id" when read from the store); responses
+          without an intervention are skipped, a missing rating is not counted
+
+        Returns:
+        - Whether the matrix changed
+        """
+        with self._lock:
+            change = self._apply(rows) and self._bump()
+        return self._notify(change)
+
+    def _apply(self, rows):
+        """Add rows to the histograms (lock held); returns whether any was counted"""
+        changed = False
+        rating_offset = RATINGS[0]
+        for row in rows:
+            self._last_id = max(self._last_id, row.get("id", 0))
+            cell = self._cell(row)
+            if cell is not None:
+                self._support_histogram[cell + (_SUPPORT_BINS[row["support_level"]],)] += 1
+                if row.get("rating") is not None:
+                    self._rating_histogram[cell + (row["rating"] - rating_offset,)] += 1
+                changed = True
+        return changed
+
+    def _bump(self):
+        """Start a new version of the matrix (lock held); returns (old version, new version)"""
+        self._version += 1
+        self._matrix = None
+        return self._version - 1, self._version
+
+    def _notify(self, change):
+        if change:
+            for callback in self._callbacks:
+                callback(*change)
+        return bool(change)
+
+    def _cell(self, row):
+        intervention = row["intervention"]
+        if intervention not in self._level_names:
+            return None
+        level = (row["levels"] or {}).get(self._level_names[intervention], 0)
+        option = self._rows.get((intervention, level))
+        column = self._columns.get(row["stakeholder_type"])
+        if option is None or column is None:
+            return None
+        return option, column
+
+    def refresh(self):
+        """
+        Add the rows committed to the store since the last refresh
+
+        Returns:
+        - Whether the matrix changed
+        """
+        with self._refresh_lock:
+            return self.add(list(self.store.rows(_COLUMNS, after_id=self._last_id)))
+
+    def recompute(self):
+        """
+        Rebuild the histograms from every row of the store, e.g. after restoring it; states
+        merged from other aggregators are dropped
+
+        Returns:
+        - Whether the matrix changed
+        """
+        with self._refresh_lock:
+            rows = list(self.store.rows(_COLUMNS))
+            with self._lock:
+                old = self._support_histogram, self._rating_histogram
+                self._reset()
+                self._apply(rows)
+                change = (
+                    not (np.array_equal(old[0], self._support_histogram) and np.array_equal(old[1], self._rating_histogram))
+                    and self._bump()
+                )
+        return self._notify(change)
+
+    def state(self):
+        """
+        Histograms of the aggregator, e.g. to send them to another process and merge() them there
+
+        Returns:
+        - JSON-serializable {"options", "stakeholders", "support_scores", "ratings",
+          "support_histogram", "rating_histogram"}
+        """
+        with self._lock:
+            return {
+                "options": list(self.options),
+                "stakeholders": list(self.stakeholders),
+                "support_scores": SUPPORT_SCORES.tolist(),
+                "ratings": RATINGS.tolist(),
+                "support_histogram": self._support_histogram.tolist(),
+                "rating_histogram": self._rating_histogram.tolist()
+            }
+
+    def merge(self, state):
+        """
+        Add the histograms of another aggregator over disjoint responses, e.g. of another
+        worker process; merging is commutative and associative
+
+        Parameters:
+        - state: state() of the other aggregator
+
+        Returns:
+        - Whether the matrix changed
+
+        Raises:
+        - ConsensusError when the other aggregator has other options, stakeholders or scales
+        """
+        for key, expected in (
+            ("options", self.options), ("stakeholders", self.stakeholders),
+            ("support_scores", SUPPORT_SCORES.tolist()), ("ratings", RATINGS.tolist())
+        ):
+            if list(state[key]) != list(expected):
+                raise ConsensusError(f"Cannot merge a consensus state with other {key}: {state[key]}")
+        support_histogram = np.asarray(state["support_histogram"], dtype=np.int64)
+        rating_histogram = np.asarray(state["rating_histogram"], dtype=np.int64)
+        if support_histogram.shape != self._support_histogram.shape or rating_histogram.shape != self._rating_histogram.shape:
+            raise ConsensusError("Cannot merge a consensus state whose histograms have another shape")
+
+        with self._lock:
+            self._support_histogram += support_histogram
+            self._rating_histogram += rating_histogram
+            change = (support_histogram.any() or rating_histogram.any()) and self._bump()
+        return self._notify(change)
+
+    def matrix(self):
+        """Current ConsensusMatrix; materialized once per change, so repeated reads cost nothing"""
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = materialize(
+                    self._version, self.options, self.stakeholders,
+                    self._support_histogram.copy(), self._rating_histogram.copy()
+                )
+            return self._matrix
+
+
+def materialize(version, options, stakeholders, support_histogram, rating_histogram):
+    """
+    ConsensusMatrix of support and rating histograms
+
+    Parameters:
+    - version: version of the matrix
+    - options, stakeholders: row and column labels
+    - support_histogram, rating_histogram: (options, stakeholders, bins) arrays of counts in
+      SUPPORT_SCORES and RATINGS order; they become part of the matrix and are made read-only
+    """
+    counts = support_histogram.sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        support = support_histogram @ SUPPORT_SCORES / counts
+    arrays = (
+        counts, support, histogram_quantiles(support_histogram, SUPPORT_SCORES, (0.25, 0.5, 0.75)),
+        histogram_quantiles(rating_histogram, RATINGS, (0.25, 0.5, 0.75)), polarization(support_histogram),
+        support_histogram, rating_histogram
+    )
+    for array in arrays:
+        array.setflags(write=False)
+    return ConsensusMatrix(version, options, stakeholders, *arrays)
+
+
+def findings(
+    matrix, agreement=CONSENSUS_AGREEMENT_SUPPORT, divergence=CONSENSUS_DIVERGENCE_SPREAD,
+    polarized=CONSENSUS_POLARIZATION_INDEX, min_responses=CONSENSUS_POLARIZATION_MIN_RESPONSES
+):
+    """
+    Options stakeholders agree or diverge on
+
+    Parameters:
+    - matrix: ConsensusMatrix
+    - agreement: support (0-100) every stakeholder type with responses must reach
+    - divergence: spread of support between stakeholder types from which an option is divisive
+    - polarized: polarization index from which the responses of a stakeholder type are split
+    - min_responses: responses a stakeholder type needs before it can count as split
+
+    Returns:
+    - (options with strong agreement (at least two stakeholder types responded),
+       [(option, least supportive stakeholder, most supportive stakeholder), ...] of divisive options,
+       [(option, stakeholder, polarization index), ...] of stakeholder types split on an option)
+    """
+    agreed, divided = [], []
+    with np.errstate(invalid="ignore"):
+        split = (matrix.polarization >= polarized) & (matrix.counts >= min_responses)
+    splits = [
+        (matrix.options[option], matrix.stakeholders[stakeholder], float(matrix.polarization[option, stakeholder]))
+        for option, stakeholder in zip(*np.nonzero(split))
+    ]
+    for option, support in zip(matrix.options, matrix.support):
+        answered = np.flatnonzero(~np.isnan(support))
+        if answered.size < 2:
+            continue
+        if support[answered].min() >= agreement:
+            agreed.append(option)
+        low, high = answered[np.argmin(support[answered])], answered[np.argmax(support[answered])]
+        if support[high] - support[low] >= divergence:
+            divided.append((option, matrix.stakeholders[low], matrix.stakeholders[high]))
+    return agreed, divided, splits
+
+
+_consensus_aggregator = None
+_consensus_aggregator_lock = threading.Lock()
+
+
+def consensus_aggregator():
+    """
+    Process-wide ConsensusAggregator of the feedback store, built from it on first use
+
+    Cached consensus heatmaps (cache.cached_figure kind "consensus_heatmap", keyed on the
+    matrix version) are dropped whenever the matrix changes.
+    """
+    from cache import invalidate
+    from feedback_store import feedback_store
+
+    global _consensus_aggregator
+    with _consensus_aggregator_lock:
+        if _consensus_aggregator is None:
+            _consensus_aggregator = ConsensusAggregator(feedback_store())
+            _consensus_aggregator.on_change(lambda old, new: invalidate("consensus_heatmap"))
+    return _consensus_aggregator
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print the consensus matrix of the feedback store")
+    parser.add_argument(
+        "--statistic", choices=["mean", "median", "polarization"], default="mean",
+        help="support statistic to print per cell (default: mean)"
+    )
+    args = parser.parse_args(argv)
+
+    from feedback_store import DATABASE_PATH, read_rows
+
+    # Read-only: opening a FeedbackStore would take over the journal of a running app
+    aggregator = ConsensusAggregator()
+    if os.path.exists(DATABASE_PATH):
+        aggregator.add(read_rows(DATABASE_PATH, _COLUMNS))
+    matrix = aggregator.matrix()
+    values = {
+        "mean": matrix.support, "median": matrix.support_quartiles[..., 1], "polarization": matrix.polarization
+    }[args.statistic]
+    width = max(len(option) for option in matrix.options)
+    print(" " * width, *(f"{stakeholder[:12]:>12}" for stakeholder in matrix.stakeholders))
+    for option, row, counts in zip(matrix.options, values, matrix.counts):
+        cells = (f"{value:6.2f} ({count:3d})" if count else f"{'-':>12}" for value, count in zip(row, counts))
+        print(f"{option:<{width}}", *cells)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
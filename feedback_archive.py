@@ -0,0 +1,485 @@
+"""
+Columnar archive of the feedback store, partitioned for fast filtered dashboard queries
+
+Usage:
+    python feedback_archive.py [--interval SECONDS]
+
+The app runs the compaction job itself every FEEDBACK_ARCHIVE_INTERVAL seconds, in a thread
+started by start_compaction(); the command line is for one-off runs, or for running the
+job in a process of its own with FEEDBACK_ARCHIVE_IN_APP turned off.
+
+The feedback store (feedback_store.py) keeps rows: any aggregate over it reads every row
+in full. The compaction job copies the rows committed since its last run into Parquet
+files, partitioned (Hive style) by submission date (UTC) and intervention, e.g.
+    data/feedback_archive/submitted_date=2026-10-18/intervention=Pop-up%20Market/part-1201-0.parquet
+Choice columns (stakeholder type, visit frequency, travel mode, visit time, ...) are
+dictionary-encoded with their options in config.FEEDBACK_FIELDS, so they are stored and
+read as small integer codes. Queries read only the columns they need (column pruning)
+and hand their filters to the scan (predicate pushdown): date and intervention filters
+skip whole partitions, filters on other columns skip row groups by their statistics.
+
+The id of the last archived row is kept in _compaction.json beside the partitions. A run
+writes its files, named after the first id they hold, before advancing it, so a run
+interrupted part-way is simply repeated and overwrites the files it had written. Each
+run adds a file to every partition it touches; once a day is over, consolidate() merges
+the files of its partitions into one, as each file adds about a millisecond to the queries reading it.
+
+Requires pyarrow, which is imported on first use: the rest of the app works without it.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from config import (
+    FEEDBACK_ARCHIVE_BATCH_ROWS, FEEDBACK_ARCHIVE_IN_APP, FEEDBACK_ARCHIVE_INTERVAL, FEEDBACK_ARCHIVE_ROW_GROUP_ROWS,
+    FEEDBACK_FIELDS, INTERVENTIONS, SUPPORT_LEVEL_SCORES
+)
+from consensus import RATINGS, SUPPORT_SCORES, intervention_options, materialize
+from feedback_store import COLUMNS, DATABASE_PATH, ROOT_DIR, FeedbackError, read_rows
+
+_LOGGER = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.path.join(ROOT_DIR, "data", "feedback_archive")
+
+# Partition columns, in directory order; they are not stored in the files
+PARTITION_COLUMNS = ("submitted_date", "intervention")
+
+_STATE_FILE = "_compaction.json"
+
+# Parameter whose level selects the consensus option of each intervention (see consensus.intervention_options)
+_OPTION_PARAMETERS = {intervention: name for intervention, name, _, _ in intervention_options()}
+
+_CONSENSUS_COLUMNS = ("intervention", "level", "stakeholder_type", "support_level", "rating")
+
+
+def schema(partition_dictionary=False):
+    """
+    Arrow schema of the archive, derived from config.FEEDBACK_FIELDS
+
+    Besides the columns of the feedback store, it has the row "id", the "submitted_date"
+    partition column and "level", the level of the parameter selecting the intervention's
+    consensus option (0 when the submission did not set it, null without an intervention).
+
+    Parameters:
+    - partition_dictionary: read the intervention partition column as dictionary-encoded,
+      with the keys of config.INTERVENTIONS as dictionary
+    """
+    import pyarrow as pa
+
+    fields = [
+        pa.field("id", pa.int64(), nullable=False),
+        pa.field("submission_id", pa.string(), nullable=False),
+        pa.field("submitted_at", pa.float64(), nullable=False),
+        pa.field("submitted_date", pa.date32(), nullable=False),
+        pa.field("intervention", pa.dictionary(pa.int32(), pa.string()) if partition_dictionary else pa.string()),
+        pa.field("levels", pa.string()),
+        pa.field("level", pa.int8())
+    ]
+    for name, (kind, options) in FEEDBACK_FIELDS.items():
+        if kind == "choice":
+            fields.append(pa.field(name, pa.dictionary(pa.int8(), pa.string()), nullable=False))
+        elif kind == "choices":
+            fields.append(pa.field(name, pa.list_(pa.string()), nullable=False))
+        elif kind == "integer":
+            fits = -128 <= options[0] and options[1] <= 127
+            fields.append(pa.field(name, pa.int8() if fits else pa.int32(), nullable=False))
+        elif kind == "flag":
+            fields.append(pa.field(name, pa.bool_(), nullable=False))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+def _partitioning(partition_dictionary=False):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    full = schema(partition_dictionary)
+    return ds.partitioning(
+        pa.schema([full.field(name) for name in PARTITION_COLUMNS]),
+        flavor="hive",
+        dictionaries={"intervention": pa.array(list(INTERVENTIONS))} if partition_dictionary else None
+    )
+
+
+def table(rows):
+    """
+    Arrow table of rows of the feedback store
+
+    Parameters:
+    - rows: dictionaries of "id" and every column of the store, as returned by feedback_store.read_rows()
+
+    Returns:
+    - pyarrow.Table with schema()
+    """
+    import pyarrow as pa
+
+    target = schema()
+    submitted_at = np.array([row["submitted_at"] for row in rows], dtype=float)
+    columns = {
+        "id": [row["id"] for row in rows],
+        "submission_id": [row["submission_id"] for row in rows],
+        "submitted_at": submitted_at,
+        "submitted_date": submitted_at.astype("datetime64[s]").astype("datetime64[D]"),
+        "intervention": [row["intervention"] for row in rows],
+        "levels": [None if row["levels"] is None else json.dumps(row["levels"], separators=(",", ":")) for row in rows],
+        "level": [
+            None if row["intervention"] is None
+            else (row["levels"] or {}).get(_OPTION_PARAMETERS.get(row["intervention"]), 0)
+            for row in rows
+        ]
+    }
+    for name, (kind, options) in FEEDBACK_FIELDS.items():
+        if kind == "choice":
+            codes = {option: code for code, option in enumerate(options)}
+            columns[name] = pa.DictionaryArray.from_arrays(
+                pa.array([codes[row[name]] for row in rows], pa.int8()), pa.array(options)
+            )
+        elif kind == "flag":
+            columns[name] = [bool(row[name]) for row in rows]
+        else:
+            columns[name] = [row[name] for row in rows]
+    return pa.Table.from_arrays([pa.array(columns[field.name], field.type) for field in target], schema=target)
+
+
+def filter_expression(date_from=None, date_to=None, interventions=None, **choices):
+    """
+    Filter of archived rows, for FeedbackArchive.query() and consensus_matrix()
+
+    Parameters:
+    - date_from, date_to: first and last submission date (datetime.date, UTC) to include
+    - interventions: keys of config.INTERVENTIONS to include
+    - choices: choice column of config.FEEDBACK_FIELDS -> options to include
+
+    Returns:
+    - pyarrow.dataset.Expression, or None when nothing is filtered
+
+    Raises:
+    - FeedbackError for a column that is not a choice column, or an unknown option
+    """
+    import pyarrow.dataset as ds
+
+    conditions = []
+    if date_from is not None:
+        conditions.append(ds.field("submitted_date") >= date_from)
+    if date_to is not None:
+        conditions.append(ds.field("submitted_date") <= date_to)
+    if interventions is not None:
+        conditions.append(ds.field("intervention").isin(list(interventions)))
+    for name, selected in choices.items():
+        kind, options = FEEDBACK_FIELDS.get(name, (None, None))
+        if kind != "choice":
+            raise FeedbackError(f"{name}: not a choice column of the feedback form")
+        unknown = [option for option in selected if option not in options]
+        if unknown:
+            raise FeedbackError(f"{name}: {unknown} are not among {options}")
+        conditions.append(ds.field(name).isin(list(selected)))
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression &= condition
+    return expression
+
+
+def _codes(column, values):
+    """Positions in values of the entries of a dictionary-encoded column (-1 for null or other values)"""
+    positions = {value: position for position, value in enumerate(values)}
+    parts = [np.zeros(0, dtype=np.int64)]
+    for chunk in column.chunks:
+        # Files may carry their own dictionaries: map each one onto values, the last entry standing for null
+        mapping = np.array([positions.get(value, -1) for value in chunk.dictionary.to_pylist()] + [-1])
+        parts.append(mapping[chunk.indices.fill_null(len(mapping) - 1).to_numpy()])
+    return np.concatenate(parts)
+
+
+class FeedbackArchive:
+    """
+    Directory of Parquet files with the archived rows of the feedback store
+
+    Queries and the compaction job may run in different threads of one process (see
+    start_compaction()): a query scans the files while holding a lock, and the job takes it
+    to publish new files, advance last_id() or remove files it merged. A query therefore
+    never reads a file that disappears, never counts merged rows twice, and always sees
+    the rows up to the last_id() it reads. The lock does not span processes: run the job
+    in a process of its own only if no process queries the archive meanwhile.
+    """
+
+    def __init__(self, archive_dir=ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+        self._lock = threading.Lock()
+
+    def last_id(self):
+        """Id of the last archived row of the store (0 before the first compaction)"""
+        return self._state().get("last_id", 0)
+
+    def compacted_at(self):
+        """Unix time of the last compaction that archived rows, or None before the first one"""
+        return self._state().get("compacted_at")
+
+    def _state(self):
+        try:
+            with open(os.path.join(self.archive_dir, _STATE_FILE)) as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return {}
+
+    def _set_last_id(self, last_id):
+        path = os.path.join(self.archive_dir, _STATE_FILE)
+        with open(path + ".tmp", "w") as state_file:
+            json.dump({"last_id": last_id, "compacted_at": time.time()}, state_file)
+        os.replace(path + ".tmp", path)
+
+    def compact(self, database_path=DATABASE_PATH, batch_rows=FEEDBACK_ARCHIVE_BATCH_ROWS):
+        """
+        Archive the rows committed to the feedback database since the last compaction
+
+        Parameters:
+        - database_path: feedback database to read (read-only, it may be in use by the app)
+        - batch_rows: most rows converted and written at once
+
+        Returns:
+        - Number of rows archived
+        """
+        if not os.path.exists(database_path):
+            return 0
+        os.makedirs(self.archive_dir, exist_ok=True)
+        rows = read_rows(database_path, COLUMNS, after_id=self.last_id())
+        archived = 0
+        while True:
+            batch = list(itertools.islice(rows, batch_rows))
+            if not batch:
+                return archived
+            rows_table = table(batch)
+            with self._lock:
+                self.append(rows_table)
+                self._set_last_id(batch[-1]["id"])
+            archived += len(batch)
+
+    def append(self, rows):
+        """
+        Write a table of rows into the partitions, as files named after its first id
+
+        Parameters:
+        - rows: pyarrow.Table with schema(), ordered by id
+        """
+        import pyarrow.dataset as ds
+
+        ds.write_dataset(
+            rows,
+            self.archive_dir,
+            format="parquet",
+            partitioning=_partitioning(),
+            basename_template=f"part-{rows['id'][0].as_py()}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+            max_rows_per_group=FEEDBACK_ARCHIVE_ROW_GROUP_ROWS,
+            min_rows_per_group=min(FEEDBACK_ARCHIVE_ROW_GROUP_ROWS, len(rows))
+        )
+
+    def consolidate(self, before=None):
+        """
+        Merge the files of each partition of the days before a date into one, sorted by id
+
+        Rows archived twice (a consolidation interrupted between writing the merged file and
+        removing the files it merged) are kept once.
+
+        Parameters:
+        - before: first date (datetime.date) whose partitions are left alone (default: today, UTC)
+
+        Returns:
+        - Number of partitions merged
+        """
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+
+        before = before or datetime.datetime.now(datetime.timezone.utc).date()
+        full = schema()
+        file_schema = full.remove(full.get_field_index("intervention")).remove(full.get_field_index("submitted_date"))
+        merged = 0
+        for date_dir in sorted(os.listdir(self.archive_dir) if os.path.isdir(self.archive_dir) else ()):
+            if not date_dir.startswith("submitted_date=") or date_dir.split("=", 1)[1] >= before.isoformat():
+                continue
+            for partition_dir in sorted(os.listdir(os.path.join(self.archive_dir, date_dir))):
+                directory = os.path.join(self.archive_dir, date_dir, partition_dir)
+                files = sorted(name for name in os.listdir(directory) if name.endswith(".parquet"))
+                if len(files) < 2:
+                    continue
+                rows = ds.dataset([os.path.join(directory, name) for name in files], schema=file_schema).to_table()
+                rows = rows.take(pc.sort_indices(rows, [("id", "ascending")]))
+                ids = rows["id"].to_numpy()
+                rows = rows.filter(np.append(True, ids[1:] != ids[:-1]))
+
+                name = f"part-{ids[0]}-merged.parquet"
+                # Hidden until complete: dataset discovery skips names starting with "."
+                pq.write_table(
+                    rows, os.path.join(directory, "." + name), compression="zstd",
+                    row_group_size=FEEDBACK_ARCHIVE_ROW_GROUP_ROWS
+                )
+                with self._lock:
+                    os.replace(os.path.join(directory, "." + name), os.path.join(directory, name))
+                    for old in files:
+                        if old != name:
+                            os.remove(os.path.join(directory, old))
+                merged += 1
+        return merged
+
+    def query(self, columns, filter=None):
+        """
+        Archived rows matching a filter, reading only the given columns
+
+        Parameters:
+        - columns: names of schema() columns to return
+        - filter: filter_expression(), or None for every row
+
+        Returns:
+        - pyarrow.Table; the intervention column is dictionary-encoded with the keys of
+          config.INTERVENTIONS as dictionary
+        """
+        with self._lock:
+            return self._query(columns, filter)
+
+    def _query(self, columns, filter):
+        import pyarrow.dataset as ds
+
+        full = schema(partition_dictionary=True)
+        if not os.path.isdir(self.archive_dir):
+            return full.empty_table().select(list(columns))
+        dataset = ds.dataset(self.archive_dir, schema=full, format="parquet", partitioning=_partitioning(True))
+        return dataset.to_table(columns=list(columns), filter=filter)
+
+    def consensus_matrix(self, filter=None):
+        """
+        consensus.ConsensusMatrix of the archived rows matching a filter, versioned by last_id()
+
+        Only the five columns the matrix needs are read; the histograms are counted with
+        numpy from their codes, without converting a single row to Python.
+        """
+        with self._lock:
+            version = self.last_id()
+            rows = self._query(_CONSENSUS_COLUMNS, filter)
+        options = intervention_options()
+        stakeholders = FEEDBACK_FIELDS["stakeholder_type"][1]
+        support_levels = FEEDBACK_FIELDS["support_level"][1]
+
+        # Matrix row of each (intervention, level); the extra last row and column stand for none
+        max_level = max(level for _, _, level, _ in options)
+        option_rows = np.full((len(INTERVENTIONS) + 1, max_level + 2), -1)
+        intervention_codes = {intervention: code for code, intervention in enumerate(INTERVENTIONS)}
+        for row, (intervention, _, level, _) in enumerate(options):
+            option_rows[intervention_codes[intervention], level] = row
+        support_bins = np.append(
+            np.searchsorted(SUPPORT_SCORES, [SUPPORT_LEVEL_SCORES[level] for level in support_levels]), -1
+        )
+
+        level = rows["level"].fill_null(-1).to_numpy().astype(np.int64)
+        level[level > max_level] = -1
+        option = option_rows[_codes(rows["intervention"], list(INTERVENTIONS)), level]
+        stakeholder = _codes(rows["stakeholder_type"], stakeholders)
+        support = support_bins[_codes(rows["support_level"], support_levels)]
+        rating = rows["rating"].fill_null(-1).to_numpy().astype(np.int64) - RATINGS[0]
+
+        counted = (option >= 0) & (stakeholder >= 0) & (support >= 0)
+        rated = counted & (rating >= 0) & (rating < len(RATINGS))
+        cell = option * len(stakeholders) + stakeholder
+        shape = (len(options), len(stakeholders))
+        support_histogram = np.bincount(
+            cell[counted] * len(SUPPORT_SCORES) + support[counted], minlength=np.prod(shape) * len(SUPPORT_SCORES)
+        ).reshape(shape + (len(SUPPORT_SCORES),))
+        rating_histogram = np.bincount(
+            cell[rated] * len(RATINGS) + rating[rated], minlength=np.prod(shape) * len(RATINGS)
+        ).reshape(shape + (len(RATINGS),))
+        return materialize(
+            version, [label for *_, label in options], list(stakeholders),
+            support_histogram.astype(np.int64), rating_histogram.astype(np.int64)
+        )
+
+
+_feedback_archive = None
+_feedback_archive_lock = threading.Lock()
+
+
+def feedback_archive():
+    """Process-wide FeedbackArchive of the feedback store's archive directory"""
+    global _feedback_archive
+    with _feedback_archive_lock:
+        if _feedback_archive is None:
+            _feedback_archive = FeedbackArchive()
+    return _feedback_archive
+
+
+_compaction_thread = None
+
+
+def start_compaction(interval=FEEDBACK_ARCHIVE_INTERVAL):
+    """
+    Run the compaction job every interval seconds in a daemon thread of this process, once per process
+
+    Does nothing when FEEDBACK_ARCHIVE_IN_APP is off. The first run waits for one interval
+    too, so that importing pyarrow and reading the store stay off the app's first render. A
+    failed run is logged and retried at the next interval; without pyarrow the thread stops.
+    """
+    global _compaction_thread
+    with _feedback_archive_lock:
+        if _compaction_thread is None and FEEDBACK_ARCHIVE_IN_APP:
+            _compaction_thread = threading.Thread(
+                target=_compact_every, args=(interval,), name="feedback-compaction", daemon=True
+            )
+            _compaction_thread.start()
+
+
+def _compact_every(interval):
+    archive = feedback_archive()
+    while True:
+        time.sleep(interval)
+        try:
+            start = time.perf_counter()
+            archived = archive.compact()
+            merged = archive.consolidate()
+            _LOGGER.info(
+                "Archived %d feedback rows and merged %d partitions in %.1f s (up to id %d)",
+                archived, merged, time.perf_counter() - start, archive.last_id()
+            )
+        except ImportError:
+            _LOGGER.warning("Not compacting the feedback archive: it requires the pyarrow package")
+            return
+        except Exception:
+            _LOGGER.exception("Compacting the feedback archive failed, retrying in %s s", interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact the committed feedback into the columnar archive")
+    parser.add_argument(
+        "--interval", type=float, default=None,
+        help=f"keep running, compacting every INTERVAL seconds (e.g. {FEEDBACK_ARCHIVE_INTERVAL})"
+    )
+    args = parser.parse_args(argv)
+
+    archive = feedback_archive()
+    try:
+        while True:
+            start = time.perf_counter()
+            archived = archive.compact()
+            merged = archive.consolidate()
+            print(
+                f"Archived {archived} rows and merged {merged} partitions in {time.perf_counter() - start:.1f} s "
+                f"(up to id {archive.last_id()})"
+            )
+            if args.interval is None:
+                return 0
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,491 @@
+"""
+Durable store of the submissions of the Feedback tab (SQLite in WAL mode)
+
+Every submission is one row of the feedback table, with a column per field of
+config.FEEDBACK_FIELDS typed and checked by the schema, plus the intervention and levels
+selected in the Analysis tab when it was submitted.
+
+All writes go through a single writer thread (write-behind): submit() only appends the row
+to a journal file and puts it on a bounded queue, so a submission is acknowledged without
+waiting for the database. The writer commits everything queued (up to FEEDBACK_BATCH_SIZE
+rows) in one transaction. Concurrent submissions therefore never contend for the database
+lock, and one fsync of the database is shared by a whole batch. Rows the database has not
+committed yet are replayed from the journal when the store is opened again, so an
+acknowledged submission survives a crash or restart. Readers open their own connections;
+in WAL mode they neither block the writer nor wait for it.
+
+A database file is written by one process at a time (the one holding its journal).
+"""
+import atexit
+import collections
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from contextlib import closing
+
+from config import (
+    FEEDBACK_BACKPRESSURE_TIMEOUT, FEEDBACK_BATCH_SIZE, FEEDBACK_FIELDS, FEEDBACK_JOURNAL_ROTATE_BYTES,
+    FEEDBACK_JOURNAL_SYNC, FEEDBACK_QUEUE_CAPACITY, FEEDBACK_RETRY_DELAY, FEEDBACK_SHUTDOWN_TIMEOUT,
+    FEEDBACK_TEXT_MAX_CHARS, INTERVENTIONS
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_PATH = os.path.join(ROOT_DIR, "data", "feedback.sqlite3")
+
+# Columns of every row besides the form fields: a unique id making writes idempotent, the
+# submission time (Unix seconds) and the Analysis tab selection (levels as a JSON object)
+META_COLUMNS = ("submission_id", "submitted_at", "intervention", "levels")
+COLUMNS = META_COLUMNS + tuple(FEEDBACK_FIELDS)
+
+# A submission written twice (e.g. replayed) is kept once; any other constraint violation is an error
+_INSERT = (
+    f"INSERT INTO feedback ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)}) "
+    "ON CONFLICT (submission_id) DO NOTHING"
+)
+
+
+class FeedbackError(ValueError):
+    """Raised for a submission that does not match config.FEEDBACK_FIELDS"""
+
+
+def _sql_literal(text):
+    return "'" + text.replace("'", "''") + "'"
+
+
+def schema():
+    """CREATE TABLE statement of the feedback table, derived from config.FEEDBACK_FIELDS"""
+    columns = [
+        "id INTEGER PRIMARY KEY",
+        "submission_id TEXT NOT NULL UNIQUE",
+        "submitted_at REAL NOT NULL",
+        f"intervention TEXT CHECK (intervention IN ({', '.join(map(_sql_literal, INTERVENTIONS))}))",
+        "levels TEXT CHECK (levels IS NULL OR json_valid(levels))"
+    ]
+    for name, (kind, options) in FEEDBACK_FIELDS.items():
+        if kind == "choice":
+            columns.append(f"{name} TEXT NOT NULL CHECK ({name} IN ({', '.join(map(_sql_literal, options))}))")
+        elif kind == "choices":
+            columns.append(f"{name} TEXT NOT NULL CHECK (json_valid({name}))")
+        elif kind == "integer":
+            columns.append(f"{name} INTEGER NOT NULL CHECK ({name} BETWEEN {options[0]} AND {options[1]})")
+        elif kind == "flag":
+            columns.append(f"{name} INTEGER NOT NULL CHECK ({name} IN (0, 1))")
+        else:
+            columns.append(f"{name} TEXT CHECK (length({name}) <= {FEEDBACK_TEXT_MAX_CHARS})")
+    return "CREATE TABLE IF NOT EXISTS feedback (\n    " + ",\n    ".join(columns) + "\n)"
+
+
+def _journal_line(row):
+    return json.dumps(row, separators=(",", ":")).encode() + b"\n"
+
+
+def feedback_row(values, intervention=None, levels=None, submission_id=None, submitted_at=None):
+    """
+    Validated row of the feedback table
+
+    Parameters:
+    - values: field name of config.FEEDBACK_FIELDS -> value as returned by its widget
+    - intervention: key of config.INTERVENTIONS selected when submitting, if any
+    - levels: parameter name -> level selected for it, if any
+    - submission_id: unique id of the submission (default: a new UUID)
+    - submitted_at: Unix time of the submission (default: now)
+
+    Returns:
+    - Tuple of the values of COLUMNS
+
+    Raises:
+    - FeedbackError for a missing or unknown field, or a value of the wrong type or out of range
+    """
+    unknown = set(values) - set(FEEDBACK_FIELDS)
+    if unknown:
+        raise FeedbackError(f"unknown feedback fields: {sorted(unknown)}")
+    if intervention is not None and intervention not in INTERVENTIONS:
+        raise FeedbackError(f"unknown intervention {intervention!r}")
+
+    row = [
+        submission_id or uuid.uuid4().hex,
+        time.time() if submitted_at is None else float(submitted_at),
+        intervention,
+        None if levels is None else json.dumps({name: int(level) for name, level in levels.items()})
+    ]
+    for name, (kind, options) in FEEDBACK_FIELDS.items():
+        value = values.get(name)
+        if kind == "text":
+            value = (value or "").strip() or None
+            if value is not None and len(value) > FEEDBACK_TEXT_MAX_CHARS:
+                raise FeedbackError(f"{name}: longer than {FEEDBACK_TEXT_MAX_CHARS} characters")
+        elif value is None:
+            raise FeedbackError(f"{name}: missing")
+        elif kind == "choice":
+            if value not in options:
+                raise FeedbackError(f"{name}: {value!r} is not one of {options}")
+        elif kind == "choices":
+            invalid = [choice for choice in value if choice not in options]
+            if invalid:
+                raise FeedbackError(f"{name}: {invalid} are not among {options}")
+            # Stored in the order of the options, so equal selections compare equal
+            value = json.dumps([option for option in options if option in value])
+        elif kind == "integer":
+            if isinstance(value, bool) or int(value) != value or not options[0] <= value <= options[1]:
+                raise FeedbackError(f"{name}: {value!r} is not a whole number in {options}")
+            value = int(value)
+        else:
+            value = int(bool(value))
+        row.append(value)
+    return tuple(row)
+
+
+class FeedbackQueueFull(RuntimeError):
+    """Raised by submit() when the write-behind queue stays full for the backpressure timeout"""
+
+
+def read_rows(path=DATABASE_PATH, columns=COLUMNS, after_id=0):
+    """
+    Committed submissions of a feedback database in the order they were written
+
+    Reads through a read-only connection, so other processes (e.g. the archive's compaction
+    job) can read the database of a running app without opening a FeedbackStore.
+
+    Parameters:
+    - path: database file
+    - columns: names of COLUMNS to return
+    - after_id: only rows with a larger id (the "id" column), e.g. to read incrementally
+
+    Returns:
+    - Iterator of dictionaries of "id" and the columns; JSON columns are decoded
+    """
+    unknown = set(columns) - set(COLUMNS)
+    if unknown:
+        raise FeedbackError(f"unknown feedback columns: {sorted(unknown)}")
+    json_columns = {"levels"} | {name for name, (kind, _) in FEEDBACK_FIELDS.items() if kind == "choices"}
+    with _read(path) as connection:
+        cursor = connection.execute(f"SELECT id, {', '.join(columns)} FROM feedback WHERE id > ? ORDER BY id", (after_id,))
+        names = ["id", *columns]
+        for values in cursor:
+            row = dict(zip(names, values))
+            for name in json_columns.intersection(columns):
+                if row[name] is not None:
+                    row[name] = json.loads(row[name])
+            yield row
+
+
+def _read(path):
+    return closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30))
+
+
+class FeedbackStore:
+    """
+    SQLite feedback database behind a bounded, journaled write-behind queue
+
+    submit() appends the row to a local journal file (one JSON line, synced to disk) and
+    queues it; once that returns, the submission is acknowledged and survives a crash or
+    restart. A single background thread drains the queue in batches into the database. The
+    journal is emptied whenever every row in it has been committed, and rewritten without its
+    committed lines once they add up to journal_rotate_bytes, so it stays bounded under
+    continuous load. It is replayed when the store is opened: rows already in the database are
+    skipped by their submission_id.
+
+    Attributes:
+    - path: database file
+    - journal_path: journal of acknowledged but not yet committed rows
+    - recovered: number of rows replayed from the journal when the store was opened
+    - submitted, written, failed, batches, rejected: counters for monitoring
+    """
+
+    def __init__(self, path=DATABASE_PATH, batch_size=FEEDBACK_BATCH_SIZE, capacity=FEEDBACK_QUEUE_CAPACITY,
+                 backpressure_timeout=FEEDBACK_BACKPRESSURE_TIMEOUT, journal_sync=FEEDBACK_JOURNAL_SYNC,
+                 journal_rotate_bytes=FEEDBACK_JOURNAL_ROTATE_BYTES):
+        """
+        Parameters:
+        - path: database file; the journal is kept next to it with a .journal suffix
+        - batch_size: most rows written per transaction
+        - capacity: most rows submitted but not yet committed
+        - backpressure_timeout: seconds submit() waits for room in a full queue before raising
+        - journal_sync: fdatasync the journal after every append (otherwise an acknowledged row
+          survives a crash of the process, but not of the machine)
+        - journal_rotate_bytes: size of the committed lines at the head of the journal from
+          which the journal is rewritten without them
+        """
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.batch_size = batch_size
+        self.capacity = capacity
+        self.backpressure_timeout = backpressure_timeout
+        self.journal_sync = journal_sync
+        self.journal_rotate_bytes = journal_rotate_bytes
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.rejected = 0
+        # Queued (row, future) pairs, and the number of rows in the journal not yet committed
+        self._queue = collections.deque()
+        self._pending = 0
+        # Journal line length of every row not yet committed (in queue order), and the length
+        # of the committed lines at the head of the journal
+        self._line_sizes = collections.deque()
+        self._committed_bytes = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        # Submissions (by count) whose journal line is known to be on disk
+        self._sync_lock = threading.Lock()
+        self._synced = 0
+        self._callbacks = []
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        connection = self._connect()
+        connection.execute(schema())
+        connection.commit()
+        self._journal = os.open(self.journal_path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        self.recovered = self._recover()
+        if self.recovered:
+            _LOGGER.info("Replaying %d feedback submissions from %s", self.recovered, self.journal_path)
+        self._writer = threading.Thread(target=self._write, args=(connection,), name="feedback-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # A commit is on disk before its rows are dropped from the journal
+        connection.execute("PRAGMA synchronous=FULL")
+        return connection
+
+    def _recover(self):
+        """Queue the rows left in the journal by a previous process; returns their number"""
+        with open(self.journal_path, "rb") as journal_file:
+            lines = journal_file.read().split(b"\n")
+        rows = []
+        for line in lines:
+            try:
+                rows.append(tuple(json.loads(line)))
+            except ValueError:
+                # Empty, or torn by a crash in the middle of an append that was never acknowledged
+                continue
+        # Rewrite the journal without torn lines, so later appends start on a line of their own
+        os.ftruncate(self._journal, 0)
+        lines = [_journal_line(row) for row in rows]
+        if lines:
+            os.write(self._journal, b"".join(lines))
+            os.fsync(self._journal)
+        self._queue.extend((row, Future()) for row in rows)
+        self._line_sizes.extend(map(len, lines))
+        self._pending = len(rows)
+        return len(rows)
+
+    def submit(self, row):
+        """
+        Journal a row of feedback_row() and queue it for writing
+
+        Waits up to the backpressure timeout while the queue is full.
+
+        Returns:
+        - concurrent.futures.Future resolved once the row is committed (or failed to be)
+
+        Raises:
+        - FeedbackQueueFull if the queue is still full after the backpressure timeout
+        - RuntimeError if the store is closed
+        """
+        line = _journal_line(row)
+        future = Future()
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._pending < self.capacity or self._closed,
+                                            self.backpressure_timeout):
+                self.rejected += 1
+                raise FeedbackQueueFull(f"{self._pending} feedback submissions are waiting to be written")
+            if self._closed:
+                raise RuntimeError("the feedback store is closed")
+            os.write(self._journal, line)
+            self.submitted += 1
+            appended = self.submitted
+            self._pending += 1
+            self._queue.append((row, future))
+            self._line_sizes.append(len(line))
+            self._condition.notify_all()
+        if self.journal_sync:
+            self._sync(appended)
+        return future
+
+    def on_commit(self, callback):
+        """Call callback() in the writer thread after every committed batch, e.g. to read the new rows"""
+        self._callbacks.append(callback)
+
+    def _sync(self, appended):
+        """
+        fdatasync the journal up to the given append (by submission count)
+
+        Concurrent submissions share one call (group commit): whoever syncs covers every
+        line appended before it started.
+        """
+        with self._sync_lock:
+            if self._synced < appended:
+                synced = self.submitted
+                os.fdatasync(self._journal)
+                self._synced = synced
+
+    def _write(self, connection):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    break
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+            # Retried until the database is available again; the rows stay in the journal meanwhile
+            while True:
+                try:
+                    errors = self._insert(connection, batch)
+                    break
+                except sqlite3.OperationalError:
+                    _LOGGER.exception("Writing %d feedback submissions failed, retrying", len(batch))
+                    time.sleep(FEEDBACK_RETRY_DELAY)
+            for (row, future), error in zip(batch, errors):
+                if error is None:
+                    future.set_result(None)
+                else:
+                    _LOGGER.error("Feedback submission %s refused by the database: %s", row[0], error)
+                    future.set_exception(error)
+            self.failed += sum(error is not None for error in errors)
+            self.written += sum(error is None for error in errors)
+            self.batches += 1
+            for callback in self._callbacks:
+                try:
+                    callback()
+                except Exception:
+                    _LOGGER.exception("Feedback commit callback %r failed", callback)
+
+            with self._condition:
+                self._pending -= len(batch)
+                self._committed_bytes += sum(self._line_sizes.popleft() for _ in batch)
+                if not self._pending:
+                    # Every journaled row is committed (or was rejected by the database)
+                    os.ftruncate(self._journal, 0)
+                    self._committed_bytes = 0
+                elif self._committed_bytes >= self.journal_rotate_bytes:
+                    self._rotate_journal()
+                self._condition.notify_all()
+        connection.close()
+
+    def _rotate_journal(self):
+        """
+        Replace the journal by a copy without its committed lines (called holding the condition)
+
+        The rows are committed in journal order, so the committed lines are the first
+        _committed_bytes of the journal. The copy is synced before it replaces the journal:
+        a crash at any point leaves a journal with every uncommitted row. If the copy cannot be
+        written (e.g. the disk is full), the journal is kept and rotated after a later batch.
+        """
+        rotated_path = self.journal_path + ".rotated"
+        with self._sync_lock:
+            try:
+                with open(self.journal_path, "rb") as journal_file:
+                    journal_file.seek(self._committed_bytes)
+                    tail = journal_file.read()
+                rotated = os.open(rotated_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o600)
+                try:
+                    os.write(rotated, tail)
+                    os.fsync(rotated)
+                    os.replace(rotated_path, self.journal_path)
+                except OSError:
+                    os.close(rotated)
+                    raise
+            except OSError:
+                _LOGGER.exception("Rotating the feedback journal %s failed", self.journal_path)
+                try:
+                    os.remove(rotated_path)
+                except OSError:
+                    pass
+                return
+            os.close(self._journal)
+            self._journal = rotated
+            # The copy was synced, including lines appended but not synced yet
+            self._synced = self.submitted
+            self._committed_bytes = 0
+
+    def _insert(self, connection, batch):
+        """
+        Commit the rows of a batch of (row, future)
+
+        Returns:
+        - Per row, None or the error of a row the database refuses (e.g. a constraint violation)
+
+        Raises:
+        - sqlite3.OperationalError when the database cannot be written (locked, disk full, ...)
+        """
+        try:
+            with connection:
+                connection.executemany(_INSERT, [row for row, _ in batch])
+            return [None] * len(batch)
+        except sqlite3.OperationalError:
+            raise
+        except sqlite3.Error:
+            pass
+        # Insert one by one, so a refused row fails alone
+        errors = []
+        for row, _ in batch:
+            try:
+                with connection:
+                    connection.execute(_INSERT, row)
+            except sqlite3.OperationalError:
+                raise
+            except sqlite3.Error as error:
+                errors.append(error)
+            else:
+                errors.append(None)
+        return errors
+
+    def close(self, timeout=None):
+        """
+        Write everything queued so far, then stop the writer thread; further submissions raise
+
+        Rows still queued after the timeout stay in the journal and are written when the
+        store is opened next.
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._writer.join(timeout)
+        if not self._writer.is_alive():
+            os.close(self._journal)
+
+    def count(self):
+        """Number of committed submissions"""
+        with _read(self.path) as connection:
+            return connection.execute("SELECT count(*) FROM feedback").fetchone()[0]
+
+    def rows(self, columns=COLUMNS, after_id=0):
+        """Committed submissions in the order they were written, see read_rows()"""
+        return read_rows(self.path, columns, after_id)
+
+    def stats(self):
+        """Counters for monitoring: submitted, written, failed, batches, rejected, pending"""
+        return {
+            "submitted": self.submitted,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "rejected": self.rejected,
+            "pending": self._pending
+        }
+
+
+_feedback_store = None
+_feedback_store_lock = threading.Lock()
+
+
+def feedback_store():
+    """Process-wide FeedbackStore, opened on first use and flushed at interpreter exit (Streamlit stops on SIGTERM)"""
+    global _feedback_store
+    with _feedback_store_lock:
+        if _feedback_store is None:
+            _feedback_store = FeedbackStore()
+            atexit.register(_feedback_store.close, FEEDBACK_SHUTDOWN_TIMEOUT)
+    return _feedback_store
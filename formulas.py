@@ -0,0 +1,316 @@
+import ast
+import operator
+
+import numpy as np
+
+# Vectorized replacements for the builtins allowed in formula expressions
+_FUNCTIONS = {
+    "min": "minimum",
+    "max": "maximum",
+}
+
+_BINARY_OPERATORS = {
+    ast.Add: "+",
+    ast.Sub: "-",
+    ast.Mult: "*",
+    ast.Div: "/",
+}
+
+_UNARY_OPERATORS = {
+    ast.USub: "-",
+    ast.UAdd: "+",
+}
+
+
+class FormulaError(ValueError):
+    """Raised when a formula spec in config.METRIC_FORMULAS cannot be compiled"""
+
+
+class CompiledFormulas:
+    """
+    One intervention's formulas compiled into a single vectorized NumPy function
+
+    Attributes:
+    - intervention: name of the intervention
+    - level_names: slider level arguments, in calculator order
+    - quantity_names: physical quantity arguments, in calculator order
+    - constants: named constants of the spec and their values
+    - evaluate: generated function taking the quantities and returning the output dictionary
+    - evaluate_parametric: same, but taking the constants as keyword arguments
+      (defaulting to their declared values) so they can be arrays of samples; compiled on
+      first use, as only the uncertainty simulation needs it
+    - source: generated source of evaluate, for inspection
+    """
+
+    def __init__(self, intervention, spec, evaluate, source):
+        self.intervention = intervention
+        self._spec = spec
+        self.level_names = tuple(spec["levels"])
+        self.quantity_names = tuple(quantity for quantity, _ in spec["levels"].values())
+        self.constants = dict(spec.get("constants", {}))
+        self.evaluate = evaluate
+        self.source = source
+        self._evaluate_parametric = None
+
+        # Level -> quantity and level -> label tables, indexed with validated levels
+        self._level_values = [np.array(values) for _, values in spec["levels"].values()]
+        self._labels = [
+            (name, self.level_names.index(level_name), np.array(texts))
+            for name, (level_name, texts) in spec.get("labels", {}).items()
+        ]
+        sizes = [len(values) for values in self._level_values]
+        self._level_strides = [int(np.prod(sizes[axis + 1:])) for axis in range(len(sizes))]
+        self._grid_outputs = None
+
+    def __repr__(self):
+        return f"<CompiledFormulas {self.intervention!r} levels={self.level_names}>"
+
+    def __call__(self, *quantities):
+        return self.evaluate(*quantities)
+
+    @property
+    def evaluate_parametric(self):
+        if self._evaluate_parametric is None:
+            self._evaluate_parametric, _ = _Compiler(self.intervention, self._spec, parametric=True).compile()
+        return self._evaluate_parametric
+
+    def from_levels(self, *levels):
+        """
+        Evaluate the formulas for categorical levels (scalars or arrays)
+
+        Returns:
+        - The output dictionary, preceded by the text labels of the levels if the spec has any
+        """
+        levels = [_as_levels(level, len(values)) for level, values in zip(levels, self._level_values)]
+
+        # Levels have a tiny finite domain: evaluate every combination once, then
+        # gather rows by their flat combination index
+        code = 0
+        for level, stride in zip(levels, self._level_strides):
+            code = code + level * stride
+        outputs = _gather(self._level_grid_outputs(), code)
+        if not self._labels:
+            return outputs
+        labelled = {name: texts[levels[position]] for name, position, texts in self._labels}
+        labelled.update(outputs)
+        return labelled
+
+    def quantities_at(self, *levels):
+        """Physical quantities for one combination of levels, in calculator order"""
+        levels = [_as_levels(level, len(values)) for level, values in zip(levels, self._level_values)]
+        return tuple(values[level] for level, values in zip(levels, self._level_values))
+
+    def _level_grid_outputs(self):
+        """Outputs for every combination of levels, flattened in row-major order"""
+        if self._grid_outputs is None:
+            grid = np.indices(tuple(len(values) for values in self._level_values)).reshape(len(self._level_values), -1)
+            outputs = self.evaluate(*(values[level] for level, values in zip(grid, self._level_values)))
+            self._grid_outputs = _broadcast(outputs, grid.shape[1])
+        return self._grid_outputs
+
+
+def _gather(outputs, code):
+    """Index every array in a (possibly nested) output dictionary"""
+    return {
+        name: _gather(values, code) if isinstance(values, dict) else values[code]
+        for name, values in outputs.items()
+    }
+
+
+def _broadcast(outputs, size):
+    """Broadcast every value in a (possibly nested) output dictionary to a 1-D array"""
+    return {
+        name: _broadcast(values, size) if isinstance(values, dict) else np.broadcast_to(values, (size,))
+        for name, values in outputs.items()
+    }
+
+
+def _as_levels(levels, n_levels=3):
+    """Convert a scalar or array-like of categorical levels into a validated integer array"""
+    levels = np.asarray(levels)
+    if levels.dtype.kind not in "iub":
+        if not np.array_equal(levels, np.trunc(levels)):
+            raise ValueError("Implementation levels must be whole numbers 0, 1 or 2")
+        levels = levels.astype(np.intp)
+    if levels.size and (levels.min() < 0 or levels.max() > n_levels - 1):
+        raise ValueError("Implementation levels must be 0 (None), 1 (Minimal) or 2 (Extensive)")
+    return levels
+
+
+class _Compiler:
+    """
+    Translate one intervention spec into straight-line NumPy code
+
+    Every distinct sub-expression is assigned to exactly one temporary, so a
+    term such as "market_impact * 0.8" that appears in several outputs is
+    computed once per call. Evaluation order within each expression is kept
+    as written, so results are bit-identical to the hand-written formulas.
+    """
+
+    def __init__(self, intervention, spec, parametric=False):
+        self.intervention = intervention
+        self.parametric = parametric
+        self.quantities = [quantity for quantity, _ in spec["levels"].values()]
+        self.constants = dict(spec.get("constants", {}))
+        self.intermediates = dict(spec.get("intermediates", {}))
+        self.outputs = spec["outputs"]
+
+        self.lines = []
+        self.slots = {}         # canonical sub-expression key -> variable name
+        self.resolving = []     # intermediates currently being compiled, for cycle detection
+        self.resolved = {}      # intermediate name -> variable name
+
+    def fail(self, where, message):
+        raise FormulaError(f"{self.intervention}: {where}: {message}")
+
+    def emit(self, key, code):
+        """Return the variable holding key, emitting an assignment the first time it is seen"""
+        if key not in self.slots:
+            name = f"_t{len(self.slots)}"
+            self.lines.append(f"    {name} = {code}")
+            self.slots[key] = name
+        return self.slots[key]
+
+    def name(self, identifier, where):
+        if identifier in self.quantities:
+            return identifier
+        if identifier in self.constants:
+            # Inlined as a literal, unless the constants are function arguments
+            return identifier if self.parametric else repr(self.constants[identifier])
+        if identifier in self.resolved:
+            return self.resolved[identifier]
+        if identifier in self.intermediates:
+            if identifier in self.resolving:
+                self.fail(where, f"circular intermediate {' -> '.join(self.resolving + [identifier])}")
+            self.resolving.append(identifier)
+            self.resolved[identifier] = self.expression(self.intermediates[identifier], identifier)
+            self.resolving.pop()
+            return self.resolved[identifier]
+        self.fail(where, f"unknown name {identifier!r}")
+
+    def expression(self, text, where):
+        try:
+            tree = ast.parse(str(text), mode="eval")
+        except SyntaxError as error:
+            self.fail(where, f"invalid expression {text!r} ({error.msg})")
+        return self.node(tree.body, where)
+
+    def node(self, node, where):
+        """Compile an AST node, returning a variable name or literal"""
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return repr(node.value)
+        if isinstance(node, ast.Name):
+            return self.name(node.id, where)
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+            left = self.node(node.left, where)
+            right = self.node(node.right, where)
+            operator = _BINARY_OPERATORS[type(node.op)]
+            return self.emit((operator, left, right), f"{left} {operator} {right}")
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+            operand = self.node(node.operand, where)
+            operator = _UNARY_OPERATORS[type(node.op)]
+            return self.emit((operator, operand), f"{operator}{operand}")
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+                and node.func.id in _FUNCTIONS and not node.keywords and len(node.args) >= 2):
+            function = _FUNCTIONS[node.func.id]
+            arguments = [self.node(argument, where) for argument in node.args]
+            result = arguments[0]
+            for argument in arguments[1:]:
+                result = self.emit((function, result, argument), f"_np.{function}({result}, {argument})")
+            return result
+        self.fail(where, f"unsupported syntax {ast.unparse(node)!r}")
+
+    def output_code(self, outputs, where):
+        """Source for the (possibly nested) output dictionary"""
+        items = []
+        for name, value in outputs.items():
+            if isinstance(value, dict):
+                items.append(f"{name!r}: {self.output_code(value, f'{where}/{name}')}")
+            else:
+                items.append(f"{name!r}: {self.expression(value, f'{where}/{name}')}")
+        return "{" + ", ".join(items) + "}"
+
+    def compile(self):
+        for identifier in self.constants:
+            if not isinstance(self.constants[identifier], (int, float)):
+                self.fail(identifier, "constants must be numbers")
+        for quantity in self.quantities:
+            self.lines.append(f"    {quantity} = _np.asarray({quantity})")
+        returned = self.output_code(self.outputs, "outputs")
+        arguments = list(self.quantities)
+        if self.parametric and self.constants:
+            arguments += ["*"] + [f"{identifier}={value!r}" for identifier, value in self.constants.items()]
+        source = "\n".join(
+            [f"def evaluate({', '.join(arguments)}):"]
+            + self.lines
+            + [f"    return {returned}"]
+        )
+        namespace = {"_np": np}
+        exec(compile(source, f"<formulas: {self.intervention}>", "exec"), namespace)
+        return namespace["evaluate"], source
+
+
+def evaluate_reference(spec, levels):
+    """
+    Evaluate a formula spec for one combination of levels by walking its expressions in plain Python
+
+    Independent of the generated NumPy code, so it can check what the compiled formulas
+    (and tables built from them) return.
+
+    Parameters:
+    - spec: one intervention's spec, see config.METRIC_FORMULAS
+    - levels: level of each of the spec's level parameters, in spec order
+
+    Returns:
+    - The output dictionary of Python numbers, preceded by the text labels of the levels if the spec has any
+    """
+    constants = dict(spec.get("constants", {}))
+    intermediates = dict(spec.get("intermediates", {}))
+    names = {quantity: values[level] for (quantity, values), level in zip(spec["levels"].values(), levels)}
+    level_of = dict(zip(spec["levels"], levels))
+    operators = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv}
+
+    def value(node):
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Name):
+            if node.id not in names:
+                names[node.id] = constants[node.id] if node.id in constants else evaluate(intermediates[node.id])
+            return names[node.id]
+        if isinstance(node, ast.BinOp):
+            return operators[type(node.op)](value(node.left), value(node.right))
+        if isinstance(node, ast.UnaryOp):
+            return -value(node.operand) if isinstance(node.op, ast.USub) else +value(node.operand)
+        function = min if node.func.id == "min" else max
+        # Folded left to right like the compiled code
+        result = value(node.args[0])
+        for argument in node.args[1:]:
+            result = function(result, value(argument))
+        return result
+
+    def evaluate(text):
+        return value(ast.parse(str(text), mode="eval").body)
+
+    def outputs(specs):
+        return {name: outputs(item) if isinstance(item, dict) else evaluate(item) for name, item in specs.items()}
+
+    result = {name: texts[level_of[level_name]] for name, (level_name, texts) in spec.get("labels", {}).items()}
+    result.update(outputs(spec["outputs"]))
+    return result
+
+
+def compile_formulas(formula_specs):
+    """
+    Compile declarative formula specs into vectorized functions
+
+    Parameters:
+    - formula_specs: intervention name -> spec, see config.METRIC_FORMULAS
+
+    Returns:
+    - Dictionary of intervention name -> CompiledFormulas
+    """
+    compiled = {}
+    for intervention, spec in formula_specs.items():
+        evaluate, source = _Compiler(intervention, spec).compile()
+        compiled[intervention] = CompiledFormulas(intervention, spec, evaluate, source)
+    return compiled
@@ -0,0 +1,287 @@
+"""
+Index of the before/after images shown for every combination of intervention levels
+
+config.IMAGE_MANIFEST maps (intervention, level tuple) to an asset and caption. It is
+validated and expanded once into a dictionary keyed on (intervention, levels), so a
+lookup is a single dictionary access however many combinations there are. The bytes of
+the served variant of each image are kept in a process-wide LRU cache shared by every
+session: after warm-up, changing a level never reads from disk. Combinations without a
+photo of their own are rendered from the base photo and overlay layers (compositor.py).
+"""
+import base64
+import hashlib
+import io
+import itertools
+import os
+import string
+from collections import namedtuple
+
+import numpy as np
+
+from asset_pipeline import asset_variants, placeholder_data_url
+from asset_store import asset_store, url as store_url
+from cache import LRUCache
+from compositor import compositor
+from config import ASSET_VARIANT_QUALITY, CATEGORICAL_LABELS, IMAGE_CACHE_BUDGET_BYTES, IMAGE_MANIFEST, INTERVENTIONS
+
+# One image of the manifest: path is the file served for it (see AssetVariants.path), or
+# composite is the (base, overlay layers) it is rendered from when asset is None
+ImageEntry = namedtuple("ImageEntry", ["asset", "caption", "path", "composite"])
+
+# Process-wide cache of image bytes keyed on the served path, and of rendered composites
+IMAGE_CACHE = LRUCache(IMAGE_CACHE_BUDGET_BYTES)
+
+_MIME_TYPES = {".avif": "image/avif", ".webp": "image/webp", ".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg"}
+
+
+class ManifestError(ValueError):
+    """Raised when config.IMAGE_MANIFEST is inconsistent with config.INTERVENTIONS"""
+
+
+def image_key(entry):
+    """Cache key of the image of an ImageEntry: its served file or its composite"""
+    return entry.path if entry.composite is None else entry.composite
+
+
+def image_id(entry):
+    """Short stable id of the image of an ImageEntry, e.g. for the browser"""
+    return hashlib.sha1(repr(image_key(entry)).encode()).hexdigest()[:16]
+
+
+def webp_bytes(image, quality=ASSET_VARIANT_QUALITY["webp"]):
+    """HxWx3 uint8 array encoded as WebP"""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, "WEBP", quality=quality)
+    return buffer.getvalue()
+
+
+def webp_data_url(image, quality=ASSET_VARIANT_QUALITY["webp"]):
+    """HxWx3 uint8 array encoded as a WebP data URL"""
+    return "data:image/webp;base64," + base64.b64encode(webp_bytes(image, quality)).decode("ascii")
+
+
+class _LevelFormatter(string.Formatter):
+    """str.format with a "label" format spec that shows a level as its CATEGORICAL_LABELS name"""
+
+    def format_field(self, value, format_spec):
+        if format_spec == "label":
+            return CATEGORICAL_LABELS[value]
+        return super().format_field(value, format_spec)
+
+
+_FORMATTER = _LevelFormatter()
+
+
+class ImageManifest:
+    """
+    Validated, expanded image manifest
+
+    Attributes:
+    - levels: intervention -> names of the parameters selecting its image, in key order
+    - index: (intervention, level tuple) -> ImageEntry, and (intervention, None) -> current state
+    """
+
+    def __init__(self, manifest=IMAGE_MANIFEST, interventions=INTERVENTIONS, variants=None):
+        """
+        Raises:
+        - ManifestError for an unknown intervention or level, a level tuple of the wrong
+          length or out of range, or a combination of levels without an image or layers
+        - FileNotFoundError listing every referenced asset missing from assets/
+        """
+        variants = variants or asset_variants()
+        self.levels = {}
+        images = {}
+
+        for intervention, spec in manifest.items():
+            if intervention not in interventions:
+                raise ManifestError(f"{intervention}: unknown intervention, expected one of {list(interventions)}")
+            parameters = interventions[intervention]["parameters"]
+            level_names = tuple(spec.get("levels", ()))
+            for name in level_names:
+                if name not in parameters:
+                    raise ManifestError(f"{intervention}: unknown level {name!r}, expected one of {list(parameters)}")
+            self.levels[intervention] = level_names
+            ranges = [range(parameters[name]["min"], parameters[name]["max"] + 1) for name in level_names]
+
+            if "current" in spec:
+                images[intervention, None] = (*spec["current"], None)
+
+            layers = tuple(spec.get("layers", ()))
+            for name, _ in layers:
+                if name not in level_names:
+                    raise ManifestError(f"{intervention}: layer of unknown level {name!r}, expected one of {level_names}")
+            if layers and "base" not in spec:
+                raise ManifestError(f"{intervention}: layers without a base image")
+
+            transformations = spec.get("transformations", {})
+            for levels in transformations:
+                if len(levels) != len(level_names) or any(level not in values for level, values in zip(levels, ranges)):
+                    raise ManifestError(f"{intervention}: level tuple {levels} does not match {level_names} in {ranges}")
+
+            for levels in itertools.product(*ranges):
+                values = dict(zip(level_names, levels))
+                if levels in transformations:
+                    asset, caption = transformations[levels]
+                elif "pattern" in spec:
+                    asset = _FORMATTER.format(spec["pattern"], **values)
+                    caption = _FORMATTER.format(spec.get("caption", ""), **values)
+                elif layers:
+                    asset, caption = None, _FORMATTER.format(spec.get("caption", ""), **values)
+                else:
+                    raise ManifestError(f"{intervention}: no image for {values}")
+
+                composite = None
+                if asset is None:
+                    if not layers:
+                        raise ManifestError(f"{intervention}: {values} is rendered but no layers are given")
+                    composite = (spec["base"], tuple(
+                        overlays[values[name]] for name, overlays in layers if values[name] in overlays
+                    ))
+                images[intervention, levels] = (asset, caption, composite)
+
+        # Served paths are resolved once, so lookups never touch the file system
+        assets = sorted(
+            {asset for asset, _, _ in images.values() if asset is not None}
+            | {name for _, _, composite in images.values() if composite for name in (composite[0], *composite[1])}
+        )
+        variants.require(assets)
+        paths = {asset: variants.path(asset) for asset in assets}
+        self.index = {
+            key: ImageEntry(asset, caption, paths.get(asset), composite)
+            for key, (asset, caption, composite) in images.items()
+        }
+
+    def assets(self):
+        """Names of every referenced asset, including bases and overlays of composites"""
+        return sorted(
+            {entry.asset for entry in self.index.values() if entry.asset is not None}
+            | {name for entry in self.index.values() if entry.composite for name in (entry.composite[0], *entry.composite[1])}
+        )
+
+    def current(self, intervention):
+        """ImageEntry of an intervention's current state"""
+        return self.index[intervention, None]
+
+    def transformation(self, intervention, params_values):
+        """
+        ImageEntry for the selected levels
+
+        Parameters:
+        - intervention: key of config.INTERVENTIONS
+        - params_values: parameter name -> level; missing levels default to 0 like the sliders
+        """
+        levels = tuple(params_values.get(name, 0) for name in self.levels[intervention])
+        return self.index[intervention, levels]
+
+    def neighbours(self, intervention, params_values):
+        """ImageEntry of the combinations one level step away from the selected levels, without duplicates"""
+        levels = tuple(params_values.get(name, 0) for name in self.levels[intervention])
+        entries = {}
+        for position, step in itertools.product(range(len(levels)), (-1, 1)):
+            neighbour = levels[:position] + (levels[position] + step,) + levels[position + 1:]
+            entry = self.index.get((intervention, neighbour))
+            if entry is not None:
+                entries.setdefault(image_key(entry), entry)
+        return list(entries.values())
+
+    def image(self, entry):
+        """
+        Image of an entry for st.image, computed once and then shared by all sessions
+
+        Returns:
+        - The bytes of the served file, or the rendered composite as an HxWx3 uint8 array
+        """
+        if entry.composite is not None:
+            base, layers = entry.composite
+            image = IMAGE_CACHE.get(entry.composite)
+            if image is None:
+                image = compositor().render(base, layers)
+                IMAGE_CACHE.put(entry.composite, image, image.nbytes)
+            return image
+
+        def read():
+            with open(entry.path, "rb") as image_file:
+                return image_file.read()
+
+        return IMAGE_CACHE.get_or_compute(entry.path, read)
+
+    def data_url(self, entry):
+        """Data URL of the image of an entry (a rendered composite is encoded as WebP), cached"""
+        def encode():
+            image = self.image(entry)
+            if isinstance(image, np.ndarray):
+                return webp_data_url(image)
+            mime_type = _MIME_TYPES.get(os.path.splitext(entry.path)[1].lower(), "application/octet-stream")
+            return f"data:{mime_type};base64," + base64.b64encode(image).decode("ascii")
+
+        return IMAGE_CACHE.get_or_compute(("data_url", image_key(entry)), encode)
+
+    def stored_name(self, entry):
+        """
+        File name of the image of an entry in the content-addressed store (asset_store.py)
+
+        The file is stored on first use; a rendered composite is stored as WebP.
+        """
+        def store():
+            if entry.composite is not None:
+                return asset_store().put_bytes(webp_bytes(self.image(entry)), ".webp")
+            return asset_store().put_file(entry.path)
+
+        return IMAGE_CACHE.get_or_compute(("stored", image_key(entry)), store)
+
+    def url(self, entry):
+        """URL of the image of an entry in the store, relative to the app page"""
+        return store_url(self.stored_name(entry))
+
+    def placeholder(self, entry):
+        """
+        Tiny blurred data URL of the image of an entry, shown while the full image loads
+
+        Built with the asset variants (asset_pipeline.py); rendered composites and assets
+        that have not been built get one computed on first use.
+        """
+        if entry.composite is None:
+            placeholder = asset_variants().placeholder(entry.asset)
+            if placeholder is not None:
+                return placeholder
+
+        def compute():
+            from PIL import Image
+
+            image = self.image(entry)
+            if isinstance(image, np.ndarray):
+                return placeholder_data_url(Image.fromarray(image))
+            with Image.open(io.BytesIO(image)) as decoded:
+                return placeholder_data_url(decoded)
+
+        return IMAGE_CACHE.get_or_compute(("placeholder", image_key(entry)), compute)
+
+    def warm(self):
+        """
+        Load every image file into the cache (as far as its budget allows) and decode the
+        layers of every composite, so any combination renders without reading from disk
+
+        Returns:
+        - Total bytes of the distinct image files
+        """
+        total = 0
+        for entry in {entry.path or entry.composite: entry for entry in self.index.values()}.values():
+            if entry.composite is not None:
+                compositor().load(*entry.composite)
+            else:
+                total += len(self.image(entry))
+        return total
+
+
+_image_manifest = None
+
+
+def image_manifest():
+    """Process-wide ImageManifest, validated and warmed on first use"""
+    global _image_manifest
+    if _image_manifest is None:
+        _image_manifest = ImageManifest()
+        _image_manifest.warm()
+    return _image_manifest
@@ -0,0 +1,107 @@
+import inspect
+from collections.abc import Mapping
+
+import numpy as np
+
+from metrics import (
+    calculate_public_seating_metrics_batch, calculate_mobility_metrics_batch,
+    public_seating_result_at, mobility_result_at
+)
+from config import CATEGORICAL_LABELS, METRIC_FORMULAS
+from formulas import evaluate_reference
+
+
+class LevelTable:
+    """
+    Every result of one calculator for every combination of its categorical levels
+
+    The table is evaluated once with the batch calculator, so each lookup is a
+    single index computation instead of re-running the formulas and re-formatting
+    the display strings. Returned results are read-only and shared between callers.
+    """
+
+    def __init__(self, batch_calculator, result_at, n_levels=len(CATEGORICAL_LABELS)):
+        self.level_names = tuple(inspect.signature(batch_calculator).parameters)
+        self.n_levels = n_levels
+        self.shape = (n_levels,) * len(self.level_names)
+
+        # Row-major strides so that index = sum(level * stride)
+        self.strides = tuple(n_levels ** (len(self.shape) - 1 - axis) for axis in range(len(self.shape)))
+
+        # One row per combination, in row-major order of the levels
+        self.levels = np.indices(self.shape).reshape(len(self.shape), -1)
+        self.columns = batch_calculator(*self.levels)
+        self.results = tuple(result_at(self.columns, row) for row in range(self.levels.shape[1]))
+
+    def __len__(self):
+        return len(self.results)
+
+    def index(self, *levels):
+        """Flat row index of a combination of levels"""
+        if len(levels) != len(self.level_names):
+            raise TypeError(f"expected {len(self.level_names)} levels {self.level_names}, got {len(levels)}")
+        row = 0
+        for level, stride in zip(levels, self.strides):
+            if level not in range(self.n_levels):
+                raise ValueError("Implementation levels must be 0 (None), 1 (Minimal) or 2 (Extensive)")
+            row += int(level) * stride
+        return row
+
+    def column(self, path):
+        """
+        One numeric output for every combination, as a float array in row order
+
+        Parameters:
+        - path: keys leading to the output in the calculator result, e.g. ("tradeoffs", "Cost Efficiency")
+        """
+        columns = self.columns
+        for key in path:
+            columns = columns[key]
+        return np.asarray(columns, dtype=float)
+
+    def lookup(self, *levels):
+        """Result dictionary for a combination of levels, in calculator argument order"""
+        return self.results[self.index(*levels)]
+
+    def lookup_params(self, params_values):
+        """Result dictionary for a dict of slider values; missing levels default to 0 like app.py"""
+        return self.lookup(*(params_values.get(name, 0) for name in self.level_names))
+
+    def verify(self, intervention, spec):
+        """
+        Check every entry against the formula spec, evaluated per combination in plain Python
+        (formulas.evaluate_reference), independently of the compiled code that filled the table
+
+        Raises:
+        - RuntimeError naming the first combination whose stored values differ
+        """
+        for row in range(len(self.results)):
+            levels = tuple(int(level) for level in self.levels[:, row])
+            expected = evaluate_reference(spec, levels)
+            if not _same_values(self.columns, row, expected):
+                raise RuntimeError(
+                    f"Lookup table for {intervention} does not match its formulas at levels {levels}: "
+                    f"{self.results[row]!r} != {expected!r}"
+                )
+
+
+def _same_values(columns, row, expected):
+    """Whether a row of (possibly nested) batch columns has exactly the expected values and keys"""
+    if isinstance(expected, Mapping):
+        return (
+            isinstance(columns, Mapping)
+            and columns.keys() == expected.keys()
+            and all(_same_values(columns[key], row, expected[key]) for key in expected)
+        )
+    return columns[row] == expected
+
+
+# Precomputed tables, built once at import
+LEVEL_TABLES = {
+    "Pop-up Market": LevelTable(calculate_public_seating_metrics_batch, public_seating_result_at),
+    "Pop-up Art Installation": LevelTable(calculate_mobility_metrics_batch, mobility_result_at)
+}
+
+# Consistency check of the compiled formulas against an independent evaluation of their specs
+for _intervention, _table in LEVEL_TABLES.items():
+    _table.verify(_intervention, METRIC_FORMULAS[_intervention])
@@ -1,3 +1,5 @@
+import inspect
+
 # def calculate_public_seating_metrics_simplified(seating_level, plaza_level):
 #     """
 #     Calculate metrics for Public Seating Management intervention without implementation level
@@ -150,6 +152,153 @@
 #     }
 
 
+# Display name -> format of the "increases" shown as metric deltas
+MARKET_INCREASE_FORMATS = {
+    "Pedestrian Dwell Time": "{:.1f}X",
+    "Business Foot Traffic": "{:.1f}X",
+    "Public Space Utilization": "{:+.0%}",
+}
+
+# Display groups of the Pop-up Market result: key -> (group of raw numbers, formats)
+MARKET_RESULT_FORMATS = {
+    "increases": ("increase_ratios", MARKET_INCREASE_FORMATS)
+}
+
+_compiled_formulas = None
+
+
+def compiled_formulas(intervention):
+    """
+    Compiled formulas for an intervention (config.METRIC_FORMULAS, see formulas.py)
+    
+    config.py imports this module, so the formulas are compiled on first use rather than
+    at import time; importing config (e.g. udtool's startup) then loads neither NumPy nor
+    the compiler. The formulas and results modules are imported here for the same reason.
+    """
+    global _compiled_formulas
+    if _compiled_formulas is None:
+        from config import METRIC_FORMULAS
+        from formulas import compile_formulas
+        _compiled_formulas = compile_formulas(METRIC_FORMULAS)
+    return _compiled_formulas[intervention]
+
+
+def calculate_public_seating_metrics_from_quantities(market_count, plaza_count):
+    """
+    Pop-up Market formulas in terms of the underlying physical quantities
+    
+    Parameters:
+    - market_count: number of market stalls (any non-negative value, array-like, broadcastable)
+    - plaza_count: number of plazas (any non-negative value, array-like, broadcastable)
+    
+    Returns:
+    - Dictionary with "metrics", "increase_ratios" and "tradeoffs", each mapping a name to an array
+    """
+    return compiled_formulas("Pop-up Market").evaluate(market_count, plaza_count)
+
+def calculate_mobility_metrics_from_quantities(art_lane_coverage, art_display_spots, interactive_art_stations):
+    """
+    Pop-up Art Installation formulas in terms of the underlying physical quantities
+    
+    Parameters:
+    - art_lane_coverage: art lane coverage in % (array-like, broadcastable)
+    - art_display_spots: number of art display spots (array-like, broadcastable)
+    - interactive_art_stations: number of interactive art stations (array-like, broadcastable)
+    
+    Returns:
+    - Flat dictionary of numerical metric arrays (the text descriptions are level-based and not included)
+    """
+    return compiled_formulas("Pop-up Art Installation").evaluate(art_lane_coverage, art_display_spots, interactive_art_stations)
+
+
+def calculate_public_seating_metrics_batch(seating_level, plaza_level):
+    """
+    Vectorized Pop-up Market calculator over arrays of levels
+    
+    Parameters:
+    - seating_level: array-like of levels 0 (None), 1 (Minimal), 2 (Extensive)
+    - plaza_level: array-like of levels 0 (None), 1 (Minimal), 2 (Extensive)
+    
+    Returns:
+    - Dictionary with "metrics", "increase_ratios" and "tradeoffs", each mapping a name to a float array.
+      Values are bit-identical to the scalar calculator.
+    """
+    return compiled_formulas("Pop-up Market").from_levels(seating_level, plaza_level)
+
+def calculate_mobility_metrics_batch(bike_lane_level, bike_parking_level, bike_share_level):
+    """
+    Vectorized Pop-up Art Installation calculator over arrays of levels
+    
+    Parameters:
+    - bike_lane_level: array-like of levels 0 (None), 1 (Minimal - 30%), 2 (Extensive - 75%)
+    - bike_parking_level: array-like of levels 0 (None), 1 (Minimal - 15 spots), 2 (Extensive - 40 spots)
+    - bike_share_level: array-like of levels 0 (None), 1 (Minimal - 2 installations), 2 (Extensive - 6 installations)
+    
+    Returns:
+    - Flat dictionary of columns with the same keys as the scalar calculator
+      (string arrays for the text descriptions, float arrays otherwise)
+    """
+    return compiled_formulas("Pop-up Art Installation").from_levels(bike_lane_level, bike_parking_level, bike_share_level)
+
+def evaluate_batch(batch_calculator, data):
+    """
+    Run a batch calculator over a table of levels
+    
+    Parameters:
+    - batch_calculator: calculate_public_seating_metrics_batch or calculate_mobility_metrics_batch
+    - data: pandas DataFrame or mapping of column name -> array of levels.
+      Level columns that are missing default to 0, like the sliders in app.py.
+    
+    Returns:
+    - The batch calculator's dictionary of columns
+    """
+    import numpy as np
+
+    level_names = list(inspect.signature(batch_calculator).parameters)
+    present = [name for name in level_names if name in data]
+    if not present:
+        raise ValueError(f"data has none of the level columns {level_names}")
+    
+    n_rows = len(np.asarray(data[present[0]]))
+    columns = [
+        np.asarray(data[name]) if name in data else np.zeros(n_rows, dtype=np.intp)
+        for name in level_names
+    ]
+    return batch_calculator(*columns)
+
+
+def public_seating_result_at(batch, row=0):
+    """
+    Assemble the Pop-up Market result for one row of a batch result
+    
+    Parameters:
+    - batch: output of calculate_public_seating_metrics_batch
+    - row: flat index of the row to extract
+    
+    Returns:
+    - Read-only dict-compatible result (see results.py) with metrics, increases
+      (formatted for display on access), tradeoffs
+    """
+    from results import result_at
+
+    return result_at(batch, row, MARKET_RESULT_FORMATS)
+
+def mobility_result_at(batch, row=0):
+    """
+    Assemble the Pop-up Art Installation result for one row of a batch result
+    
+    Parameters:
+    - batch: output of calculate_mobility_metrics_batch
+    - row: flat index of the row to extract
+    
+    Returns:
+    - Read-only dict-compatible result (see results.py) with text descriptions and numerical metrics
+    """
+    from results import result_at
+
+    return result_at(batch, row)
+
+
 def calculate_public_seating_metrics_simplified(seating_level, plaza_level):
     """
     Calculate metrics for Pop-up Market intervention
@@ -159,56 +308,9 @@ def calculate_public_seating_metrics_simplified(seating_level, plaza_level):
     - plaza_level: 0 (None), 1 (Minimal), 2 (Extensive)
     
     Returns:
-    - Dictionary with metrics, increases, tradeoffs
+    - Dict-compatible result with metrics, increases, tradeoffs
     """
-    # Convert categorical levels to numerical values
-    market_mapping = {0: 0, 1: 2, 2: 5}  # None, Minimal (2 stalls), Extensive (5 stalls)
-    plaza_mapping = {0: 0, 1: 1, 2: 3}   # None, Minimal (1 plaza), Extensive (3 plazas)
-    
-    market_count = market_mapping[seating_level]
-    plaza_count = plaza_mapping[plaza_level]
-    
-    # Base metrics (minimum values even with zero intervention)
-    base_metrics = {
-        "Pedestrian Dwell Time (min)": 5,
-        "Business Foot Traffic (people/hr)": 120,
-        "Social Interactions (count/hr)": 15,
-        "Public Space Utilization (%)": 10,
-        "Maintenance Cost ($/year)": 5000
-    }
-    
-    # Calculate scaled impact
-    market_impact = market_count 
-    plaza_impact = plaza_count * 3  # Plazas have 3x impact
-    
-    # Calculate metrics with specific formulas
-    metrics = {
-        "Pedestrian Dwell Time (min)": base_metrics["Pedestrian Dwell Time (min)"] + (market_impact * 0.8) + (plaza_impact * 2.5),
-        "Business Foot Traffic (people/hr)": base_metrics["Business Foot Traffic (people/hr)"] + (market_impact * 5) + (plaza_impact * 25),
-        "Public Space Utilization (%)": min(95, base_metrics["Public Space Utilization (%)"] + (market_impact * 1.2) + (plaza_impact * 5)),
-    }
-    
-    # Calculate percentage increases for display
-    increases = {
-        "Pedestrian Dwell Time": f"{(metrics['Pedestrian Dwell Time (min)'] / base_metrics['Pedestrian Dwell Time (min)']):.1f}X",
-        "Business Foot Traffic": f"{(metrics['Business Foot Traffic (people/hr)'] / base_metrics['Business Foot Traffic (people/hr)']):.1f}X",
-        "Public Space Utilization": f"{(metrics['Public Space Utilization (%)'] / base_metrics['Public Space Utilization (%)']):+.0%}",
-    }
-    
-    # Trade-off metrics (0-100 scale for radar chart)
-    tradeoffs = {
-        "Community Engagement": min(100, 40 + (market_impact * 1.5) + (plaza_impact * 4)),
-        "Sidewalk Clearance": max(0, 90 - (market_impact * 0.8) - (plaza_impact * 2.5)),  # Negative impact
-        "Pedestrian Safety": min(100, 60 + (market_impact * 0.7) + (plaza_impact * 2)),
-        "Business Visibility": min(100, 50 + (market_impact * 1.2) + (plaza_impact * 3)),
-        "Cost Efficiency": max(0, 85 - (market_impact * 0.5) - (plaza_impact * 3))  # Negative impact
-    }
-    
-    return {
-        "metrics": metrics,
-        "increases": increases,
-        "tradeoffs": tradeoffs
-    }
+    return public_seating_result_at(calculate_public_seating_metrics_batch(seating_level, plaza_level))
 
 def calculate_mobility_metrics_simplified(bike_lane_level, bike_parking_level, bike_share_level):
     """
@@ -220,77 +322,6 @@ def calculate_mobility_metrics_simplified(bike_lane_level, bike_parking_level, b
     - bike_share_level: 0 (None), 1 (Minimal - 2 installations), 2 (Extensive - 6 installations)
     
     Returns:
-    - Dictionary with text descriptions for metrics
+    - Dict-compatible result with text descriptions and numerical metrics
     """
-    # Compact text descriptions based on implementation levels
-    
-    # Space Utilization Text
-    if bike_lane_level == 0:
-        space_text = "Limited"
-    elif bike_lane_level == 1:
-        space_text = "Improved"
-    else:  # bike_lane_level == 2
-        space_text = "Optimal"
-    
-    # Economic Value Text
-    if bike_share_level == 0:
-        economic_text = "Basic"
-    elif bike_share_level == 1:
-        economic_text = "Enhanced"
-    else:  # bike_share_level == 2
-        economic_text = "Maximum"
-    
-    # Community Engagement Text
-    if bike_parking_level == 0:
-        community_text = "Minimal"
-    elif bike_parking_level == 1:
-        community_text = "Regular"
-    else:  # bike_parking_level == 2
-        community_text = "Vibrant"
-    
-    # Map categorical levels to actual values (for trade-offs calculation)
-    art_lane_values = {0: 0, 1: 30, 2: 75}  # % coverage
-    art_display_values = {0: 0, 1: 15, 2: 40}  # spots
-    interactive_art_values = {0: 0, 1: 2, 2: 6}  # stations
-    
-    art_lane_coverage = art_lane_values[bike_lane_level]
-    art_display_spots = art_display_values[bike_parking_level]
-    interactive_art_stations = interactive_art_values[bike_share_level]
-    
-    # Calculate numerical metrics for trade-offs tab
-    pedestrian_safety = 40 + (art_lane_coverage * 0.3) + (art_display_spots * 0.2) + (interactive_art_stations * 2.5)
-    traffic_flow = 70 - (art_lane_coverage * 0.1) + (interactive_art_stations * 2.5)
-    business_access = 50 + (art_display_spots * 0.5) + (interactive_art_stations * 4)
-    cost_efficiency = 90 - (art_lane_coverage * 0.2) - (art_display_spots * 0.3) - (interactive_art_stations * 5)
-    community_support = 40 + (art_lane_coverage * 0.4) + (art_display_spots * 0.1) + (interactive_art_stations * 1.5)
-    
-    # Cap all values at 100
-    pedestrian_safety = min(100, pedestrian_safety)
-    traffic_flow = min(100, traffic_flow)
-    business_access = min(100, business_access)
-    cost_efficiency = min(100, cost_efficiency)
-    community_support = min(100, community_support)
-    
-    # Calculate original metrics (just for compatibility)
-    pedestrian_activity = 30 + (art_lane_coverage / 2)
-    economic_activity = 35 + (interactive_art_stations * 4)
-    community_engagement = 20 + (art_display_spots / 2)
-    
-    return {
-        # Text descriptions for display
-        "space_text": space_text,
-        "economic_text": economic_text,
-        "community_text": community_text,
-        
-        # Original metrics for backward compatibility
-        "pedestrian_activity": pedestrian_activity,
-        "economic_activity": economic_activity,
-        "community_engagement": community_engagement,
-        
-        # Metrics for trade-offs tab
-        "pedestrian_safety": pedestrian_safety,
-        "traffic_flow": traffic_flow,
-        "business_access": business_access,
-        "cost_efficiency": cost_efficiency,
-        "community_support": community_support
-    }
\ No newline at end of file
+    return mobility_result_at(calculate_mobility_metrics_batch(bike_lane_level, bike_parking_level, bike_share_level))
@@ -0,0 +1,165 @@
+import numpy as np
+
+from config import COMBINED_TRADEOFF_AXES
+from lookup_tables import LEVEL_TABLES
+
+# Upper bound on the size of the boolean comparison arrays built at once
+DEFAULT_COMPARISON_BUDGET = 1 << 22
+
+
+def _covers(a, b):
+    """
+    Boolean (len(a), len(b)) matrix: a[i] >= b[j] on every axis
+
+    For distinct points this is exactly "a[i] dominates b[j]". Built one axis at a
+    time so only 2-D temporaries are allocated.
+    """
+    covered = a[:, None, 0] >= b[None, :, 0]
+    for axis in range(1, a.shape[1]):
+        covered &= a[:, None, axis] >= b[None, :, axis]
+    return covered
+
+
+def _skyline_2d(points):
+    """Non-dominated rows of unique 2-D points: sort by x descending, keep strict new maxima of y"""
+    order = np.lexsort((-points[:, 1], -points[:, 0]))
+    y = points[order, 1]
+    best_before = np.maximum.accumulate(np.concatenate(([-np.inf], y[:-1])))
+    return order[y > best_before]
+
+
+def _dominated_by(skyline, candidates, budget):
+    """Flags for candidates (distinct from the skyline points) dominated by some skyline point"""
+    step = max(1, budget // max(len(skyline), 1))
+    return np.concatenate([
+        _covers(skyline, candidates[start:start + step]).any(axis=0)
+        for start in range(0, len(candidates), step)
+    ])
+
+
+def _skyline_sfs(points, budget):
+    """
+    Sort-Filter-Skyline with eager elimination over unique points
+
+    Points are sorted by coordinate sum, descending. A point can only be dominated
+    by a point with a strictly larger sum, so the survivors of a head block
+    compared among themselves are all on the skyline. Each round, these new
+    skyline points remove every remaining point they dominate in one vectorized
+    pass, which usually discards most rows within the first few rounds.
+    """
+    remaining = np.argsort(-points.sum(axis=1), kind="stable")
+    head_size = 64
+    max_head_size = max(64, int(budget ** 0.5))
+    skyline = []
+
+    while len(remaining):
+        head, remaining = remaining[:head_size], remaining[head_size:]
+        covered = _covers(points[head], points[head])
+        np.fill_diagonal(covered, False)
+        survivors = head[~covered.any(axis=0)]
+        skyline.append(survivors)
+        if len(remaining):
+            remaining = remaining[~_dominated_by(points[survivors], points[remaining], budget)]
+
+        # A head that mostly survives means a large skyline: take bigger steps
+        if len(survivors) > len(head) // 2:
+            head_size = min(head_size * 2, max_head_size)
+    return np.concatenate(skyline)
+
+
+def _unique_rows(values):
+    """Unique rows and the inverse mapping, comparing each row as one opaque value"""
+    values = np.ascontiguousarray(values + 0.0)  # -0.0 -> 0.0 so equal rows have equal bytes
+    rows = values.view(np.dtype((np.void, values.dtype.itemsize * values.shape[1]))).ravel()
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+    return values[first], inverse.reshape(-1)
+
+
+def pareto_mask(values, maximize=True, budget=DEFAULT_COMPARISON_BUDGET):
+    """
+    Mark the non-dominated (Pareto-optimal) rows of a table of objectives
+
+    Parameters:
+    - values: array of shape (rows, axes)
+    - maximize: True/False for all axes, or one flag per axis (False = lower is better)
+    - budget: maximum number of elements in intermediate comparison arrays
+
+    Returns:
+    - Boolean array of length rows; identical rows share the same flag
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim != 2:
+        raise ValueError("values must be a 2-D array of shape (rows, axes)")
+    if not len(values):
+        return np.zeros(0, dtype=bool)
+
+    signs = np.where(np.broadcast_to(maximize, (values.shape[1],)), 1.0, -1.0)
+    points, inverse = _unique_rows(values * signs)
+
+    if points.shape[1] == 1:
+        frontier = np.flatnonzero(points[:, 0] == points[:, 0].max())
+    elif points.shape[1] == 2:
+        frontier = _skyline_2d(points)
+    else:
+        frontier = _skyline_sfs(points, budget)
+
+    on_frontier = np.zeros(len(points), dtype=bool)
+    on_frontier[frontier] = True
+    return on_frontier[inverse]
+
+
+def tradeoff_axes(intervention):
+    """Trade-off axes of an intervention and the path of each in its calculator output"""
+    return {axis: sources[intervention] for axis, sources in COMBINED_TRADEOFF_AXES.items() if intervention in sources}
+
+
+def _matches(levels, fixed_levels):
+    """Rows whose levels equal every fixed level"""
+    mask = True
+    for name, level in fixed_levels.items():
+        mask = mask & (levels[name] == level)
+    return np.broadcast_to(mask, np.shape(next(iter(levels.values()))))
+
+
+def intervention_frontier(intervention, fixed_levels=None):
+    """
+    Pareto-optimal level combinations of one intervention over its trade-off axes
+
+    Parameters:
+    - intervention: key of config.INTERVENTIONS
+    - fixed_levels: level name -> level restricting the candidates (e.g. levels without a slider held at 0)
+
+    Returns:
+    - (rows, mask): row indices into LEVEL_TABLES[intervention] that are candidates,
+      and a boolean array marking which of them are on the frontier
+    """
+    table = LEVEL_TABLES[intervention]
+    axes = tradeoff_axes(intervention)
+    levels = dict(zip(table.level_names, table.levels))
+    rows = np.flatnonzero(_matches(levels, fixed_levels or {}))
+    values = np.column_stack([table.column(path)[rows] for path in axes.values()])
+    return rows, pareto_mask(values)
+
+
+def combined_frontier(scenarios, fixed_levels=None):
+    """
+    Pareto-optimal combined scenarios over the combined trade-off axes
+
+    Parameters:
+    - scenarios: scenarios.CombinedScenarios
+    - fixed_levels: label -> level name -> level restricting the candidates
+
+    Returns:
+    - (rows, mask, result): candidate flat indices, frontier flags, and the evaluated candidates
+    """
+    rows = np.arange(len(scenarios))
+    if fixed_levels:
+        grid = np.unravel_index(rows, scenarios.shape)
+        keep = np.ones(len(rows), dtype=bool)
+        for label, table, row in zip(scenarios.labels, scenarios.tables, grid):
+            levels = {name: table.levels[axis][row] for axis, name in enumerate(table.level_names)}
+            keep &= _matches(levels, fixed_levels.get(label, {}))
+        rows = rows[keep]
+    result = scenarios.rows(rows)
+    values = np.column_stack(list(result["tradeoffs"].values()))
+    return rows, pareto_mask(values), result
@@ -0,0 +1,122 @@
+"""
+Progressive image delivery: blurred placeholder first, full image after, neighbours prefetched
+
+A level change sends only the image id and its placeholder (a few hundred bytes), which
+the browser shows at once. The component then asks for the full image, which arrives
+in a fragment rerun and fades in over the placeholder. Once it is shown, the images of
+the neighbouring levels are requested in the background, so the next slider step finds
+its image already in the browser. Full images are only sent when the browser asks for
+them, so an image it already has is never sent twice and one it lost (e.g. after a page
+reload) is simply requested again.
+
+When Streamlit serves static files, full images are referenced by their URL in the
+content-addressed store (asset_store.py) instead: the URL is sent right away and the
+browser's HTTP cache keeps every image it has loaded, across reruns and visits.
+"""
+from asset_store import static_serving_enabled
+from image_manifest import image_id
+
+_CSS = """
+.progressive { position: relative; overflow: hidden; }
+.progressive img { display: block; width: 100%; }
+.progressive img.full { position: absolute; inset: 0; height: 100%; opacity: 0; transition: opacity 0.25s; }
+.progressive img.full.loaded { opacity: 1; }
+"""
+
+_JS = """
+// Full images received by this page, by id
+const images = new Map();
+
+export default function(component) {
+    const { data, parentElement, setTriggerValue } = component;
+    for (const item of [data.image, ...data.prefetch]) {
+        if (item.src && !images.has(item.id)) {
+            images.set(item.id, item.src);
+            // Store URLs are fetched into the HTTP cache right away
+            if (!item.src.startsWith("data:")) new Image().src = item.src;
+        }
+    }
+
+    let root = parentElement.querySelector(".progressive");
+    if (!root) {
+        root = document.createElement("div");
+        root.className = "progressive";
+        root.innerHTML = '<img class="placeholder" alt=""><img class="full" alt="">';
+        parentElement.appendChild(root);
+    }
+    const placeholder = root.querySelector("img.placeholder");
+    const full = root.querySelector("img.full");
+    if (placeholder.dataset.id !== data.image.id) {
+        placeholder.src = data.image.placeholder;
+        placeholder.dataset.id = data.image.id;
+    }
+
+    const src = images.get(data.image.id);
+    if (!src) {
+        full.classList.remove("loaded");
+        full.dataset.id = "";
+        setTriggerValue("load", data.image.id);
+        return;
+    }
+    if (full.dataset.id !== data.image.id) {
+        full.classList.remove("loaded");
+        full.onload = () => full.classList.add("loaded");
+        full.src = src;
+        full.dataset.id = data.image.id;
+    }
+
+    const missing = data.prefetch.filter((item) => !images.has(item.id)).map((item) => item.id);
+    if (missing.length) setTriggerValue("prefetch", missing);
+}
+"""
+
+_component = None
+
+
+def payload(manifest, entry, prefetch, requested, use_urls=False):
+    """
+    Component data for one image
+
+    Parameters:
+    - manifest: ImageManifest the entries belong to
+    - entry: ImageEntry to show
+    - prefetch: ImageEntry of the images to load in the background
+    - requested: ids the browser asked for in this run; only their full images are included
+    - use_urls: reference every image by its store URL instead (static serving is enabled)
+
+    Returns:
+    - {"image": {"id", "placeholder", "src"?}, "prefetch": [{"id", "src"?}]}
+    """
+    def item(image_entry):
+        item_id = image_id(image_entry)
+        data = {"id": item_id}
+        if use_urls:
+            data["src"] = manifest.url(image_entry)
+        elif item_id in requested:
+            data["src"] = manifest.data_url(image_entry)
+        return data
+
+    image = item(entry)
+    image["placeholder"] = manifest.placeholder(entry)
+    return {"image": image, "prefetch": [item(neighbour) for neighbour in prefetch if neighbour != entry]}
+
+
+def progressive_image(manifest, entry, key, prefetch=()):
+    """Show an ImageEntry progressively in the running Streamlit app, prefetching the given entries"""
+    import streamlit as st
+    from streamlit.components.v2 import component
+
+    global _component
+    if _component is None:
+        _component = component("progressive_image", css=_CSS, js=_JS)
+
+    # Ids the browser asked for since the last run (trigger values of this component)
+    state = st.session_state.get(key) or {}
+    requested = {state.get("load"), *(state.get("prefetch") or ())}
+
+    _component(
+        key=key,
+        data=payload(manifest, entry, prefetch, requested, static_serving_enabled()),
+        on_load_change=lambda: None,
+        on_prefetch_change=lambda: None
+    )
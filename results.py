@@ -0,0 +1,254 @@
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+
+class ResultLayout:
+    """
+    Field names, value types and display formats shared by every result of one calculator
+
+    A result stores its numbers in one flat float array and its text labels in a tuple;
+    the layout says how each key of the result dictionary is read back from them:
+    - ("group", name): a nested dictionary of numbers
+    - ("number", position, is_int): a single number
+    - ("text", position): a text label
+    - ("formatted", source group, formats): the numbers of a stored group, formatted for display
+
+    Layouts are built once per batch structure and shared, see for_batch().
+    """
+
+    _cache = {}
+
+    def __init__(self, signature, formatted=()):
+        """
+        Parameters:
+        - signature: tuple of (key, kind) in result order. kind is "f" (float), "i" (integer)
+          or "s" (text) for a top-level value, or a tuple of (name, "f" or "i") for a group.
+        - formatted: tuple of (display key, source group, ((name, format string), ...)).
+          The display key takes the place of its source group in the result keys; the source
+          group stays available through CalculatorResult.group().
+        """
+        formatted_by_source = {source: (key, dict(formats)) for key, source, formats in formatted}
+        self.groups = {}
+        self.entries = {}
+        self.n_numbers = 0
+        self.n_texts = 0
+
+        for key, kind in signature:
+            if isinstance(kind, tuple):
+                self.groups[key] = {
+                    name: (self.n_numbers + position, field_kind == "i")
+                    for position, (name, field_kind) in enumerate(kind)
+                }
+                self.n_numbers += len(kind)
+                if key in formatted_by_source:
+                    display_key, formats = formatted_by_source[key]
+                    self.entries[display_key] = ("formatted", key, formats)
+                else:
+                    self.entries[key] = ("group", key)
+            elif kind == "s":
+                self.entries[key] = ("text", self.n_texts)
+                self.n_texts += 1
+            else:
+                self.entries[key] = ("number", self.n_numbers, kind == "i")
+                self.n_numbers += 1
+
+    @classmethod
+    def for_batch(cls, batch, formatted=None):
+        """
+        Shared layout for the output of a batch calculator
+
+        Parameters:
+        - batch: dictionary of arrays, or of groups of arrays, as returned by the batch calculators
+        - formatted: optional display key -> (source group, {name: format string})
+        """
+        signature = tuple(
+            (key, tuple((name, _kind(values)) for name, values in column.items()) if isinstance(column, dict) else _kind(column))
+            for key, column in batch.items()
+        )
+        formatted = tuple(
+            (key, source, tuple(formats.items())) for key, (source, formats) in (formatted or {}).items()
+        )
+        layout = cls._cache.get((signature, formatted))
+        if layout is None:
+            layout = cls._cache[(signature, formatted)] = cls(signature, formatted)
+        return layout
+
+    def number_columns(self, batch):
+        """The batch's number columns, in storage order"""
+        columns = []
+        for key, column in batch.items():
+            if isinstance(column, dict):
+                columns.extend(column.values())
+            elif self.entries.get(key, ("text",))[0] == "number":
+                columns.append(column)
+        return columns
+
+    def text_columns(self, batch):
+        """The batch's text columns, in storage order"""
+        return [column for key, column in batch.items() if self.entries.get(key, ("",))[0] == "text"]
+
+
+def _kind(values):
+    kind = np.asarray(values).dtype.kind
+    if kind in "US":
+        return "s"
+    return "i" if kind in "iub" else "f"
+
+
+class CalculatorResult(Mapping):
+    """
+    Read-only result of one calculator call with a dict-compatible interface
+
+    Holds the raw numbers in a compact float array. Nested groups are views created
+    on access, and display strings are only formatted when first read and then cached,
+    so callers that only need numbers never build any dictionaries or strings.
+    Compares equal to the equivalent plain dictionary; to_dict() makes a copy.
+    """
+
+    __slots__ = ("layout", "numbers", "texts", "_formatted")
+
+    def __init__(self, layout, numbers, texts=()):
+        self.layout = layout
+        self.numbers = numbers
+        self.texts = texts
+        self._formatted = None
+
+    def __getitem__(self, key):
+        entry = self.layout.entries[key]
+        kind = entry[0]
+        if kind == "group":
+            return NumberGroup(self, entry[1])
+        if kind == "number":
+            value = self.numbers[entry[1]]
+            return int(value) if entry[2] else value
+        if kind == "text":
+            return self.texts[entry[1]]
+        return FormattedGroup(self, key)
+
+    def __iter__(self):
+        return iter(self.layout.entries)
+
+    def __len__(self):
+        return len(self.layout.entries)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def group(self, name):
+        """Numbers of a stored group, including sources of formatted groups (e.g. "increase_ratios")"""
+        if name not in self.layout.groups:
+            raise KeyError(name)
+        return NumberGroup(self, name)
+
+    def formatted(self, key, name):
+        """Display string of one entry of a formatted group, cached after the first call"""
+        if self._formatted is None:
+            self._formatted = {}
+        try:
+            return self._formatted[key, name]
+        except KeyError:
+            _, source, formats = self.layout.entries[key]
+            text = self._formatted[key, name] = formats[name].format(NumberGroup(self, source)[name])
+            return text
+
+    def to_dict(self):
+        """Plain nested dictionary with the same content"""
+        return {key: dict(value) if isinstance(value, Mapping) else value for key, value in self.items()}
+
+
+class NumberGroup(Mapping):
+    """Dict-compatible view of one group of numbers of a CalculatorResult"""
+
+    __slots__ = ("_result", "_index")
+
+    def __init__(self, result, name):
+        self._result = result
+        self._index = result.layout.groups[name]
+
+    def __getitem__(self, name):
+        position, is_int = self._index[name]
+        value = self._result.numbers[position]
+        return int(value) if is_int else value
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class FormattedGroup(Mapping):
+    """Dict-compatible view of the display strings of a group of numbers"""
+
+    __slots__ = ("_result", "_key", "_index")
+
+    def __init__(self, result, key):
+        self._result = result
+        self._key = key
+        self._index = result.layout.groups[result.layout.entries[key][1]]
+
+    def __getitem__(self, name):
+        if name not in self._index:
+            raise KeyError(name)
+        return self._result.formatted(self._key, name)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def result_at(batch, row=0, formatted=None):
+    """
+    One row of a batch calculator output as a CalculatorResult
+
+    Parameters:
+    - batch: output of a batch calculator
+    - row: flat index of the row to extract
+    - formatted: optional display key -> (source group, {name: format string})
+    """
+    layout = ResultLayout.for_batch(batch, formatted)
+    numbers = array("d", [column.item(row) for column in layout.number_columns(batch)])
+    texts = tuple(sys.intern(column.item(row)) for column in layout.text_columns(batch))
+    return CalculatorResult(layout, numbers, texts)
+
+
+class ResultArray(Sequence):
+    """
+    Every row of a batch calculator output, stored as one 2-D float array
+
+    Holding millions of results costs 8 bytes per number and no Python objects per row;
+    a CalculatorResult view is created only when a row is accessed.
+    """
+
+    def __init__(self, batch, formatted=None):
+        self.layout = ResultLayout.for_batch(batch, formatted)
+        number_columns = self.layout.number_columns(batch)
+        text_columns = self.layout.text_columns(batch)
+        size = np.broadcast_shapes(*(np.shape(column) for column in number_columns + text_columns))
+        self.numbers = np.column_stack([
+            np.broadcast_to(column, size).ravel() for column in number_columns
+        ]).astype(float) if number_columns else np.empty((int(np.prod(size)), 0))
+        self.texts = [np.broadcast_to(column, size).ravel() for column in text_columns]
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[index] for index in range(*row.indices(len(self)))]
+        return CalculatorResult(
+            self.layout,
+            memoryview(self.numbers[row]),
+            tuple(sys.intern(column.item(row)) for column in self.texts)
+        )
@@ -0,0 +1,144 @@
+import math
+
+import numpy as np
+
+from config import COMBINED_TRADEOFF_AXES, INTERVENTION_SYNERGIES, INTERVENTIONS
+from lookup_tables import LEVEL_TABLES
+
+# Default upper bound on combined scenarios evaluated at once
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+
+def _intensity(intervention, table):
+    """Mean user-facing level of every row of a level table, scaled to 0..1 (all levels if none is user-facing)"""
+    parameters = INTERVENTIONS.get(intervention, {}).get("parameters", {})
+    axes = [axis for axis, name in enumerate(table.level_names) if name in parameters]
+    if not axes:
+        axes = list(range(len(table.level_names)))
+    return table.levels[axes].mean(axis=0) / (table.n_levels - 1)
+
+
+class CombinedScenarios:
+    """
+    Every combination of levels of several interventions implemented together
+
+    Each combined trade-off axis starts from the mean no-intervention score of the
+    interventions that contribute to it. Each intervention then adds its own change
+    over its no-intervention score, and each configured pair adds
+    synergy * intensity_a * intensity_b. An intervention's intensity is the mean of
+    its user-facing levels (the sliders of config.INTERVENTIONS) scaled to 0..1, so
+    an intervention with every slider at Extensive contributes its full synergy
+    whatever its other levels. Results are clipped to the 0-100 radar scale.
+
+    Every intervention is evaluated once over its own level table. A combined
+    scenario is a flat index into the product of those tables, so any set of rows
+    is computed by gathering, without Python loops over combinations.
+    The same intervention may appear several times, e.g. one per block.
+    """
+
+    def __init__(self, interventions, axes=COMBINED_TRADEOFF_AXES, synergies=INTERVENTION_SYNERGIES):
+        self.interventions = list(interventions)
+        if not self.interventions:
+            raise ValueError("At least one intervention is required")
+
+        # Unique labels for repeated interventions: "Pop-up Market", "Pop-up Market #2", ...
+        self.labels = []
+        for name in self.interventions:
+            repeat = self.interventions[:len(self.labels)].count(name)
+            self.labels.append(name if not repeat else f"{name} #{repeat + 1}")
+
+        self.tables = [LEVEL_TABLES[name] for name in self.interventions]
+        self.shape = tuple(len(table) for table in self.tables)
+        self.size = math.prod(self.shape)
+
+        self.axes = [axis for axis, sources in axes.items() if any(name in sources for name in self.interventions)]
+        self._baselines = {}
+        self._deltas = {}
+        for axis in self.axes:
+            sources = axes[axis]
+            contributions = [
+                (position, table.column(sources[name]))
+                for position, (name, table) in enumerate(zip(self.interventions, self.tables))
+                if name in sources
+            ]
+            # Row 0 of every level table is the all-None combination
+            self._baselines[axis] = float(np.mean([scores[0] for _, scores in contributions]))
+            self._deltas[axis] = [(position, scores - scores[0]) for position, scores in contributions]
+
+        self._intensities = [_intensity(name, table) for name, table in zip(self.interventions, self.tables)]
+        self._synergies = []
+        for a in range(len(self.interventions)):
+            for b in range(a + 1, len(self.interventions)):
+                pair = (self.interventions[a], self.interventions[b])
+                coefficients = synergies.get(pair) or synergies.get(pair[::-1]) or {}
+                coefficients = {axis: coefficient for axis, coefficient in coefficients.items() if axis in self.axes}
+                if coefficients:
+                    self._synergies.append((a, b, coefficients))
+
+    def __len__(self):
+        return self.size
+
+    def index(self, params_by_intervention):
+        """
+        Flat row index of one combined scenario
+
+        Parameters:
+        - params_by_intervention: label -> dict of level name -> level; missing levels default to 0
+        """
+        rows = [
+            table.index(*(params_by_intervention.get(label, {}).get(name, 0) for name in table.level_names))
+            for label, table in zip(self.labels, self.tables)
+        ]
+        return int(np.ravel_multi_index(rows, self.shape))
+
+    def rows(self, flat_index):
+        """
+        Evaluate the combined scenarios at the given flat indices
+
+        Returns:
+        - Dictionary with "levels" (label -> level name -> array), "tradeoffs"
+          (axis -> array) and "synergy" (axis -> array of the synergy part alone)
+        """
+        flat_index = np.asarray(flat_index, dtype=np.intp)
+        rows = np.unravel_index(flat_index, self.shape)
+
+        levels = {
+            label: {name: table.levels[axis][row] for axis, name in enumerate(table.level_names)}
+            for label, table, row in zip(self.labels, self.tables, rows)
+        }
+
+        synergy = {axis: np.zeros(flat_index.shape) for axis in self.axes}
+        for a, b, coefficients in self._synergies:
+            both = self._intensities[a][rows[a]] * self._intensities[b][rows[b]]
+            for axis, coefficient in coefficients.items():
+                synergy[axis] += coefficient * both
+
+        tradeoffs = {}
+        for axis in self.axes:
+            total = self._baselines[axis] + synergy[axis]
+            for position, deltas in self._deltas[axis]:
+                total = total + deltas[rows[position]]
+            tradeoffs[axis] = np.clip(total, 0, 100)
+
+        return {"levels": levels, "tradeoffs": tradeoffs, "synergy": synergy}
+
+    def scenario(self, params_by_intervention):
+        """Combined trade-offs and synergy for one scenario, as plain floats"""
+        result = self.rows(self.index(params_by_intervention))
+        return {
+            "tradeoffs": {axis: values.item() for axis, values in result["tradeoffs"].items()},
+            "synergy": {axis: values.item() for axis, values in result["synergy"].items()}
+        }
+
+    def iter_chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yield (start, rows) for consecutive blocks of at most chunk_size scenarios"""
+        for start in range(0, self.size, chunk_size):
+            yield start, self.rows(np.arange(start, min(start + chunk_size, self.size)))
+
+    def evaluate(self):
+        """Evaluate every combined scenario in one pass"""
+        return self.rows(np.arange(self.size))
+
+
+# All interventions implemented together, built once at import
+COMBINED_SCENARIOS = CombinedScenarios(list(LEVEL_TABLES))
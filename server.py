@@ -0,0 +1,15 @@
+"""
+ASGI entry point serving app.py with immutable caching of the image store
+
+Usage:
+    streamlit run server.py
+
+Same app as `streamlit run app.py`; in addition, responses from the content-addressed
+image store (asset_store.py) carry "Cache-Control: public, max-age=31536000, immutable".
+"""
+import streamlit as st
+from starlette.middleware import Middleware
+
+from asset_store import ImmutableCacheMiddleware
+
+app = st.App("app.py", middleware=[Middleware(ImmutableCacheMiddleware)])
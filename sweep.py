@@ -0,0 +1,192 @@
+import inspect
+import math
+
+import numpy as np
+
+from config import QUANTITY_CALCULATORS
+
+# Default upper bound on grid points evaluated at once (per metric temporary)
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+
+class SweepResult:
+    """
+    Labelled N-dimensional result of a sweep, in the style of an xarray Dataset
+
+    Attributes:
+    - dims: names of the swept quantities, one per array axis
+    - coords: dimension name -> 1-D array of swept values
+    - data_vars: metric name -> array of shape (len(coords[d]) for d in dims)
+    - fixed: quantities that were held at a single value
+    """
+
+    def __init__(self, dims, coords, data_vars, fixed=None):
+        self.dims = tuple(dims)
+        self.coords = coords
+        self.data_vars = data_vars
+        self.fixed = fixed or {}
+
+    @property
+    def shape(self):
+        return tuple(len(self.coords[dim]) for dim in self.dims)
+
+    def __getitem__(self, name):
+        return self.data_vars[name]
+
+    def __iter__(self):
+        return iter(self.data_vars)
+
+    def __repr__(self):
+        dims = ", ".join(f"{dim}: {len(self.coords[dim])}" for dim in self.dims)
+        return f"<SweepResult ({dims}) with {len(self.data_vars)} metrics>"
+
+    def sel(self, **indexers):
+        """
+        Select the grid points nearest to the given quantity values
+
+        Parameters:
+        - indexers: dimension name -> value; the dimension is dropped from the result
+
+        Returns:
+        - A new SweepResult over the remaining dimensions
+        """
+        index = []
+        fixed = dict(self.fixed)
+        for dim in self.dims:
+            if dim in indexers:
+                position = int(np.abs(self.coords[dim] - indexers[dim]).argmin())
+                index.append(position)
+                fixed[dim] = self.coords[dim][position].item()
+            else:
+                index.append(slice(None))
+        unknown = set(indexers) - set(self.dims)
+        if unknown:
+            raise KeyError(f"Not swept dimensions: {sorted(unknown)}")
+
+        index = tuple(index)
+        dims = [dim for dim in self.dims if dim not in indexers]
+        return SweepResult(
+            dims,
+            {dim: self.coords[dim] for dim in dims},
+            {name: values[index] for name, values in self.data_vars.items()},
+            fixed
+        )
+
+    def to_xarray(self):
+        """Convert to an xarray.Dataset (requires the optional xarray package)"""
+        import xarray as xr
+
+        return xr.Dataset(
+            {name: (self.dims, values) for name, values in self.data_vars.items()},
+            coords=dict(self.coords),
+            attrs=dict(self.fixed)
+        )
+
+
+def _flatten(results, prefix=""):
+    """Flatten nested calculator output into "group/name" -> array"""
+    flat = {}
+    for name, values in results.items():
+        if isinstance(values, dict):
+            flat.update(_flatten(values, f"{prefix}{name}/"))
+        else:
+            flat[f"{prefix}{name}"] = values
+    return flat
+
+
+def _blocks(shape, chunk_size):
+    """
+    Split a grid into blocks of at most chunk_size points
+
+    Yields tuples of slices, one per axis. Leading axes are split first; when a
+    single slice along an axis is still too large the next axis is split too.
+    """
+    if not shape:
+        yield ()
+        return
+    inner = math.prod(shape[1:])
+    if inner <= chunk_size:
+        step = max(1, chunk_size // max(inner, 1))
+        for start in range(0, shape[0], step):
+            yield (slice(start, min(start + step, shape[0])),) + tuple(slice(None) for _ in shape[1:])
+    else:
+        for i in range(shape[0]):
+            for rest in _blocks(shape[1:], chunk_size):
+                yield (slice(i, i + 1),) + rest
+
+
+def iter_sweep_chunks(intervention, chunk_size=DEFAULT_CHUNK_SIZE, **quantities):
+    """
+    Evaluate a sweep block by block without holding the full grid in memory
+
+    Parameters: see sweep()
+
+    Yields:
+    - (block, results): block is a tuple of slices into the full grid and results
+      maps each metric name to the array for that block
+    """
+    calculator = QUANTITY_CALCULATORS[intervention]
+    names = list(inspect.signature(calculator).parameters)
+    unknown = set(quantities) - set(names)
+    if unknown:
+        raise KeyError(f"{intervention} has no quantities {sorted(unknown)}; expected some of {names}")
+
+    dims = [name for name in names if np.ndim(quantities.get(name, 0)) == 1]
+    axes = {dim: np.asarray(quantities[dim], dtype=float) for dim in dims}
+    shape = tuple(len(axes[dim]) for dim in dims)
+
+    for block in _blocks(shape, chunk_size):
+        # Each swept axis is reshaped to lie along its own dimension so the
+        # calculator broadcasts the block in a single pass
+        arguments = []
+        for name in names:
+            if name in axes:
+                axis = dims.index(name)
+                view = [1] * len(dims)
+                view[axis] = -1
+                arguments.append(axes[name][block[axis]].reshape(view))
+            else:
+                arguments.append(np.asarray(quantities.get(name, 0), dtype=float))
+        block_shape = tuple(len(range(*block[axis].indices(shape[axis]))) for axis in range(len(dims)))
+        results = _flatten(calculator(*arguments))
+        yield block, {name: np.broadcast_to(values, block_shape) for name, values in results.items()}
+
+
+def sweep(intervention, chunk_size=DEFAULT_CHUNK_SIZE, **quantities):
+    """
+    Evaluate every metric of an intervention over a dense grid of physical quantities
+
+    Parameters:
+    - intervention: key of config.INTERVENTIONS, e.g. "Pop-up Market"
+    - chunk_size: maximum number of grid points evaluated at once; bounds the
+      size of intermediate arrays for large grids
+    - quantities: quantity name -> 1-D array of values to sweep, or a scalar to
+      hold fixed. Quantities not given are held at 0. Names follow the
+      calculator arguments, e.g. market_count, plaza_count, art_lane_coverage,
+      art_display_spots, interactive_art_stations
+
+    Returns:
+    - SweepResult with one dimension per swept quantity
+
+    Example:
+    - sweep("Pop-up Market", market_count=np.arange(11), plaza_count=np.linspace(0, 5, 21))
+    """
+    calculator = QUANTITY_CALCULATORS[intervention]
+    names = list(inspect.signature(calculator).parameters)
+    for name, values in quantities.items():
+        if np.ndim(values) > 1 or (np.ndim(values) == 1 and len(values) == 0):
+            raise ValueError(f"{name} must be a scalar or a non-empty 1-D range of values")
+
+    dims = [name for name in names if np.ndim(quantities.get(name, 0)) == 1]
+    coords = {dim: np.asarray(quantities[dim], dtype=float) for dim in dims}
+    fixed = {name: float(quantities.get(name, 0)) for name in names if name not in coords}
+    shape = tuple(len(coords[dim]) for dim in dims)
+
+    data_vars = None
+    for block, results in iter_sweep_chunks(intervention, chunk_size, **quantities):
+        if data_vars is None:
+            data_vars = {name: np.empty(shape, dtype=float) for name, values in results.items()}
+        for name, values in results.items():
+            data_vars[name][block] = values
+
+    return SweepResult(dims, coords, data_vars, fixed)
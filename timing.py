@@ -0,0 +1,46 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+_LOGGER = logging.getLogger(__name__)
+
+# Time of the first import of this module, i.e. of the first script run in this process
+FIRST_IMPORT = time.perf_counter()
+
+# Process-wide timings in seconds, keeping the first (cold) measurement of each name
+TIMINGS = {}
+
+
+def process_uptime():
+    """
+    Seconds since this process started
+
+    Read from /proc on Linux, so a cold container start includes the interpreter and
+    Streamlit server startup; elsewhere it counts from the first import of this module.
+    """
+    try:
+        with open("/proc/self/stat") as stat_file:
+            # Field 22 is the start time in clock ticks after boot; the command name may contain spaces
+            start_ticks = int(stat_file.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.perf_counter() - FIRST_IMPORT
+
+
+def record(name, seconds):
+    """Record a timing; only the first measurement of a name is kept, every one is logged"""
+    TIMINGS.setdefault(name, seconds)
+    _LOGGER.info("%s: %.1f ms", name, seconds * 1000)
+
+
+@contextmanager
+def timed(name):
+    """Record the wall time of a block, e.g. a deferred import"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
@@ -0,0 +1,262 @@
+"""
+Headless batch runner for the intervention calculators
+
+Usage:
+    python -m udtool evaluate [FILE ...] [--intervention NAME] [--input-format csv|jsonl]
+                              [--output-format jsonl|csv] [--output FILE] [--workers N]
+
+Reads one scenario per CSV row or JSON line (from the files, or stdin when none or "-"
+is given) and writes one result per scenario, in input order. A scenario names its
+"intervention" (or --intervention gives it) and its level columns, e.g. seating_level;
+missing levels default to 0 like the sliders in app.py. Rows are streamed, so memory
+does not grow with the input.
+
+Only config.py and metrics.py are imported: no Streamlit, Plotly or pandas. NumPy and the
+formula compiler are loaded by the first scenario, so startup costs little beyond Python's.
+"""
+import argparse
+import csv
+import functools
+import inspect
+import io
+import json
+import sys
+from collections import deque
+from itertools import islice
+
+from config import INTERVENTIONS, SIMPLIFIED_CALCULATORS
+
+INPUT_FORMATS = ("csv", "jsonl")
+OUTPUT_FORMATS = ("jsonl", "csv")
+
+# Rows sent to a worker process at a time
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class ScenarioError(ValueError):
+    """A scenario row that cannot be evaluated"""
+
+
+@functools.lru_cache(maxsize=None)
+def level_names(intervention):
+    """Level argument names of an intervention's calculator"""
+    return tuple(inspect.signature(SIMPLIFIED_CALCULATORS[intervention]).parameters)
+
+
+@functools.lru_cache(maxsize=4096)
+def flat_result(intervention, levels):
+    """
+    Calculator result as a flat dictionary, memoized per combination of levels
+
+    Nested groups are flattened to "group.name" keys, e.g. "tradeoffs.Cost Efficiency".
+    """
+    result = SIMPLIFIED_CALCULATORS[intervention](*levels)
+    flat = {}
+    for key, value in result.items():
+        if hasattr(value, "items"):
+            flat.update((f"{key}.{name}", item) for name, item in value.items())
+        else:
+            flat[key] = value
+    return flat
+
+
+def evaluate_row(row, intervention=None):
+    """
+    Evaluate one scenario
+
+    Parameters:
+    - row: mapping with an "intervention" (unless given) and level values (ints or numeric strings)
+    - intervention: intervention used when the row does not name one
+
+    Returns:
+    - The row followed by the flattened result columns
+
+    Raises:
+    - ScenarioError for an unknown intervention or invalid level
+    """
+    name, levels = _scenario(row, intervention)
+    return {**row, "intervention": name, **flat_result(name, levels)}
+
+
+def _scenario(row, intervention):
+    """Validated (intervention, levels) of a row; evaluates (and memoizes) its result"""
+    name = row.get("intervention") or intervention
+    if not isinstance(name, str) or name not in SIMPLIFIED_CALCULATORS:
+        raise ScenarioError(f"unknown intervention {name!r}, expected one of {list(INTERVENTIONS)}")
+    levels = tuple(_level(level_name, row.get(level_name)) for level_name in level_names(name))
+    try:
+        flat_result(name, levels)
+    except (TypeError, ValueError) as error:
+        raise ScenarioError(str(error)) from None
+    return name, levels
+
+
+def _level(name, value):
+    """Level of a row value: a whole number, or a string of one; missing or empty is 0"""
+    if value is None or value == "":
+        return 0
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ScenarioError(f"{name}: {value!r} is not a whole number")
+    try:
+        number = float(value)
+    except ValueError:
+        raise ScenarioError(f"{name}: {value!r} is not a whole number") from None
+    if not number.is_integer():
+        raise ScenarioError(f"{name}: {value!r} is not a whole number")
+    return int(number)
+
+
+@functools.lru_cache(maxsize=4096)
+def _result_fields(intervention, levels):
+    """JSON object members of a result, without braces, memoized per combination of levels"""
+    return json.dumps(flat_result(intervention, levels))[1:-1]
+
+
+def _jsonl_line(row, intervention):
+    """One output line; the result part is serialized once per combination of levels"""
+    name, levels = _scenario(row, intervention)
+    if row.keys() & flat_result(name, levels).keys():
+        return json.dumps({**row, "intervention": name, **flat_result(name, levels)}) + "\n"
+    return json.dumps({**row, "intervention": name})[:-1] + ", " + _result_fields(name, levels) + "}\n"
+
+
+def _process_chunk(chunk, intervention, output_format, columns):
+    """
+    Parse, evaluate and format (line number, record) pairs; runs in a worker process when workers > 1
+
+    Records are raw JSON lines or CSV row dictionaries. Returns the output text of the chunk.
+    """
+    if output_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, columns, extrasaction="ignore")
+    lines = []
+    for line_number, record in chunk:
+        try:
+            if isinstance(record, str):
+                try:
+                    record = json.loads(record)
+                except json.JSONDecodeError as error:
+                    raise ScenarioError(f"invalid JSON ({error})") from None
+                if not isinstance(record, dict):
+                    raise ScenarioError(f"expected a JSON object, got {type(record).__name__}")
+            if output_format == "csv":
+                writer.writerow(evaluate_row(record, intervention))
+            else:
+                lines.append(_jsonl_line(record, intervention))
+        except ScenarioError as error:
+            raise ScenarioError(f"line {line_number}: {error}") from None
+    return buffer.getvalue() if output_format == "csv" else "".join(lines)
+
+
+def read_records(paths, input_format=None):
+    """
+    Stream (line number, record) pairs from CSV or JSONL files, or stdin
+
+    CSV records are row dictionaries; JSONL records are the raw lines, parsed where they are
+    evaluated. The format is taken from input_format, else from each file's extension
+    (.csv, otherwise JSONL); stdin defaults to JSONL.
+    """
+    for path in paths or ["-"]:
+        file_format = input_format or _format_of(path)
+        stream = sys.stdin if path == "-" else open(path, newline="")
+        try:
+            if file_format == "csv":
+                # Header is line 1
+                yield from enumerate(csv.DictReader(stream), start=2)
+            else:
+                for line_number, line in enumerate(stream, start=1):
+                    if line.strip():
+                        yield line_number, line
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+
+def _format_of(path):
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def run(records, output, intervention=None, output_format="jsonl", columns=(), workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Evaluate a stream of (line number, record) pairs and write the results in input order
+
+    Records are processed in chunks of chunk_size. With workers > 1 the chunks are parsed,
+    evaluated and formatted in a process pool with at most workers * 2 chunks in flight,
+    so memory stays bounded for any input size.
+    """
+    records = iter(records)
+    chunks = iter(lambda: list(islice(records, chunk_size)), [])
+    if output_format == "csv":
+        csv.DictWriter(output, columns).writeheader()
+
+    if workers <= 1:
+        for chunk in chunks:
+            output.write(_process_chunk(chunk, intervention, output_format, columns))
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_process_chunk, chunk, intervention, output_format, columns))
+            if len(pending) >= workers * 2:
+                output.write(pending.popleft().result())
+        while pending:
+            output.write(pending.popleft().result())
+
+
+def result_columns(interventions):
+    """Flattened result column names of the given interventions, in first-seen order"""
+    columns = {}
+    for name in interventions:
+        columns.update(dict.fromkeys(flat_result(name, (0,) * len(level_names(name)))))
+    return list(columns)
+
+
+def output_columns(paths, input_format, interventions):
+    """
+    CSV output header: the columns of the first CSV input, then the result columns of every
+    given intervention (cells of other interventions are left empty)
+    """
+    input_columns = []
+    for path in paths:
+        if path != "-" and (input_format or _format_of(path)) == "csv":
+            with open(path, newline="") as stream:
+                input_columns = next(csv.reader(stream), [])
+            break
+    return list(dict.fromkeys(["intervention", *input_columns, *result_columns(interventions)]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="udtool", description="Headless batch runner for the intervention calculators")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    evaluate = commands.add_parser("evaluate", help="evaluate scenarios from CSV/JSONL files or stdin")
+    evaluate.add_argument("files", nargs="*", help='input files; "-" or none reads stdin')
+    evaluate.add_argument("--intervention", choices=list(INTERVENTIONS),
+                          help='intervention for rows without an "intervention" column')
+    evaluate.add_argument("--input-format", choices=INPUT_FORMATS, help="input format (default: from the file extension, JSONL for stdin)")
+    evaluate.add_argument("--output-format", choices=OUTPUT_FORMATS, default="jsonl")
+    evaluate.add_argument("--output", help="output file (default: stdout)")
+    evaluate.add_argument("--workers", type=int, default=1, help="worker processes (default 1: evaluate in this process)")
+    evaluate.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per worker task")
+    args = parser.parse_args(argv)
+
+    interventions = [args.intervention] if args.intervention else list(INTERVENTIONS)
+    columns = output_columns(args.files, args.input_format, interventions) if args.output_format == "csv" else ()
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        run(read_records(args.files, args.input_format), output, args.intervention, args.output_format,
+            columns, args.workers, args.chunk_size)
+    except ScenarioError as error:
+        print(f"udtool: {error}", file=sys.stderr)
+        return 2
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+import numpy as np
+
+from metrics import compiled_formulas
+
+# Distributions that can be given for a constant, as (name, *parameters)
+# - ("normal", mean, standard deviation)
+# - ("lognormal", mean of log, sigma of log)
+# - ("uniform", low, high)
+# - ("triangular", low, mode, high)
+# A plain number holds the constant fixed at that value.
+DISTRIBUTIONS = ("normal", "lognormal", "uniform", "triangular")
+
+DEFAULT_PERCENTILES = (5, 50, 95)
+
+
+class StreamingQuantiles:
+    """
+    Fixed-memory quantile accumulator for a stream of samples
+
+    Samples are counted in n_bins equal-width bins. When a batch falls outside the
+    current range the bin width is doubled (merging neighbouring bins pairwise)
+    until it fits, so memory stays constant however many samples arrive. Quantiles
+    are interpolated within a bin, so the error is at most one bin width.
+    """
+
+    def __init__(self, n_bins=4096):
+        if n_bins < 2 or n_bins % 2:
+            raise ValueError("n_bins must be an even number >= 2")
+        self.n_bins = n_bins
+        self.counts = np.zeros(n_bins, dtype=np.int64)
+        self.low = None
+        self.width = None
+        self.count = 0
+        self.total = 0.0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+
+    @property
+    def high(self):
+        return self.low + self.width * self.n_bins
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else np.nan
+
+    def update(self, values):
+        """Add a batch of samples (NaNs are ignored)"""
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if not values.size:
+            return
+        batch_min, batch_max = values.min(), values.max()
+        self._cover(batch_min, batch_max)
+
+        bins = ((values - self.low) / self.width).astype(np.intp)
+        np.clip(bins, 0, self.n_bins - 1, out=bins)
+        self.counts += np.bincount(bins, minlength=self.n_bins)
+        self.count += values.size
+        self.total += values.sum()
+        self.minimum = min(self.minimum, batch_min)
+        self.maximum = max(self.maximum, batch_max)
+
+    def merge(self, other):
+        """Combine another accumulator into this one (e.g. from another worker)"""
+        if not other.count:
+            return
+        self._cover(other.minimum, other.maximum)
+
+        # Re-bin the other accumulator's counts at its bin centres
+        occupied = np.nonzero(other.counts)[0]
+        centres = np.clip(other.low + (occupied + 0.5) * other.width, other.minimum, other.maximum)
+        bins = np.clip(((centres - self.low) / self.width).astype(np.intp), 0, self.n_bins - 1)
+        np.add.at(self.counts, bins, other.counts[occupied])
+        self.count += other.count
+        self.total += other.total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    def _cover(self, low, high):
+        """Make sure [low, high] lies inside the binned range"""
+        if self.low is None:
+            span = high - low
+            self.low = low
+            self.width = span / (self.n_bins - 1) if span > 0 else max(abs(low), 1.0) * 1e-9
+        while low < self.low:
+            self._grow(downward=True)
+        while high >= self.high:
+            self._grow(downward=False)
+
+    def _grow(self, downward):
+        """Double the bin width, extending the range below or above"""
+        merged = self.counts.reshape(-1, 2).sum(axis=1)
+        self.counts = np.zeros(self.n_bins, dtype=np.int64)
+        if downward:
+            self.counts[self.n_bins // 2:] = merged
+            self.low -= self.width * self.n_bins
+        else:
+            self.counts[:self.n_bins // 2] = merged
+        self.width *= 2
+
+    def quantile(self, q):
+        """Estimated quantile(s) for q in [0, 1]"""
+        q = np.asarray(q, dtype=float)
+        if not self.count:
+            return np.full(q.shape, np.nan)[()]
+        cumulative = np.cumsum(self.counts)
+        target = q * self.count
+        index = np.searchsorted(cumulative, target, side="left").clip(0, self.n_bins - 1)
+        before = np.where(index > 0, cumulative[index - 1], 0)
+        inside = self.counts[index]
+        fraction = np.where(inside > 0, (target - before) / np.maximum(inside, 1), 0.0)
+        estimate = self.low + (index + fraction) * self.width
+        return np.clip(estimate, self.minimum, self.maximum)[()]
+
+
+def default_distributions(intervention, spread=0.2):
+    """
+    Symmetric triangular distributions of +/- spread around every constant of an intervention
+
+    Returns:
+    - Dictionary of constant name -> ("triangular", low, mode, high); constants equal to 0 are left out
+    """
+    return {
+        name: ("triangular", value * (1 - spread), value, value * (1 + spread))
+        for name, value in compiled_formulas(intervention).constants.items()
+        if value != 0
+    }
+
+
+def _sample(rng, name, distribution, size):
+    if np.isscalar(distribution):
+        return distribution
+    kind, *parameters = distribution
+    if kind not in DISTRIBUTIONS:
+        raise ValueError(f"{name}: unknown distribution {kind!r}, expected one of {DISTRIBUTIONS}")
+    return getattr(rng, kind)(*parameters, size=size)
+
+
+def _flatten(outputs, path=()):
+    """Flatten a nested output dictionary into (group, ..., name) -> value"""
+    flat = {}
+    for name, values in outputs.items():
+        if isinstance(values, dict):
+            flat.update(_flatten(values, path + (name,)))
+        else:
+            flat[path + (name,)] = values
+    return flat
+
+
+def _unflatten(flat):
+    nested = {}
+    for path, value in flat.items():
+        *groups, name = path
+        target = nested
+        for group in groups:
+            target = target.setdefault(group, {})
+        target[name] = value
+    return nested
+
+
+def simulate(intervention, params_values=None, distributions=None, n_samples=100_000, seed=None,
+             percentiles=DEFAULT_PERCENTILES, batch_size=50_000, n_bins=4096):
+    """
+    Monte Carlo estimate of every metric and trade-off under uncertain constants
+
+    Parameters:
+    - intervention: key of config.INTERVENTIONS
+    - params_values: dict of level name -> level (like the sliders in app.py); missing levels default to 0
+    - distributions: constant name -> distribution (see DISTRIBUTIONS); defaults to
+      default_distributions(intervention). Constants not listed keep their declared value.
+    - n_samples: total number of samples
+    - seed: seed (or numpy Generator) for reproducible results
+    - percentiles: percentiles to report, 0-100
+    - batch_size: samples evaluated at once; memory does not grow with n_samples
+    - n_bins: resolution of the streaming quantile accumulators
+
+    Returns:
+    - Dictionary with the same structure as the calculator output, where each value is
+      a dictionary {"P5": ..., "P50": ..., "P95": ..., "mean": ...}
+    """
+    formulas = compiled_formulas(intervention)
+    params_values = params_values or {}
+    if distributions is None:
+        distributions = default_distributions(intervention)
+    unknown = set(distributions) - set(formulas.constants)
+    if unknown:
+        raise KeyError(f"{intervention} has no constants {sorted(unknown)}")
+
+    quantities = formulas.quantities_at(*(params_values.get(name, 0) for name in formulas.level_names))
+    rng = np.random.default_rng(seed)
+    accumulators = None
+
+    for start in range(0, n_samples, batch_size):
+        size = min(batch_size, n_samples - start)
+        constants = {name: _sample(rng, name, distribution, size) for name, distribution in distributions.items()}
+        outputs = _flatten(formulas.evaluate_parametric(*quantities, **constants))
+        if accumulators is None:
+            accumulators = {name: StreamingQuantiles(n_bins) for name in outputs}
+        for name, values in outputs.items():
+            accumulators[name].update(np.broadcast_to(values, (size,)))
+
+    summary = {}
+    for name, accumulator in (accumulators or {}).items():
+        values = accumulator.quantile(np.asarray(percentiles) / 100)
+        stats = {f"P{percentile:g}": float(value) for percentile, value in zip(percentiles, np.atleast_1d(values))}
+        stats["mean"] = float(accumulator.mean)
+        summary[name] = stats
+    return _unflatten(summary)